@@ -0,0 +1,34 @@
+"""封面处理微基准：对比旧版逐列粘贴实现与 CoverProcessor
+
+用法：python -m benchmarks.bench_cover [--rounds 20]
+"""
+import argparse
+import time
+from src.utils.cover_processor import CoverProcessor
+from benchmarks.cover_reference import legacy_square_cover, mean_difference, sample_cover
+
+
+def bench(func, data: bytes, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(data)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    processor = CoverProcessor()
+    for width, height in ((1920, 1080), (1080, 1920), (1146, 717), (800, 800)):
+        data = sample_cover(width, height)
+        legacy = bench(legacy_square_cover, data, args.rounds)
+        current = bench(processor.process, data, args.rounds)
+        diff = mean_difference(legacy_square_cover(data), processor.process(data))
+        print(f"{width}x{height}: legacy {legacy * 1000:.1f} ms, "
+              f"current {current * 1000:.1f} ms ({legacy / current:.1f}x), mean diff {diff:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""下载目录核对基准：在临时目录中生成大型音频库，测量首次、无变化和少量变化时的核对耗时
+
+用法：python -m benchmarks.bench_library [--dirs 1000] [--files-per-dir 100]
+
+历史记录中的路径使用 Windows 分隔符和小写目录名（与旧版 history.json 一致），
+首次核对会把它们全部改写为本机路径；之后的核对应跳过未变化的目录。
+"""
+import argparse
+import os
+import tempfile
+import time
+from src.utils.history_store import INSERT_SQL, HistoryStore, _values
+from src.utils.library_reconciler import LibraryReconciler
+
+
+def build_library(root: str, history: HistoryStore, dirs: int, files_per_dir: int):
+    records = []
+    for d in range(dirs):
+        directory = os.path.join(root, f"book{d:05d}")
+        os.makedirs(directory)
+        for i in range(files_per_dir):
+            with open(os.path.join(directory, f"{i:03d}.mp3"), 'wb') as f:
+                f.write(b'\0' * 16)
+            records.append({'bvid': f"BV{d:05d}", 'p': i + 1, 'file_path': f"audiobooks\\book{d:05d}\\{i:03d}.mp3",
+                            'download_time': '2025-01-01T00:00:00', 'file_size': 16})
+    with history.transaction() as conn:
+        conn.executemany(INSERT_SQL, [_values(record) for record in records])
+    # 刚创建的目录不会缓存 mtime，把时间调到过去以模拟已存在的音频库
+    past = time.time() - 3600
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (past, past))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dirs', type=int, default=1000)
+    parser.add_argument('--files-per-dir', type=int, default=100)
+    parser.add_argument('--changed-dirs', type=int, default=10, help='增量核对前新增文件的目录数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-library-') as tmp:
+        root = os.path.join(tmp, 'Audiobooks')
+        history = HistoryStore(os.path.join(tmp, 'history.db'))
+        build_library(root, history, args.dirs, args.files_per_dir)
+        reconciler = LibraryReconciler(history, root, os.path.join(tmp, 'library.db'))
+
+        def run(name, **kwargs):
+            result = reconciler.reconcile(**kwargs)
+            print(f"{name}: {result['elapsed']:.2f} s，列出 {result['dirs_scanned']}/{result['dirs']} 个目录，"
+                  f"{result['files']} 个文件，修正 {result['relinked']} 条，删除 {result['removed']} 条")
+
+        run('首次核对')
+        run('无变化')
+        for d in range(args.changed_dirs):
+            with open(os.path.join(root, f"book{d:05d}", 'new.mp3'), 'wb') as f:
+                f.write(b'\0' * 16)
+            os.remove(os.path.join(root, f"book{d:05d}", '000.mp3'))
+        run(f"{args.changed_dirs} 个目录有变化")
+        run('完整重新扫描', full=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""端到端下载流程基准：本地模拟源 + 模拟解析器，不访问网络，结果可在不同提交之间对比
+
+用法：python -m benchmarks.bench_pipeline [--scenario long playlist resume rerun] [--compare 旧结果.json]
+
+场景：
+  long      单个 5 小时分 P（走分段下载）
+  playlist  300 个分 P 的合集
+  resume    5 小时分 P 下载到一半时进程崩溃，测量重启后的续传
+  rerun     合集已全部下载完成后再次提交
+
+每个场景在独立的临时目录和子进程中运行，准备步骤（如先下载一遍、模拟崩溃）不计入结果。
+子进程记录墙钟时间、CPU 时间（本进程和 FFmpeg 等子进程）、峰值 RSS 和写盘字节数，
+同时统计模拟源收到的请求数和发送的字节数。结果写入 benchmarks/results/<提交>.json。
+
+环境中不一定有 FFmpeg，因此输出格式固定为 m4a：源音频直接作为成品，只写入标签和封面。
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.fake_origin import FakeBilibiliIE, FakeOrigin, FakeVideo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+CRASH_EXIT = 86
+
+LONG_BVID = 'BV1Long5hour'
+PLAYLIST_BVID = 'BV1Playlist300'
+
+# 场景：被测视频及测量前的准备步骤（crash_at 为模拟崩溃时的整体进度，None 表示完整下载）
+SCENARIOS = {
+    'long': {'bvid': LONG_BVID, 'setup': []},
+    'playlist': {'bvid': PLAYLIST_BVID, 'setup': []},
+    'resume': {'bvid': LONG_BVID, 'setup': [40]},
+    'rerun': {'bvid': PLAYLIST_BVID, 'setup': [None]},
+}
+
+# 对比时展示的指标，数值越小越好
+METRICS = ('wall', 'cpu', 'children_cpu', 'peak_rss_mb', 'write_mb', 'origin_requests', 'origin_mb')
+
+
+def io_counters() -> dict:
+    """本进程的 I/O 计数（Linux），不可用时返回空字典"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f.read().splitlines())}
+    except OSError:
+        return {}
+
+
+def usage_snapshot() -> dict:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io = io_counters()
+    return {
+        'wall': time.perf_counter(),
+        'cpu': own.ru_utime + own.ru_stime,
+        'children_cpu': children.ru_utime + children.ru_stime,
+        # write_bytes 为实际写入存储层的字节数；不可用时退化为 write 系统调用的字节数
+        'write_bytes': io.get('write_bytes', io.get('wchar', 0)),
+    }
+
+
+def max_rss_mb(who: int) -> float:
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_worker(args):
+    """子进程：在工作目录中执行一次下载，把资源消耗写入 args.result"""
+    os.chdir(args.workdir)
+    import logging
+    from src.utils.downloader import BiliDownloader
+    logging.getLogger().setLevel(args.log_level)
+
+    before = usage_snapshot()
+    downloader = BiliDownloader()
+    downloader.base_url = f"{args.origin}/video/"
+    downloader.extractors = [FakeBilibiliIE]
+    events = {}
+    for event in downloader.download(args.bvid, 'bench', workers=args.workers):
+        status = event.get('status')
+        events[status] = events.get(status, 0) + 1
+        if args.crash_at is not None and event.get('progress', 0) >= args.crash_at:
+            # 模拟进程崩溃：不执行任何清理
+            os._exit(CRASH_EXIT)
+    after = usage_snapshot()
+
+    result = {key: after[key] - before[key] for key in ('wall', 'cpu', 'children_cpu')}
+    result.update({
+        'peak_rss_mb': round(max_rss_mb(resource.RUSAGE_SELF), 1),
+        'children_peak_rss_mb': round(max_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        'write_mb': round((after['write_bytes'] - before['write_bytes']) / 1024 / 1024, 2),
+        'events': events,
+    })
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def spawn_worker(args, origin: FakeOrigin, bvid: str, workdir: str, crash_at=None) -> dict:
+    """启动一次下载子进程；crash_at 为 None 时返回其资源消耗"""
+    result_path = os.path.join(workdir, 'result.json')
+    cmd = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--worker',
+           '--origin', origin.url, '--bvid', bvid, '--workdir', workdir,
+           '--workers', str(args.workers), '--result', result_path, '--log-level', args.log_level]
+    if crash_at is not None:
+        cmd += ['--crash-at', str(crash_at)]
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])),
+               DOWNLOAD_DIR=os.path.join(workdir, 'Audiobooks'),
+               AUDIO_FORMAT='m4a',
+               BILIBILI_API_BASE=origin.url,
+               GOVERNOR_REQUEST_RATE=str(args.request_rate))
+    env.pop('LEASE_DB', None)
+    if crash_at is not None:
+        # 不节流进度事件，崩溃点尽量贴近指定进度
+        env['PROGRESS_RATE'] = '0'
+    output = None if args.verbose else subprocess.DEVNULL
+    code = subprocess.run(cmd, env=env, stdout=output, stderr=output).returncode
+    if crash_at is not None:
+        if code != CRASH_EXIT:
+            raise RuntimeError(f"模拟崩溃的子进程未按预期退出（退出码 {code}）")
+        return {}
+    if code != 0:
+        raise RuntimeError(f"基准子进程失败（退出码 {code}），使用 --verbose 查看输出")
+    with open(result_path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    os.remove(result_path)
+    return result
+
+
+def run_scenario(args, origin: FakeOrigin, name: str, root: str) -> dict:
+    """运行一个场景 args.repeat 次，各指标取中位数"""
+    scenario = SCENARIOS[name]
+    runs = []
+    for _ in range(args.repeat):
+        workdir = tempfile.mkdtemp(prefix=f"{name}-", dir=root)
+        for crash_at in scenario['setup']:
+            spawn_worker(args, origin, scenario['bvid'], workdir, crash_at)
+        served = origin.stats()
+        result = spawn_worker(args, origin, scenario['bvid'], workdir)
+        after = origin.stats()
+        result['origin_requests'] = sum(counter['requests'] - served.get(route, {}).get('requests', 0)
+                                        for route, counter in after.items())
+        result['origin_mb'] = round(sum(counter['bytes'] - served.get(route, {}).get('bytes', 0)
+                                        for route, counter in after.items()) / 1024 / 1024, 2)
+        runs.append(result)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 3)
+               for key in runs[0] if isinstance(runs[0][key], (int, float))}
+    summary['events'] = runs[-1]['events']
+    summary['runs'] = len(runs)
+    return summary
+
+
+def git_commit() -> str:
+    """当前提交的短哈希，工作区有未提交修改时加 -dirty 后缀"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_comparison(current: dict, baseline: dict):
+    print(f"\n与 {baseline.get('commit')} 对比（比值 < 1 表示更好）：")
+    for name, metrics in current['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        ratios = [f"{key} {metrics[key] / old[key]:.2f}x" for key in METRICS
+                  if key in metrics and old.get(key)]
+        print(f"{name}: {', '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--long-duration', type=int, default=5 * 3600, help='长音频时长（秒）')
+    parser.add_argument('--parts', type=int, default=300, help='合集分 P 数')
+    parser.add_argument('--part-duration', type=int, default=30, help='合集每个分 P 的时长（秒）')
+    parser.add_argument('--bitrate', type=int, default=128, help='音频码率（kbps）')
+    parser.add_argument('--workers', type=int, default=4, help='同时处理的分 P 数')
+    parser.add_argument('--request-rate', type=float, default=0, help='全局请求速率限制，0 为不限制')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='结果文件，默认 benchmarks/results/<提交>.json')
+    parser.add_argument('--compare', help='与之对比的历史结果文件')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--verbose', action='store_true', help='显示子进程输出')
+    # 以下参数供子进程使用
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--origin', help=argparse.SUPPRESS)
+    parser.add_argument('--bvid', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--crash-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    videos = [FakeVideo(LONG_BVID, '长音频', parts=1, duration=args.long_duration, bitrate=args.bitrate * 1000),
+              FakeVideo(PLAYLIST_BVID, '合集', parts=args.parts, duration=args.part_duration,
+                        bitrate=args.bitrate * 1000)]
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: getattr(args, key) for key in
+                   ('long_duration', 'parts', 'part_duration', 'bitrate', 'workers', 'request_rate', 'repeat')},
+        'scenarios': {},
+    }
+    with FakeOrigin(videos) as origin, tempfile.TemporaryDirectory(prefix='bench-pipeline-') as root:
+        for name in args.scenario:
+            print(f"运行场景 {name} ...", flush=True)
+            metrics = run_scenario(args, origin, name, root)
+            report['scenarios'][name] = metrics
+            print(f"{name}: wall {metrics['wall']:.2f} s, cpu {metrics['cpu']:.2f} s "
+                  f"(children {metrics['children_cpu']:.2f} s), peak RSS {metrics['peak_rss_mb']:.1f} MB, "
+                  f"written {metrics['write_mb']:.1f} MB, origin {metrics['origin_requests']} requests / "
+                  f"{metrics['origin_mb']:.1f} MB, events {metrics['events']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
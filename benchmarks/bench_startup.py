@@ -0,0 +1,129 @@
+"""服务启动基准：测量从进程启动到能响应首页和健康检查的耗时，以及预热耗时
+
+用法：python -m benchmarks.bench_startup [--repeat 5] [--history-records 20000]
+
+每轮在全新的子进程和临时工作目录中导入 src/app.py，用 Flask 测试客户端依次请求
+/healthz、/ 和 /warmup。记录导入耗时、首次请求耗时、就绪前是否已加载 yt-dlp 等较重的库，
+以及预热（加载下载器、打开历史记录、创建 yt-dlp 解析器）的各步骤耗时，结果取中位数。
+--history-records 会预先写入一份旧版 history.json，用于观察历史记录导入不再阻塞启动。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 服务就绪前不应导入的库
+HEAVY_MODULES = ('yt_dlp', 'PIL', 'mutagen', 'requests')
+
+
+def seed_history(workdir: str, records: int):
+    """写入旧版 history.json，模拟长期使用后的下载历史"""
+    history_dir = os.path.join(workdir, 'download_history')
+    os.makedirs(history_dir, exist_ok=True)
+    entries = {}
+    for i in range(records):
+        bvid = f"BV1{i:09d}"
+        entries[f"{bvid}_1"] = {'bvid': bvid, 'p': 1, 'file_path': os.path.join(workdir, f"{bvid}.mp3"),
+                                'download_time': '2025-01-01T00:00:00', 'file_size': 1024}
+    with open(os.path.join(history_dir, 'history.json'), 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+
+
+def run_worker(args):
+    """子进程：导入应用并依次请求各接口，把耗时写入 args.result"""
+    start = time.perf_counter()
+    os.chdir(args.workdir)
+    import logging
+    logging.disable(logging.INFO)
+    import app
+    result = {'import': time.perf_counter() - start}
+
+    client = app.app.test_client()
+    for name, path in (('first_healthz', '/healthz'), ('first_index', '/')):
+        begin = time.perf_counter()
+        response = client.get(path)
+        result[name] = time.perf_counter() - begin
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} 返回 HTTP {response.status_code}")
+    result['ready'] = time.perf_counter() - start
+    result['loaded_before_ready'] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    begin = time.perf_counter()
+    response = client.post('/warmup')
+    result['warmup'] = time.perf_counter() - begin
+    if response.status_code != 200:
+        raise RuntimeError(f"/warmup 返回 HTTP {response.status_code}：{response.get_data(as_text=True)}")
+    result['warmup_steps'] = response.get_json()['timings']
+
+    begin = time.perf_counter()
+    client.get('/healthz')
+    result['warm_healthz'] = time.perf_counter() - begin
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def spawn_worker(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as workdir:
+        if args.history_records:
+            seed_history(workdir, args.history_records)
+        result_path = os.path.join(workdir, 'result.json')
+        cmd = [sys.executable, '-m', 'benchmarks.bench_startup', '--worker',
+               '--workdir', workdir, '--result', result_path]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [ROOT, os.path.join(ROOT, 'src'), os.environ.get('PYTHONPATH')])))
+        env.pop('WARMUP_ON_START', None)
+        env.pop('LEASE_DB', None)
+        output = None if args.verbose else subprocess.DEVNULL
+        begin = time.perf_counter()
+        code = subprocess.run(cmd, env=env, cwd=ROOT, stdout=output, stderr=output).returncode
+        process = time.perf_counter() - begin
+        if code != 0:
+            raise RuntimeError(f"基准子进程失败（退出码 {code}），使用 --verbose 查看输出")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    result['process'] = process
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--history-records', type=int, default=0, help='预先写入的旧版历史记录条数')
+    parser.add_argument('--output', help='结果文件（JSON）')
+    parser.add_argument('--verbose', action='store_true', help='显示子进程输出')
+    # 以下参数供子进程使用
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    runs = [spawn_worker(args) for _ in range(args.repeat)]
+    summary = {key: round(statistics.median(run[key] for run in runs), 3)
+               for key in runs[0] if isinstance(runs[0][key], (int, float))}
+    summary['warmup_steps'] = {key: round(statistics.median(run['warmup_steps'][key] for run in runs), 3)
+                               for key in runs[0]['warmup_steps']}
+    summary['loaded_before_ready'] = runs[-1]['loaded_before_ready']
+    summary['runs'] = len(runs)
+
+    print(f"导入 app {summary['import']:.3f} s，首次 /healthz {summary['first_healthz'] * 1000:.1f} ms，"
+          f"首次 / {summary['first_index'] * 1000:.1f} ms，导入后就绪 {summary['ready']:.3f} s，"
+          f"从启动进程算起约 {summary['process'] - summary['warmup'] - summary['warm_healthz']:.3f} s")
+    print(f"就绪前已加载：{', '.join(summary['loaded_before_ready']) or '无'}")
+    print(f"预热 {summary['warmup']:.3f} s：{summary['warmup_steps']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""转码开销基准：对比 MP3 重新编码与 M4A 直接封装的 CPU 时间
+
+用法：python -m benchmarks.bench_transcode [--seconds 600] [--ffmpeg ffmpeg]
+
+需要安装 FFmpeg；测试音频由 lavfi 生成，结果换算为每小时音频的 CPU 秒数。
+"""
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from src.utils.media_processor import MediaProcessor, TranscodeScheduler
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def make_source(ffmpeg: str, path: str, seconds: int):
+    """生成与 B 站音频流相同编码（AAC 128k）的测试文件"""
+    subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:a', 'aac', '-b:a', '128k', '-y', path], check=True)
+
+
+def measure(media: MediaProcessor, source: str, output: str, output_format: str, copy: bool) -> tuple:
+    cpu = children_cpu()
+    start = time.perf_counter()
+    media.transcode(source, output, output_format, bitrate=None if copy else '192k', copy=copy).result()
+    return time.perf_counter() - start, children_cpu() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=int, default=600)
+    parser.add_argument('--ffmpeg', default=os.getenv('FFMPEG_PATH', 'ffmpeg'))
+    args = parser.parse_args()
+
+    media = MediaProcessor(args.ffmpeg, TranscodeScheduler(max_workers=1))
+    scale = 3600 / args.seconds
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.m4a')
+        make_source(args.ffmpeg, source, args.seconds)
+        for name, output_format, copy in (('mp3 编码', 'mp3', False), ('m4a 封装', 'm4a', True)):
+            wall, cpu = measure(media, source, os.path.join(tmp, f'out.{output_format}'), output_format, copy)
+            print(f"{name:8s} 耗时 {wall:6.2f}s  CPU {cpu:6.2f}s  每小时音频 CPU {cpu * scale:7.2f}s")
+    media.scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    main()
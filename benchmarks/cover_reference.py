@@ -0,0 +1,56 @@
+"""封面处理的参考实现（旧版算法）与测试封面生成，供基准和测试共用"""
+from io import BytesIO
+from PIL import Image, ImageChops, ImageFilter, ImageOps, ImageStat
+
+
+def legacy_square_cover(data: bytes) -> bytes:
+    """旧版 BiliDownloader.get_cover_image 中的处理流程（参考实现）"""
+    img = Image.open(BytesIO(data))
+    max_side = max(img.width, img.height)
+    square_img = Image.new('RGB', (max_side, max_side), (255, 255, 255))
+    x_offset = (max_side - img.width) // 2
+    y_offset = (max_side - img.height) // 2
+    square_img.paste(img, (x_offset, y_offset))
+
+    if img.width < max_side:
+        left_edge = img.crop((0, 0, 1, img.height))
+        right_edge = img.crop((img.width-1, 0, img.width, img.height))
+        for x in range(0, x_offset):
+            square_img.paste(left_edge, (x, y_offset))
+        for x in range(x_offset + img.width, max_side):
+            square_img.paste(right_edge, (x, y_offset))
+
+    if img.height < max_side:
+        top_edge = img.crop((0, 0, img.width, 1))
+        bottom_edge = img.crop((0, img.height-1, img.width, img.height))
+        for y in range(0, y_offset):
+            square_img.paste(top_edge, (x_offset, y))
+        for y in range(y_offset + img.height, max_side):
+            square_img.paste(bottom_edge, (x_offset, y))
+
+    mask = Image.new('L', square_img.size, 0)
+    mask.paste(255, (x_offset, y_offset, x_offset + img.width, y_offset + img.height))
+    mask = ImageOps.invert(mask)
+    blurred = square_img.filter(ImageFilter.GaussianBlur(radius=10))
+    square_img.paste(blurred, mask=mask)
+
+    img = square_img.resize((400, 400), Image.Resampling.LANCZOS)
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=95)
+    return output.getvalue()
+
+
+def sample_cover(width: int, height: int) -> bytes:
+    """生成带渐变和噪声的测试封面"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 8)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def mean_difference(a: bytes, b: bytes) -> float:
+    """两张图片的平均逐像素差（0-255）"""
+    diff = ImageChops.difference(Image.open(BytesIO(a)).convert('RGB'), Image.open(BytesIO(b)).convert('RGB'))
+    return sum(ImageStat.Stat(diff).mean) / 3
@@ -0,0 +1,256 @@
+"""本地模拟的 B 站源站和对应的 yt-dlp 解析器，供基准测试在不联网的情况下跑完整下载流程
+
+模拟源提供：
+  /x/web-interface/view?bvid=  分 P 列表接口（与 PlaylistResolver 读取的字段一致）
+  /video/<bvid>?p=<n>          视频网页，信息内嵌在 window.__INITIAL_STATE__ 中
+  /audio/<bvid>/<n>.m4a        音频文件，支持 Range，内容按偏移即时生成，不占内存
+  /cover/<bvid>.jpg            封面图片
+
+音频文件是最小的合法 M4A（ftyp + mdat + moov），mutagen 可以直接写入标签和封面。
+
+用法：python -m benchmarks.fake_origin [--port 8900]（手动调试时单独启动）
+"""
+import argparse
+import json
+import random
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import ExtractorError
+from benchmarks.cover_reference import sample_cover
+
+BLOCK_SIZE = 64 * 1024
+CHUNK_SIZE = 256 * 1024
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+class FakeVideo:
+    """模拟的视频：parts 个分 P，每个分 P 时长 duration 秒，音频码率 bitrate（bit/s）"""
+
+    def __init__(self, bvid: str, title: str, parts: int = 1, duration: int = 60, bitrate: int = 128000):
+        self.bvid = bvid
+        self.title = title
+        self.parts = parts
+        self.duration = duration
+        self.bitrate = bitrate
+        self.pubdate = 1700000000
+        self.block = random.Random(bvid).randbytes(BLOCK_SIZE)
+        self.payload_size = duration * bitrate // 8
+        self.header = _box(b'ftyp', b'M4A \x00\x00\x02\x00M4A mp42isom') + \
+            struct.pack('>I4s', 8 + self.payload_size, b'mdat')
+        mvhd = _box(b'mvhd', b'\x00' * 4 + struct.pack('>IIII', 0, 0, 1000, duration * 1000) +
+                    b'\x00\x01\x00\x00\x01\x00' + b'\x00' * 70 + struct.pack('>I', 2))
+        self.trailer = _box(b'moov', mvhd)
+        self.size = len(self.header) + self.payload_size + len(self.trailer)
+
+    def read(self, start: int, end: int) -> bytes:
+        """音频文件 [start, end) 区间的内容"""
+        out = bytearray()
+        header_end = len(self.header)
+        payload_end = header_end + self.payload_size
+        pos = start
+        while pos < end:
+            if pos < header_end:
+                chunk = self.header[pos:min(end, header_end)]
+            elif pos < payload_end:
+                offset = (pos - header_end) % BLOCK_SIZE
+                chunk = self.block[offset:offset + min(end, payload_end) - pos]
+            else:
+                chunk = self.trailer[pos - payload_end:end - payload_end]
+            out += chunk
+            pos += len(chunk)
+        return bytes(out)
+
+    def view(self, base_url: str) -> dict:
+        return {
+            'bvid': self.bvid,
+            'title': self.title,
+            'pic': f"{base_url}/cover/{self.bvid}.jpg",
+            'owner': {'name': 'bench-uploader'},
+            'pubdate': self.pubdate,
+            'duration': self.duration * self.parts,
+            'pages': [{'page': p, 'cid': 1000 + p, 'part': f"第{p}集", 'duration': self.duration}
+                      for p in range(1, self.parts + 1)],
+        }
+
+
+class FakeOrigin:
+    """在后台线程中运行的模拟源站，按路由统计请求数和发送的字节数"""
+
+    def __init__(self, videos: list, host: str = '127.0.0.1', port: int = 0):
+        self.videos = {video.bvid: video for video in videos}
+        self.cover = sample_cover(1146, 717)
+        self.lock = threading.Lock()
+        self.counters = {}
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端中途断开（取消或模拟崩溃）
+
+            def do_GET(self):
+                origin.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = None
+
+    def start(self) -> 'FakeOrigin':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-origin', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        """各路由的请求数和字节数"""
+        with self.lock:
+            return {route: dict(counter) for route, counter in self.counters.items()}
+
+    def _count(self, route: str, sent: int):
+        with self.lock:
+            counter = self.counters.setdefault(route, {'requests': 0, 'bytes': 0})
+            counter['requests'] += 1
+            counter['bytes'] += sent
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+        match = re.fullmatch(r'/audio/(BV\w+)/(\d+)\.m4a', url.path)
+        if match and match.group(1) in self.videos:
+            return self._send_audio(request, self.videos[match.group(1)])
+        match = re.fullmatch(r'/video/(BV\w+)', url.path)
+        if match and match.group(1) in self.videos:
+            video = self.videos[match.group(1)]
+            p = int(query.get('p', ['1'])[0])
+            state = {'videoData': video.view(self.url), 'p': p,
+                     'audioUrl': f"{self.url}/audio/{video.bvid}/{p}.m4a",
+                     'coverUrl': f"{self.url}/cover/{video.bvid}.jpg"}
+            body = (f"<!DOCTYPE html><html><head><title>{video.title}</title></head><body>"
+                    f"<script>window.__INITIAL_STATE__={json.dumps(state, ensure_ascii=False)};</script>"
+                    f"</body></html>").encode('utf-8')
+            return self._send(request, 'video', 200, body, 'text/html; charset=utf-8')
+        match = re.fullmatch(r'/cover/(BV\w+)\.jpg', url.path)
+        if match and match.group(1) in self.videos:
+            return self._send(request, 'cover', 200, self.cover, 'image/jpeg')
+        if url.path == '/x/web-interface/view':
+            video = self.videos.get(query.get('bvid', [''])[0])
+            payload = {'code': 0, 'data': video.view(self.url)} if video else {'code': -404, 'message': '啥都木有'}
+            return self._send(request, 'view', 200, json.dumps(payload).encode('utf-8'), 'application/json')
+        self._send(request, 'not_found', 404, b'not found', 'text/plain')
+
+    def _send(self, request: BaseHTTPRequestHandler, route: str, status: int, body: bytes, content_type: str):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+        self._count(route, len(body))
+
+    def _send_audio(self, request: BaseHTTPRequestHandler, video: FakeVideo):
+        start, end = 0, video.size
+        range_header = request.headers.get('Range')
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header or '')
+        if match:
+            start = int(match.group(1))
+            end = min(video.size, int(match.group(2)) + 1) if match.group(2) else video.size
+            if start >= end:
+                request.send_response(416)
+                request.send_header('Content-Range', f"bytes */{video.size}")
+                request.send_header('Content-Length', '0')
+                request.end_headers()
+                return self._count('audio', 0)
+            request.send_response(206)
+            request.send_header('Content-Range', f"bytes {start}-{end - 1}/{video.size}")
+        else:
+            request.send_response(200)
+        request.send_header('Content-Type', 'audio/mp4')
+        request.send_header('Accept-Ranges', 'bytes')
+        request.send_header('Content-Length', str(end - start))
+        request.end_headers()
+        sent = 0
+        try:
+            for pos in range(start, end, CHUNK_SIZE):
+                chunk = video.read(pos, min(end, pos + CHUNK_SIZE))
+                request.wfile.write(chunk)
+                sent += len(chunk)
+        finally:
+            self._count('audio', sent)
+
+
+class FakeBilibiliIE(InfoExtractor):
+    """解析模拟源的视频网页，返回单个 m4a 音频格式"""
+
+    IE_NAME = 'fakebilibili'
+    _VALID_URL = r'https?://[^/]+/video/(?P<id>BV\w+)'
+
+    def _real_extract(self, url):
+        bvid = self._match_id(url)
+        p = int(parse_qs(urlparse(url).query).get('p', ['1'])[0])
+        webpage = self._download_webpage(url, bvid)
+        state = self._search_json(r'window\.__INITIAL_STATE__\s*=', webpage, 'initial state', bvid)
+        video = state['videoData']
+        page = next((page for page in video['pages'] if page['page'] == p), None)
+        if page is None:
+            raise ExtractorError(f"分 P 不存在：{bvid} p{p}", expected=True)
+        return {
+            'id': f"{bvid}_p{p}",
+            'title': f"{video['title']} p{p:03d} {page['part']}",
+            'url': state['audioUrl'],
+            'ext': 'm4a',
+            'acodec': 'mp4a.40.2',
+            'vcodec': 'none',
+            'abr': 128,
+            'duration': page['duration'],
+            'thumbnail': video['pic'],
+            'uploader': video['owner']['name'],
+            'upload_date': datetime.fromtimestamp(video['pubdate'], timezone.utc).strftime('%Y%m%d'),
+            'playlist_title': video['title'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    args = parser.parse_args()
+
+    videos = [FakeVideo('BV1Long5hour', '五小时长音频', parts=1, duration=5 * 3600),
+              FakeVideo('BV1Playlist300', '三百集合集', parts=300, duration=30)]
+    with FakeOrigin(videos, port=args.port) as origin:
+        print(f"模拟源已启动：{origin.url}")
+        for video in videos:
+            print(f"  {origin.url}/video/{video.bvid}（{video.parts} 个分 P）")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
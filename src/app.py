@@ -1,9 +1,18 @@
-from flask import Flask, render_template, request, jsonify, Response
-from utils.downloader import BiliDownloader
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory
+from utils.task_store import TaskStore
+from utils.governor import get_governor
+from utils.history_store import HistoryStore
+from utils.library_reconciler import LibraryReconciler
+from utils.job_queue import JobQueue
+from utils.metrics import get_registry
+from utils.profiler import ARTIFACTS, list_profiles, profile_info
 import os
+import re
 import json
+import time
+import hashlib
 import logging
-from datetime import datetime
+import threading
 
 # 配置日志
 logging.basicConfig(
@@ -14,7 +23,196 @@ logging.basicConfig(
 logger = logging.getLogger('BiliDownloader-Web')
 
 app = Flask(__name__)
-downloader = BiliDownloader()
+TASK_DIR = 'download_tasks'
+HISTORY_DIR = 'download_history'
+task_store = TaskStore(os.path.join(TASK_DIR, 'tasks.db'))
+task_store.import_json(os.path.join(TASK_DIR, 'download_history.json'))
+STARTED_AT = time.monotonic()
+
+# 下载器依赖 yt-dlp、Pillow、mutagen 等较重的库，首次使用时才导入和创建，
+# 使服务启动后能立即响应首页和健康检查
+_downloader = None
+_downloader_lock = threading.Lock()
+warmup_state = {'status': 'idle', 'timings': None, 'error': None}
+
+def get_downloader():
+    """进程内共享的下载器，首次调用时创建"""
+    global _downloader
+    if _downloader is None:
+        with _downloader_lock:
+            if _downloader is None:
+                start = time.perf_counter()
+                from utils.downloader import BiliDownloader
+                _downloader = BiliDownloader()
+                logger.info(f"下载器加载完成，耗时 {time.perf_counter() - start:.2f} 秒")
+    return _downloader
+
+def warmup():
+    """提前加载下载器及其依赖，返回各步骤耗时（秒）"""
+    warmup_state['status'] = 'running'
+    try:
+        start = time.perf_counter()
+        get_downloader()
+        timings = {'downloader': round(time.perf_counter() - start, 3)}
+        timings.update(get_downloader().warmup())
+    except Exception as e:
+        logger.error(f"预热失败：{str(e)}")
+        warmup_state.update(status='failed', error=str(e))
+        raise
+    warmup_state.update(status='done', timings=timings, error=None)
+    return timings
+
+PROGRESS_STORE_INTERVAL = float(os.getenv('PROGRESS_STORE_INTERVAL', '5'))
+
+def run_job(job):
+    """在下载队列的工作线程中执行下载，并同步任务记录"""
+    task_store.update(job.job_id, 'running')
+    last_store = 0.0
+    status = 'completed'
+    try:
+        for progress in get_downloader().download(job.bvid, job.output_dir, job.rename, job.workers,
+                                            profile=job.profile or None):
+            if progress.get('status') == 'failed':
+                # 有分 P 用完重试次数时，下载器以 failed 事件结束
+                status = 'failed'
+            # 更新任务状态；字节级进度事件按间隔写入，其余事件立即写入
+            now = time.monotonic()
+            if progress.get('status') != 'progress':
+                task_store.update(job.job_id, progress.get('status', 'running'), progress.get('progress', 0))
+                last_store = now
+            elif now - last_store >= PROGRESS_STORE_INTERVAL:
+                task_store.update(job.job_id, 'running', progress.get('progress', 0))
+                last_store = now
+            yield progress
+        task_store.update(job.job_id, status)
+    except Exception:
+        # 更新任务状态为失败
+        task_store.update(job.job_id, 'failed')
+        raise
+
+job_queue = JobQueue(run_job)
+
+def runtime_gauges():
+    """导出 /metrics 时读取的运行状态：任务队列、全局限速器、封面缓存和下载目录核对结果"""
+    gauges = {}
+    for key, value in job_queue.stats().items():
+        gauges[f'bili_jobs_{key}'] = (f'下载队列 {key}', value)
+    for key, value in get_governor().state().items():
+        gauges[f'bili_governor_{key}'] = (f'全局限速器 {key}', value)
+    # 下载器尚未加载时没有封面缓存状态，不为导出指标而加载
+    if _downloader is not None:
+        for key, value in _downloader.cover_cache.stats().items():
+            gauges[f'bili_cover_cache_{key}'] = (f'封面缓存 {key}', value)
+    if library.last and library.last.get('status') == 'done':
+        for key in ('files', 'records', 'relinked', 'removed', 'elapsed'):
+            gauges[f'bili_library_{key}'] = (f'最近一次下载目录核对 {key}', library.last[key])
+    return gauges
+
+get_registry().register_collector(runtime_gauges)
+
+# 下载目录与历史记录的批量核对只用到 SQLite，不需要加载下载器
+library = LibraryReconciler(HistoryStore(os.path.join(HISTORY_DIR, 'history.db')),
+                            os.getenv('DOWNLOAD_DIR', 'Audiobooks'), os.path.join(HISTORY_DIR, 'library.db'))
+
+def reconcile_library(full=False):
+    """导入旧版历史记录（若尚未导入）后核对下载目录"""
+    library.history.import_json(os.path.join(HISTORY_DIR, 'history.json'))
+    return library.reconcile(full)
+
+def reconcile_on_start():
+    try:
+        reconcile_library()
+    except Exception as e:
+        logger.error(f"启动时核对下载目录失败：{str(e)}")
+
+if os.getenv('RECONCILE_ON_START', 'true').lower() == 'true':
+    threading.Thread(target=reconcile_on_start, name='reconcile', daemon=True).start()
+
+if os.getenv('WARMUP_ON_START', 'false').lower() == 'true':
+    # 后台预热，不阻塞服务启动；预热完成前的请求按需加载
+    threading.Thread(target=warmup, name='warmup', daemon=True).start()
+
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+
+def sse_message(position, event):
+    """SSE 消息：id 为事件序号（已送达的日志事件数），断线重连时浏览器通过 Last-Event-ID 带回"""
+    return f"id: {position}\ndata: {json.dumps(event)}\n\n"
+
+def resume_position(headers, args):
+    """客户端已收到的事件数：优先取 Last-Event-ID 请求头，其次取 since 参数"""
+    value = headers.get('Last-Event-ID') or args.get('since')
+    try:
+        return max(0, int(value)) if value is not None else None
+    except ValueError:
+        return None
+
+def attach_download(args, headers):
+    """提交下载任务或接回已有任务，返回 (任务, 起始事件序号)
+
+    浏览器断线重连（带 Last-Event-ID）时接回原任务而不是重新提交；
+    原任务已结束且事件已全部送达时返回 (None, 0)，调用方应回复 204 让浏览器停止重连。
+    参数缺失时抛出 ValueError。
+    """
+    bvid = args.get('bvid')
+    output_dir = args.get('output_dir')
+    if not bvid or not output_dir:
+        raise ValueError('缺少必要参数')
+
+    since = resume_position(headers, args)
+    if since is not None:
+        job = job_queue.get(JobQueue.job_id(bvid, output_dir))
+        if job is not None:
+            if job.finished and since >= job.event_count:
+                return None, 0
+            return job, since
+
+    rename = str(args.get('rename', 'false')).lower() == 'true'
+    workers = args.get('workers')
+    workers = int(workers) if workers else None
+    priority = int(args.get('priority') or 0)
+    profile = str(args.get('profile', 'false')).lower() == 'true'
+    logger.info(f"开始下载任务：bvid={bvid}, output_dir={output_dir}, rename={rename}, workers={workers}")
+    
+    job, created = job_queue.submit(bvid, output_dir, rename, workers, priority, profile)
+    if created:
+        # 创建新任务记录（同一 task_id 重新下载时覆盖旧记录）
+        task_store.upsert({
+            'task_id': job.job_id,
+            'bvid': bvid,
+            'output_dir': output_dir,
+            'rename': rename,
+            'status': 'pending',
+            'progress': 0
+        })
+    return job, 0
+
+def stream_job(job, since=0):
+    """把任务事件以 SSE 形式推送给客户端；客户端断开只取消订阅，任务继续执行"""
+    def generate():
+        for item in job.subscribe(since, timeout=SSE_HEARTBEAT):
+            if item is None:
+                yield ": keepalive\n\n"
+            else:
+                yield sse_message(*item)
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+def load_task_state(task_id):
+    """读取下载器写入的任务状态文件；只读文件，不加载下载器。不存在或无效时返回空字典"""
+    if not re.fullmatch(r'[0-9a-f]{32}', task_id):
+        return {}
+    try:
+        with open(os.path.join(TASK_DIR, f"{task_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"加载任务状态失败：{str(e)}")
+        return {}
+
+def status_etag(status):
+    """任务状态内容的 ETag，状态未变化时轮询返回 304"""
+    payload = json.dumps(status, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.md5(payload).hexdigest()
 
 @app.route('/')
 def index():
@@ -27,70 +225,106 @@ def check_playlist():
     bvid = data.get('bvid')
     logger.info(f"检查播放列表：{bvid}")
     try:
-        count = downloader.check_playlist(bvid)
+        playlist = get_downloader().get_playlist(bvid)
+        count = len(playlist['parts'])
         logger.info(f"播放列表检查完成：{count} 个视频")
-        return jsonify({'success': True, 'count': count})
+        return jsonify({
+            'success': True,
+            'count': count,
+            'title': playlist.get('title', ''),
+            'parts': playlist['parts']
+        })
     except Exception as e:
         logger.error(f"播放列表检查失败：{str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/download', methods=['GET'])
 def download():
-    bvid = request.args.get('bvid')
-    output_dir = request.args.get('output_dir')
-    rename = request.args.get('rename', 'false').lower() == 'true'
-    
-    if not bvid or not output_dir:
+    try:
+        job, since = attach_download(request.args, request.headers)
+    except ValueError as e:
         logger.error("下载请求缺少必要参数")
-        return jsonify({'error': '缺少必要参数'}), 400
-    
-    logger.info(f"开始下载任务：bvid={bvid}, output_dir={output_dir}, rename={rename}")
-    
-    # 创建新任务记录
-    task_id = f"{bvid}_{output_dir}"
-    new_task = {
-        'task_id': task_id,
-        'bvid': bvid,
-        'output_dir': output_dir,
-        'rename': rename,
-        'status': 'pending',
-        'progress': 0,
-        'last_update': datetime.now().isoformat()
-    }
-    
-    # 保存任务记录
-    history = load_download_history()
-    history['tasks'].append(new_task)
-    save_download_history(history)
-    
-    def generate():
-        try:
-            for progress in downloader.download(bvid, output_dir, rename):
-                # 更新任务状态
-                history = load_download_history()
-                for task in history['tasks']:
-                    if task['task_id'] == task_id:
-                        task['status'] = progress.get('status', 'running')
-                        task['progress'] = progress.get('progress', 0)
-                        task['last_update'] = datetime.now().isoformat()
-                        break
-                save_download_history(history)
-                
-                yield f"data: {json.dumps(progress)}\n\n"
-        except Exception as e:
-            # 更新任务状态为失败
-            history = load_download_history()
-            for task in history['tasks']:
-                if task['task_id'] == task_id:
-                    task['status'] = 'failed'
-                    task['last_update'] = datetime.now().isoformat()
-                    break
-            save_download_history(history)
-            
-            logger.error(f"下载过程出错：{str(e)}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-    
-    return Response(generate(), mimetype='text/event-stream')
+        return jsonify({'error': str(e)}), 400
+    if job is None:
+        return '', 204
+    return stream_job(job, since)
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': job_queue.list_jobs(), 'stats': job_queue.stats()})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # 重新连接到运行中的任务，since 为已收到的事件数
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    since = resume_position(request.headers, request.args) or 0
+    if job.finished and since >= job.event_count:
+        return '', 204
+    return stream_job(job, since)
+
+@app.route('/governor', methods=['GET'])
+def governor_state():
+    # 全局请求速率/带宽限制的当前状态
+    return jsonify(get_governor().state())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus 文本格式：各阶段耗时直方图、分 P 结果计数及运行状态
+    return Response(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # 健康检查：不加载下载器，downloader_loaded 为 false 时首次下载会多出加载耗时
+    return jsonify({
+        'status': 'ok',
+        'uptime': round(time.monotonic() - STARTED_AT, 3),
+        'downloader_loaded': _downloader is not None,
+        'warmup': warmup_state['status'],
+        'jobs': job_queue.stats(),
+    })
+
+@app.route('/warmup', methods=['POST'])
+def warmup_route():
+    # 同步预热，返回各步骤耗时；已加载的步骤再次调用几乎不耗时
+    try:
+        timings = warmup()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'done', 'timings': timings})
+
+@app.route('/reconcile', methods=['GET', 'POST'])
+def reconcile():
+    # GET 返回最近一次核对结果；POST 立即核对，full=true 时忽略目录 mtime 缓存重新扫描
+    if request.method == 'GET':
+        return jsonify(library.last or {'status': 'idle'})
+    try:
+        return jsonify(reconcile_library(request.args.get('full', 'false').lower() == 'true'))
+    except Exception as e:
+        logger.error(f"核对下载目录失败：{str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/profiles', methods=['GET'])
+def get_profiles():
+    # 开启性能分析的任务（download?profile=true 或 PROFILE_TASKS=true）留下的分析结果
+    return jsonify({'profiles': list_profiles(TASK_DIR)})
+
+@app.route('/profiles/<task_id>', methods=['GET'])
+def get_profile(task_id):
+    info = profile_info(TASK_DIR, task_id) if re.fullmatch(r'[0-9a-f]{32}', task_id) else None
+    if not info:
+        return jsonify({'error': '分析结果不存在'}), 404
+    return jsonify(info)
+
+@app.route('/profiles/<task_id>/<name>', methods=['GET'])
+def get_profile_file(task_id, name):
+    if not re.fullmatch(r'[0-9a-f]{32}', task_id) or name not in ARTIFACTS:
+        return jsonify({'error': '分析结果不存在'}), 404
+    directory = os.path.abspath(os.path.join(TASK_DIR, f"{task_id}.profile"))
+    if not os.path.exists(os.path.join(directory, name)):
+        return jsonify({'error': '分析结果不存在'}), 404
+    return send_from_directory(directory, name, as_attachment=name == 'memory.snapshot')
 
 @app.route('/task_status', methods=['GET'])
 def task_status():
@@ -98,28 +332,19 @@ def task_status():
     if not task_id:
         return jsonify({'error': '缺少task_id参数'}), 400
     
-    status = downloader.load_task_state(task_id)
+    status = load_task_state(task_id)
     if not status:
         return jsonify({'error': '任务不存在'}), 404
     
-    return jsonify(status)
-def load_download_history():
-    try:
-        with open('download_tasks/download_history.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {'tasks': []}
-
-def save_download_history(data):
-    with open('download_tasks/download_history.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    response = jsonify(status)
+    response.set_etag(status_etag(status))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/download_history', methods=['GET'])
 def get_download_history():
-    history = load_download_history()
     # 只返回未完成的任务
-    active_tasks = [task for task in history['tasks'] if task['status'] != 'completed']
-    return jsonify({'tasks': active_tasks})
+    return jsonify({'tasks': task_store.list_tasks(exclude_status='completed')})
 
 @app.route('/update_task_status', methods=['POST'])
 def update_task_status():
@@ -131,36 +356,19 @@ def update_task_status():
     if not task_id or not status:
         return jsonify({'error': '缺少必要参数'}), 400
     
-    history = load_download_history()
-    for task in history['tasks']:
-        if task['task_id'] == task_id:
-            task['status'] = status
-            if progress is not None:
-                task['progress'] = progress
-            task['last_update'] = datetime.now().isoformat()
-            break
-    else:
+    if not task_store.update(task_id, status, progress):
         return jsonify({'error': '任务不存在'}), 404
     
-    save_download_history(history)
     return jsonify({'success': True})
 
 @app.route('/latest_task', methods=['GET'])
 def latest_task():
     try:
-        # 获取最新的任务文件
-        task_files = sorted(
-            [f for f in os.listdir('download_tasks') if f.endswith('.json')],
-            key=lambda f: os.path.getmtime(os.path.join('download_tasks', f)),
-            reverse=True
-        )
-        if not task_files:
+        # 获取最近更新的任务
+        task_data = task_store.latest()
+        if not task_data:
             return jsonify({'error': '没有找到任务'}), 404
         
-        latest_file = task_files[0]
-        with open(os.path.join('download_tasks', latest_file), 'r', encoding='utf-8') as f:
-            task_data = json.load(f)
-        
         return jsonify({
             'bvid': task_data.get('bvid'),
             'output_dir': task_data.get('output_dir'),
@@ -171,5 +379,6 @@ def latest_task():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # 开发服务器；生产环境使用 python src/asgi.py
     logger.info("启动 Web 服务器")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true')
@@ -0,0 +1,105 @@
+"""生产环境入口：进度推送和状态查询走 asyncio，其余路由交给 Flask
+
+用法：python src/asgi.py（或 uvicorn asgi:application --app-dir src）
+
+SSE 订阅者只在事件循环中等待，空闲连接不占用线程；下载队列在同一进程内，
+因此只能运行一个 worker 进程。
+"""
+import os
+import asyncio
+import logging
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from app import (app as flask_app, job_queue, SSE_HEARTBEAT, attach_download,
+                 load_task_state, resume_position, sse_message, status_etag)
+
+logger = logging.getLogger('BiliDownloader-ASGI')
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+async def stream_events(job, since: int):
+    """异步推送任务事件：生产者线程通过回调唤醒，超时未收到事件时发送心跳"""
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(wakeup.set)
+
+    job.add_listener(listener)
+    index, seen = since, 0
+    try:
+        while True:
+            # 先清除再读取，读取之后发布的事件一定会再次唤醒
+            wakeup.clear()
+            events, seen, finished = job.events_since(index, seen)
+            for position, event in events:
+                yield sse_message(position, event)
+                index = position
+            if finished and not events:
+                return
+            if events:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        job.remove_listener(listener)
+
+
+async def download(request: Request):
+    try:
+        # 提交任务会写 SQLite 任务记录，放到线程池中执行，避免阻塞事件循环
+        job, since = await run_in_threadpool(attach_download, request.query_params, request.headers)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if job is None:
+        return Response(status_code=204)
+    return StreamingResponse(stream_events(job, since), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def job_events(request: Request):
+    job = job_queue.get(request.path_params['job_id'])
+    if not job:
+        return JSONResponse({'error': '任务不存在'}, status_code=404)
+    since = resume_position(request.headers, request.query_params) or 0
+    if job.finished and since >= job.event_count:
+        return Response(status_code=204)
+    return StreamingResponse(stream_events(job, since), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def task_status(request: Request):
+    task_id = request.query_params.get('task_id')
+    if not task_id:
+        return JSONResponse({'error': '缺少task_id参数'}, status_code=400)
+
+    # 读文件会阻塞，放到线程池中执行，避免卡住事件循环上的 SSE 推送
+    status = await run_in_threadpool(load_task_state, task_id)
+    if not status:
+        return JSONResponse({'error': '任务不存在'}, status_code=404)
+
+    etag = f'"{status_etag(status)}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(status, headers=headers)
+
+
+application = Starlette(routes=[
+    Route('/download', download),
+    Route('/jobs/{job_id}/events', job_events),
+    Route('/task_status', task_status),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    logger.info("启动 Web 服务器")
+    uvicorn.run(application, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', '5000')),
+                log_level=os.getenv('LOG_LEVEL', 'info').lower())
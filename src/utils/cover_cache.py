@@ -0,0 +1,140 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+import logging
+from .cover_processor import CoverProcessor
+from .metrics import span
+
+logger = logging.getLogger('CoverCache')
+
+
+class CoverCache:
+    """处理后封面的两级缓存：磁盘按原图内容哈希存储，内存保留最近使用的若干张
+
+    同一来源 URL 只下载一次；不同 URL 指向相同内容时也只处理一次。
+    返回的字节对象在各分 P 间共享，不会为每个分 P 复制一份。
+    """
+
+    def __init__(self, cache_dir: str, processor: CoverProcessor,
+                 fetch: Callable[[str], Optional[bytes]], max_items: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.url_dir = os.path.join(cache_dir, 'urls')
+        os.makedirs(self.url_dir, exist_ok=True)
+        self.processor = processor
+        self.fetch = fetch
+        self.max_items = max_items if max_items is not None else int(os.getenv('COVER_CACHE_SIZE', '64'))
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # 内容哈希 -> 处理后的 JPEG
+        self.url_index = {}  # URL -> 内容哈希
+        self.url_locks = {}  # URL -> 正在获取该 URL 的锁
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'content_hits': 0, 'misses': 0, 'errors': 0}
+
+    def _url_key(self, url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def path(self, content_hash: str) -> str:
+        """处理后封面在磁盘上的路径"""
+        return os.path.join(self.cache_dir, f"{content_hash}.jpg")
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _remember(self, url: str, content_hash: str, data: bytes) -> bytes:
+        """放入内存 LRU，已有相同内容时返回已有的字节对象"""
+        with self.lock:
+            self.url_index[url] = content_hash
+            data = self.memory.get(content_hash, data)
+            self.memory[content_hash] = data
+            self.memory.move_to_end(content_hash)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+        return data
+
+    def _from_memory(self, url: str) -> Optional[bytes]:
+        with self.lock:
+            content_hash = self.url_index.get(url)
+            data = self.memory.get(content_hash) if content_hash else None
+            if data is not None:
+                self.memory.move_to_end(content_hash)
+                self.counters['memory_hits'] += 1
+        return data
+
+    def _read(self, content_hash: str) -> Optional[bytes]:
+        try:
+            with open(self.path(content_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, data: bytes):
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, url: str) -> Optional[bytes]:
+        """获取处理后的封面，失败时返回 None"""
+        data = self._from_memory(url)
+        if data is not None:
+            return data
+
+        # 同一 URL 的并发请求只有一个真正去下载
+        with self.lock:
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            try:
+                data = self._from_memory(url)
+                if data is not None:
+                    return data
+
+                # 磁盘：URL -> 内容哈希 -> 处理后的封面
+                url_file = os.path.join(self.url_dir, self._url_key(url))
+                if os.path.exists(url_file):
+                    with open(url_file, 'r', encoding='utf-8') as f:
+                        content_hash = f.read().strip()
+                    data = self._read(content_hash)
+                    if data is not None:
+                        self._count('disk_hits')
+                        return self._remember(url, content_hash, data)
+
+                raw = self.fetch(url)
+                if not raw:
+                    self._count('errors')
+                    return None
+                content_hash = hashlib.sha1(raw).hexdigest()
+                data = self._read(content_hash)
+                if data is not None:
+                    self._count('content_hits')
+                else:
+                    self._count('misses')
+                    with span('cover_process'):
+                        data = self.processor.process(raw)
+                    self._write(self.path(content_hash), data)
+                self._write(url_file, content_hash.encode('ascii'))
+                return self._remember(url, content_hash, data)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"获取封面失败：{url} - {str(e)}")
+                return None
+            finally:
+                with self.lock:
+                    self.url_locks.pop(url, None)
+
+    def get_file(self, url: str) -> Optional[str]:
+        """获取处理后封面在磁盘上的路径，供 FFmpeg 直接读取，失败时返回 None"""
+        if self.get(url) is None:
+            return None
+        with self.lock:
+            content_hash = self.url_index.get(url)
+        return self.path(content_hash) if content_hash else None
+
+    def stats(self) -> dict:
+        """命中/未命中计数及内存占用"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_items'] = len(self.memory)
+            stats['memory_bytes'] = sum(len(data) for data in self.memory.values())
+        return stats
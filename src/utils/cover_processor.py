@@ -0,0 +1,67 @@
+from io import BytesIO
+from PIL import Image, ImageFilter
+import logging
+
+logger = logging.getLogger('CoverProcessor')
+
+
+class CoverProcessor:
+    """把封面补齐为正方形：边缘像素向外延伸并模糊，输出固定尺寸的 JPEG
+
+    整个流程在目标分辨率下完成：JPEG 按目标尺寸降采样解码，
+    边缘延伸用一次缩放代替逐列粘贴，模糊半径按缩放比例换算。
+    """
+
+    def __init__(self, size: int = 400, blur_radius: float = 10, quality: int = 95):
+        self.size = size
+        self.blur_radius = blur_radius
+        self.quality = quality
+
+    def process(self, data: bytes) -> bytes:
+        """处理原始封面字节，返回正方形 JPEG 字节"""
+        img = Image.open(BytesIO(data))
+        original_size = img.size
+        width, height = original_size
+        scale = self.size / max(width, height)
+        inner_w = max(1, round(width * scale))
+        inner_h = max(1, round(height * scale))
+
+        # JPEG 直接以不小于目标尺寸的 1/2、1/4、1/8 比例解码
+        if img.format == 'JPEG':
+            img.draft('RGB', (inner_w, inner_h))
+        img = img.convert('RGB')
+        if img.size != (inner_w, inner_h):
+            img = img.resize((inner_w, inner_h), Image.Resampling.LANCZOS)
+
+        canvas = Image.new('RGB', (self.size, self.size), (255, 255, 255))
+        x_offset = (self.size - inner_w) // 2
+        y_offset = (self.size - inner_h) // 2
+        canvas.paste(img, (x_offset, y_offset))
+
+        # 用一次最近邻缩放把首尾一行/列像素拉伸到填充区域
+        right_pad = self.size - x_offset - inner_w
+        bottom_pad = self.size - y_offset - inner_h
+        if x_offset:
+            canvas.paste(img.crop((0, 0, 1, inner_h)).resize((x_offset, inner_h), Image.Resampling.NEAREST),
+                         (0, y_offset))
+        if right_pad:
+            canvas.paste(img.crop((inner_w - 1, 0, inner_w, inner_h)).resize((right_pad, inner_h), Image.Resampling.NEAREST),
+                         (x_offset + inner_w, y_offset))
+        if y_offset:
+            canvas.paste(img.crop((0, 0, inner_w, 1)).resize((inner_w, y_offset), Image.Resampling.NEAREST),
+                         (x_offset, 0))
+        if bottom_pad:
+            canvas.paste(img.crop((0, inner_h - 1, inner_w, inner_h)).resize((inner_w, bottom_pad), Image.Resampling.NEAREST),
+                         (x_offset, y_offset + inner_h))
+
+        # 只模糊填充区域
+        if x_offset or y_offset or right_pad or bottom_pad:
+            mask = Image.new('L', canvas.size, 255)
+            mask.paste(0, (x_offset, y_offset, x_offset + inner_w, y_offset + inner_h))
+            blurred = canvas.filter(ImageFilter.GaussianBlur(radius=self.blur_radius * scale))
+            canvas.paste(blurred, mask=mask)
+
+        output = BytesIO()
+        canvas.save(output, format='JPEG', quality=self.quality)
+        logger.info(f"封面处理完成：{original_size} -> ({self.size}x{self.size})")
+        return output.getvalue()
@@ -1,18 +1,32 @@
-import yt_dlp
 import os
 import re
-import requests
-from typing import Generator, Dict, Any
-from PIL import Image, ImageFilter, ImageOps
-from io import BytesIO
-import mutagen
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, APIC
+from typing import Generator, Dict, Any, Optional
 import logging
 from datetime import datetime
 import time
 import json
 import hashlib
+import subprocess
+import threading
+import heapq
+from .cover_cache import CoverCache
+from .cover_processor import CoverProcessor
+from .governor import get_governor
+from .history_store import HistoryStore
+from .http_client import HttpClient
+from .info_cache import InfoCache
+from .lease_store import LeaseStore, PartLeased
+from .library_reconciler import local_path
+from .media_processor import MediaProcessor, OUTPUT_FORMATS, can_stream_copy
+from .metrics import StageTimer, get_registry, span
+from .pipeline import PipelineStage
+from .playlist_resolver import PlaylistResolver
+from .profiler import TaskProfiler
+from .progress_bus import ProgressBus
+from .range_downloader import RangeDownloader
+from .retry_policy import RATE_LIMIT, RetryScheduler
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # 配置日志
 logging.basicConfig(
@@ -22,6 +36,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger('BiliDownloader')
 
+# 各输出格式优先选择可直接封装、无需重新编码的音频流
+FORMAT_SELECTORS = {
+    'mp3': 'bestaudio/best',
+    'm4a': 'bestaudio[ext=m4a]/bestaudio/best',
+    'opus': 'bestaudio[acodec^=opus]/bestaudio/best',
+}
+
+
+class _TaskContext:
+    """单个下载任务在各分 P 间共享的状态"""
+
+    def __init__(self, bvid: str, output_dir: str, base_path: str, rename: bool,
+                 parts: list, ydl_opts: dict, audio_format: str = 'mp3',
+                 extractors: Optional[list] = None):
+        self.bvid = bvid
+        self.output_dir = output_dir
+        self.base_path = base_path
+        self.rename = rename
+        self.parts = parts
+        self.count = len(parts)
+        self.ydl_opts = ydl_opts
+        self.audio_format = audio_format
+        self.extractors = extractors  # 指定时只使用这些解析器类，不加载 yt-dlp 内置解析器
+        self.cover_stage = None  # 标签写入阶段（FFmpeg 无法写入时使用），由 download() 创建
+        self.transcodes = set()  # 正在进行的转码任务
+        self.cancelled = False
+        self.progress = None  # ProgressBus，由 download() 创建
+        self.stages = StageTimer()  # 各阶段耗时，写入任务状态
+        self.governor = None  # 全局 Governor，yt-dlp 下载的字节数经进度回调计入带宽
+        self._local = threading.local()
+        self._extractors = []
+        self._lock = threading.Lock()
+
+    def postprocessor_hook(self, d: dict):
+        """yt-dlp 后处理回调：后处理链结束时记录最终文件路径
+
+        回调收到的 info_dict 是该步骤执行前的副本；MoveFiles 是链中最后一步，
+        执行前的 filepath 已是下载完成的音频文件。
+        """
+        if d.get('status') == 'finished' and d.get('postprocessor') == 'MoveFiles':
+            self._local.audio_path = d.get('info_dict', {}).get('filepath')
+
+    def begin_part(self, p: int):
+        """标记当前工作线程正在处理的分 P，进度回调据此归属"""
+        self._local.p = p
+        self._local.downloaded = 0
+        self.stages.bind()
+
+    def report(self, p: int, stage: str, **fields):
+        """上报分 P 的进度"""
+        if self.progress is not None:
+            self.progress.update(p, stage, **fields)
+
+    def progress_hook(self, d: dict):
+        """yt-dlp 下载进度回调：记录当前分 P 的已下载字节数、速度和剩余时间"""
+        p = getattr(self._local, 'p', None)
+        if p is None or d.get('status') != 'downloading':
+            return
+        # 计入全局带宽，超出时在下载线程中等待，从而限制 yt-dlp 的下载速度
+        downloaded = d.get('downloaded_bytes') or 0
+        delta = downloaded - getattr(self._local, 'downloaded', 0)
+        self._local.downloaded = downloaded
+        if self.governor is not None and delta > 0:
+            self.governor.consume_bytes(delta)
+        self.report(p, 'download', downloaded=d.get('downloaded_bytes'),
+                    total=d.get('total_bytes') or d.get('total_bytes_estimate'),
+                    speed=d.get('speed'), eta=d.get('eta'))
+
+    def take_audio_path(self) -> Optional[str]:
+        """取出当前线程最近一次音频提取完成的文件路径"""
+        path = getattr(self._local, 'audio_path', None)
+        self._local.audio_path = None
+        return path
+
+    def extractor(self) -> 'yt_dlp.YoutubeDL':
+        """获取当前工作线程的 YoutubeDL 实例，整个任务期间复用"""
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            import yt_dlp
+            if self.extractors:
+                ydl = yt_dlp.YoutubeDL(self.ydl_opts, auto_init=False)
+                for ie in self.extractors:
+                    ydl.add_info_extractor(ie())
+            else:
+                ydl = yt_dlp.YoutubeDL(self.ydl_opts)
+            self._local.ydl = ydl
+            with self._lock:
+                self._extractors.append(ydl)
+        return ydl
+
+    def close(self):
+        """关闭任务创建的所有 YoutubeDL 实例，封面阶段处理完已排队的任务后退出"""
+        if self.cover_stage is not None:
+            self.cover_stage.close()
+        with self._lock:
+            extractors, self._extractors = self._extractors, []
+        for ydl in extractors:
+            try:
+                ydl.close()
+            except Exception as e:
+                logger.warning(f"关闭解析器失败：{str(e)}")
+
+
 class BiliDownloader:
     def __init__(self):
         self.headers = {
@@ -36,60 +153,89 @@ class BiliDownloader:
             'Pragma': 'no-cache'
         }
         self.base_url = "https://www.bilibili.com/video/"
+        self.extractors = None  # 自定义 yt-dlp 解析器类列表（基准测试接入本地模拟源时使用）
         self.history_dir = "download_history"
         self.task_dir = "download_tasks"
         os.makedirs(self.history_dir, exist_ok=True)
         os.makedirs(self.task_dir, exist_ok=True)
         self.history_file = os.path.join(self.history_dir, "history.json")
-        self.download_history = self.load_download_history()
-        self.cover_queue = []  # 封面处理队列
+        self._history = None  # 首次访问时打开，见 history 属性
+        self._history_lock = threading.Lock()
+        self.info_cache = InfoCache(os.path.join(self.history_dir, "info_cache"))
+        self.governor = get_governor()
+        self.http = HttpClient(self.headers, governor=self.governor)
+        self.playlist_resolver = PlaylistResolver(self.http)
+        self.media = MediaProcessor(os.getenv('FFMPEG_PATH', 'ffmpeg'))
+        self.range_downloader = RangeDownloader(self.http)
+        self.segmented_min_duration = int(os.getenv('SEGMENTED_MIN_DURATION', '1800'))
+        # 设置 LEASE_DB（位于共享卷）后，多个节点按租约分配分 P
+        lease_db = os.getenv('LEASE_DB')
+        self.leases = LeaseStore(lease_db) if lease_db else None
+        if self.leases is not None:
+            expired = self.leases.reclaim_expired()
+            logger.info(f"启用多节点租约：{lease_db}（节点 {self.leases.owner}，回收过期租约 {expired} 个）")
+        self.cover_cache = CoverCache(os.path.join(self.history_dir, "covers"), CoverProcessor(), self.fetch_cover)
         self.active_tasks = {}  # 当前活动任务
+        registry = get_registry()
+        self.part_results = registry.counter('bili_parts_total', '分 P 处理结果数（success/skip/retry/error）', ('status',))
+        self.task_durations = registry.histogram('bili_task_duration_seconds', '下载任务总耗时（秒）', ('status',))
         logger.info("BiliDownloader 初始化完成")
-    
-    def load_download_history(self) -> dict:
-        """加载下载历史记录"""
-        try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-                logger.info(f"加载下载历史记录：{len(history)} 条记录")
-                return history
-        except Exception as e:
-            logger.error(f"加载下载历史记录失败：{str(e)}")
-        return {}
-    
-    def save_download_history(self):
-        """保存下载历史记录"""
+
+    @property
+    def history(self) -> HistoryStore:
+        """下载历史，首次访问时才打开数据库并导入旧版 JSON 记录"""
+        if self._history is None:
+            with self._history_lock:
+                if self._history is None:
+                    history = HistoryStore(os.path.join(self.history_dir, "history.db"))
+                    history.import_json(self.history_file)
+                    logger.info(f"加载下载历史记录：{history.count()} 条记录")
+                    self._history = history
+        return self._history
+
+    @history.setter
+    def history(self, store: HistoryStore):
+        self._history = store
+
+    def warmup(self) -> dict:
+        """提前完成首次下载才需要的准备工作（历史记录、yt-dlp 解析器、图片和标签库），返回各步骤耗时（秒）"""
+        timings = {}
+        start = time.perf_counter()
+        self.history.count()
+        timings['history'] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        import yt_dlp
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            ydl.get_info_extractor('BiliBili')
+        timings['yt_dlp'] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.download_history, f, ensure_ascii=False, indent=2)
-            logger.info("下载历史记录已保存")
+            self.media.probe()
         except Exception as e:
-            logger.error(f"保存下载历史记录失败：{str(e)}")
-    
-    def get_video_key(self, bvid: str, p: int, title: str) -> str:
-        """生成视频唯一标识"""
-        # 使用 BV 号、分 P 号和标题生成唯一标识
-        key_str = f"{bvid}_p{p}_{title}"
-        return hashlib.md5(key_str.encode('utf-8')).hexdigest()
-    
-    def is_downloaded(self, bvid: str, p: int, info: dict) -> tuple[bool, str, bool]:
-        """检查视频是否已下载
+            logger.warning(f"预热时检测 FFmpeg 失败：{str(e)}")
+        timings['ffmpeg'] = round(time.perf_counter() - start, 3)
+        logger.info(f"预热完成：{timings}")
+        return timings
+
+    def is_downloaded(self, bvid: str, p: int) -> tuple[bool, str, bool]:
+        """检查视频是否已下载（只查本地记录，无需联网）
         返回：(是否已下载，已下载文件路径，是否支持续传)
         """
-        title = info.get('title', '')
-        video_key = self.get_video_key(bvid, p, title)
-        
-        if video_key in self.download_history:
-            history_info = self.download_history[video_key]
-            mp3_path = history_info.get('file_path')
-            
+        history_info = self.history.get(bvid, p)
+        if history_info:
+            # 兼容在其他系统上写入的路径（如 Windows 分隔符），整个下载目录的批量核对见 LibraryReconciler
+            mp3_path = local_path(history_info.get('file_path') or '', os.getenv('DOWNLOAD_DIR', 'Audiobooks'))
+            try:
+                actual_size = os.stat(mp3_path).st_size if mp3_path else None
+            except OSError:
+                actual_size = None
+
             # 检查文件是否存在
-            if mp3_path and os.path.exists(mp3_path):
+            if actual_size is not None:
                 # 检查文件是否完整
                 expected_size = history_info.get('file_size', 0)
-                actual_size = os.path.getsize(mp3_path)
-                
                 if actual_size >= expected_size:
                     logger.info(f"找到完整的历史下载记录：{mp3_path}")
                     return True, mp3_path, False
@@ -99,17 +245,23 @@ class BiliDownloader:
             else:
                 # 如果文件不存在，删除历史记录
                 logger.info(f"历史文件不存在，清除记录：{mp3_path}")
-                del self.download_history[video_key]
-                self.save_download_history()
+                self.history.delete(bvid, p)
+
+        # 多节点共享下载目录时，其他节点完成的分 P 同样跳过
+        if self.leases is not None:
+            done_path = self.leases.done_path(bvid, p)
+            if done_path:
+                if os.path.exists(done_path):
+                    logger.info(f"其他节点已完成下载：{done_path}")
+                    return True, done_path, False
+                self.leases.forget(bvid, p)
         
         return False, "", False
     
     def add_download_history(self, bvid: str, p: int, file_path: str, info: dict):
         """添加下载历史记录"""
         title = info.get('title', '')
-        video_key = self.get_video_key(bvid, p, title)
-        
-        self.download_history[video_key] = {
+        self.history.add({
             'bvid': bvid,
             'p': p,
             'title': title,
@@ -119,8 +271,7 @@ class BiliDownloader:
             'duration': info.get('duration', 0),
             'uploader': info.get('uploader', ''),
             'upload_date': info.get('upload_date', '')
-        }
-        self.save_download_history()
+        })
         logger.info(f"添加下载记录：{title}")
     
     def extract_bvid(self, url: str) -> str:
@@ -134,165 +285,98 @@ class BiliDownloader:
         logger.info(f"成功提取 BV 号：{bvid}")
         return bvid
     
+    def _cover_url(self, info: dict) -> Optional[str]:
+        """从视频信息（或视频网页）中查找封面 URL"""
+        # 首先尝试从 info 中获取封面 URL
+        if info.get('thumbnail'):
+            return info['thumbnail']
+        if info.get('thumbnails'):
+            # 选择最高质量的缩略图
+            return info['thumbnails'][-1]['url']
+
+        # 尝试从网页中提取封面 URL
+        webpage_url = info.get('webpage_url')
+        if webpage_url:
+            response = self.http.get(webpage_url)
+            if response.status_code == 200:
+                # 在页面内容中查找封面 URL
+                match = re.search(r'"coverUrl":"([^"]+)"', response.text)
+                if match:
+                    return match.group(1)
+        return None
+
     def get_cover_image(self, info: dict) -> bytes:
         """获取并处理封面图片"""
         try:
-            # 首先尝试从 info 中获取封面 URL
-            cover_url = None
-            if 'thumbnail' in info:
-                cover_url = info['thumbnail']
-            elif 'thumbnails' in info and info['thumbnails']:
-                # 选择最高质量的缩略图
-                cover_url = info['thumbnails'][-1]['url']
-            
-            if not cover_url:
-                # 尝试从网页中提取封面 URL
-                webpage_url = info.get('webpage_url')
-                if webpage_url:
-                    response = requests.get(webpage_url, headers=self.headers)
-                    if response.status_code == 200:
-                        # 在页面内容中查找封面 URL
-                        pattern = r'"coverUrl":"([^"]+)"'
-                        match = re.search(pattern, response.text)
-                        if match:
-                            cover_url = match.group(1)
-
+            cover_url = self._cover_url(info)
             if cover_url:
                 logger.info(f"找到封面 URL: {cover_url}")
-                response = requests.get(cover_url, headers=self.headers)
-                if response.status_code == 200:
-                    logger.info("封面下载成功，开始处理图片")
-                    # 打开图片
-                    img = Image.open(BytesIO(response.content))
-                    original_size = img.size
-                    logger.info(f"原始图片尺寸：{original_size}")
-
-                    # 以长边为基准创建正方形画布
-                    max_side = max(img.width, img.height)
-                    # 创建新的正方形画布
-                    square_img = Image.new('RGB', (max_side, max_side), (255, 255, 255))
-                    
-                    # 计算粘贴位置
-                    x_offset = (max_side - img.width) // 2
-                    y_offset = (max_side - img.height) // 2
-                    
-                    # 将原图粘贴到正方形画布中心
-                    square_img.paste(img, (x_offset, y_offset))
-                    
-                    # 使用智能填充处理边缘
-                    if img.width < max_side:
-                        # 左右边缘需要填充
-                        left_edge = img.crop((0, 0, 1, img.height))
-                        right_edge = img.crop((img.width-1, 0, img.width, img.height))
-                        for x in range(0, x_offset):
-                            square_img.paste(left_edge, (x, y_offset))
-                        for x in range(x_offset + img.width, max_side):
-                            square_img.paste(right_edge, (x, y_offset))
-                    
-                    if img.height < max_side:
-                        # 上下边缘需要填充
-                        top_edge = img.crop((0, 0, img.width, 1))
-                        bottom_edge = img.crop((0, img.height-1, img.width, img.height))
-                        for y in range(0, y_offset):
-                            square_img.paste(top_edge, (x_offset, y))
-                        for y in range(y_offset + img.height, max_side):
-                            square_img.paste(bottom_edge, (x_offset, y))
-                    
-                    # 创建仅包含填充区域的蒙版
-                    mask = Image.new('L', square_img.size, 0)
-                    # 绘制原始图片区域（不模糊）
-                    mask.paste(255, (x_offset, y_offset, x_offset + img.width, y_offset + img.height))
-                    # 反转蒙版以获取填充区域
-                    mask = ImageOps.invert(mask)
-                    
-                    # 仅对填充区域应用模糊
-                    blurred = square_img.filter(ImageFilter.GaussianBlur(radius=10))
-                    # 将模糊后的填充区域与原始图片合并
-                    square_img.paste(blurred, mask=mask)
-                    logger.info(f"正方形画布尺寸：{square_img.size} (已应用边缘模糊)")
-                    
-                    # 调整大小为 400x400
-                    img = square_img.resize((400, 400), Image.Resampling.LANCZOS)
-                    
-                    # 转换为字节
-                    output = BytesIO()
-                    img.save(output, format='JPEG', quality=95)
-                    logger.info(f"封面处理完成：{original_size} -> (400x400)")
-                    return output.getvalue()
-            else:
-                logger.warning("未找到封面 URL")
+                return self.cover_cache.get(cover_url)
+            logger.warning("未找到封面 URL")
         except Exception as e:
             logger.error(f"处理封面时出错：{str(e)}")
         return None
 
-    def embed_cover(self, mp3_path: str, cover_data: bytes):
-        """将封面嵌入到 MP3 文件中"""
+    def get_cover_file(self, info: dict) -> Optional[str]:
+        """获取处理后封面的缓存文件路径，供转码时直接写入"""
         try:
-            logger.info(f"开始为音频文件添加封面：{os.path.basename(mp3_path)}")
-            # 等待文件可用
-            for _ in range(10):  # 最多等待 10 秒
-                if os.path.exists(mp3_path):
-                    break
-                time.sleep(1)
-            
-            if not os.path.exists(mp3_path):
-                raise FileNotFoundError(f"找不到 MP3 文件：{mp3_path}")
-            
-            # 等待文件写入完成
-            time.sleep(1)
-            
-            audio = MP3(mp3_path, ID3=ID3)
-            
-            # 如果没有 ID3 标签，创建一个
-            if audio.tags is None:
-                audio.add_tags()
-                logger.info("创建新的 ID3 标签")
-            
-            # 添加封面
-            audio.tags.add(
-                APIC(
-                    encoding=3,  # UTF-8
-                    mime='image/jpeg',
-                    type=3,  # 封面图片
-                    desc='Cover',
-                    data=cover_data
-                )
-            )
-            audio.save()
-            logger.info("封面添加成功")
+            cover_url = self._cover_url(info)
+            if cover_url:
+                logger.info(f"找到封面 URL: {cover_url}")
+                return self.cover_cache.get_file(cover_url)
+            logger.warning("未找到封面 URL")
         except Exception as e:
-            logger.error(f"添加封面时出错：{str(e)}")
+            logger.error(f"处理封面时出错：{str(e)}")
+        return None
+
+    @staticmethod
+    def audio_metadata(info: dict) -> dict:
+        """写入音频文件的标签：标题、UP 主、合集标题和发布日期"""
+        upload_date = info.get('upload_date') or ''
+        return {
+            'title': info.get('title') or '',
+            'artist': info.get('uploader') or '',
+            'album': info.get('playlist_title') or info.get('title') or '',
+            'date': f"{upload_date[:4]}-{upload_date[4:6]}-{upload_date[6:8]}" if len(upload_date) == 8 else '',
+        }
+
+    def fetch_cover(self, cover_url: str) -> bytes:
+        """下载原始封面图片"""
+        with span('cover_fetch'):
+            response = self.http.get(cover_url)
+        if response.status_code != 200:
+            logger.error(f"封面下载失败：HTTP {response.status_code}")
+            return None
+        logger.info("封面下载成功，开始处理图片")
+        return response.content
+
+    def embed_cover(self, audio_path: str, cover_data: Optional[bytes], metadata: Optional[dict] = None):
+        """一次性写入标签和封面（在标签写入阶段的工作线程中执行）
+
+        仅用于 FFmpeg 无法在封装时写入封面的情况，例如 opus 或无需转码的 m4a。
+        """
+        logger.info(f"开始为音频文件写入标签：{os.path.basename(audio_path)}")
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"找不到音频文件：{audio_path}")
+        self.media.add_metadata(audio_path, metadata, cover_data=cover_data)
     
-    def check_playlist(self, bvid: str) -> int:
-        """检查播放列表中的视频数量"""
-        url = f"{self.base_url}{bvid}"
-        logger.info(f"开始检查播放列表：{url}")
-        
+    def get_playlist(self, bvid: str) -> dict:
+        """获取分 P 列表（带缓存），失败时按单集视频处理"""
         try:
-            # 使用 requests 获取页面内容
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                logger.error(f"请求失败：HTTP {response.status_code}")
-                return 1
-            
-            # 在页面内容中查找分 P 信息
-            content = response.text
-            # 查找包含分 P 数量的模式
-            pattern = r'"page":(\d+),'
-            matches = re.findall(pattern, content)
-            
-            if matches:
-                # 如果找到匹配，取最大的数字
-                max_page = max(map(int, matches))
-                logger.info(f"检测到多 P 视频，共 {max_page} 个分 P")
-                return max_page
-            else:
-                logger.info("未检测到分 P 信息，视频为单集")
-                return 1
-                
+            return self.playlist_resolver.resolve(bvid)
         except Exception as e:
-            logger.error(f"检查播放列表时出错：{str(e)}")
-            return 1
+            logger.error(f"获取分 P 列表时出错：{str(e)}")
+            return {'bvid': bvid, 'title': '', 'parts': [{'p': 1, 'cid': None, 'title': '', 'duration': 0}]}
+
+    def check_playlist(self, bvid: str) -> int:
+        """检查播放列表中的视频数量"""
+        logger.info(f"开始检查播放列表：{bvid}")
+        count = len(self.get_playlist(bvid)['parts'])
+        if count > 1:
+            logger.info(f"检测到多 P 视频，共 {count} 个分 P")
+        else:
+            logger.info("未检测到分 P 信息，视频为单集")
+        return count
     
     def save_task_state(self, task_id: str, state: dict):
         """保存任务状态"""
@@ -317,43 +401,255 @@ class BiliDownloader:
             logger.error(f"加载任务状态失败：{str(e)}")
         return {}
 
-    def cleanup_task_state(self, task_id: str):
-        """清理已完成任务状态"""
-        task_file = os.path.join(self.task_dir, f"{task_id}.json")
+    @staticmethod
+    def _downloaded_path(info: dict) -> Optional[str]:
+        """yt-dlp 返回结果中记录的最终文件路径（已包含后处理的改名）"""
+        downloads = info.get('requested_downloads') or []
+        return downloads[-1].get('filepath') if downloads else None
+
+    def _resolve(self, task: _TaskContext, bvid: str, p: int, url: str) -> dict:
+        """解析分 P 并写入缓存"""
+        with task.stages.span('resolve'):
+            self.governor.acquire_request()
+            info = task.extractor().extract_info(url, download=False)
+        if not info:
+            raise RuntimeError(f"无法获取视频信息：{url}")
+        self.info_cache.put(bvid, p, task.extractor().sanitize_info(dict(info), remove_private_keys=True))
+        return info
+
+    def _fetch_audio(self, task: _TaskContext, p: int, info: dict, duration: float) -> tuple:
+        """按解析结果下载音频，返回 (音频文件路径, 下载后的解析结果)
+
+        长音频按字节区间分段并行下载，断点续传基于分段记录；
+        其余情况由 yt-dlp 下载，断点续传由 continuedl 基于 .part 文件完成。
+        """
+        ydl = task.extractor()
+        segmented = (0 < self.segmented_min_duration <= duration and bool(info.get('url'))
+                     and info.get('protocol', 'https') in ('http', 'https'))
+        if segmented:
+            logger.info(f"开始分段下载音频（时长 {duration} 秒）")
+            with task.stages.span('download'):
+                audio_filename = self.range_downloader.download(
+                    info['url'], ydl.prepare_filename(info), headers=info.get('http_headers'),
+                    progress=lambda done, total: task.report(p, 'download', downloaded=done, total=total),
+                    cancelled=lambda: task.cancelled)
+            return audio_filename, info
+
+        logger.info("开始下载音频")
+        with task.stages.span('download'):
+            self.governor.acquire_request()
+            # 直接使用解析结果（刚解析的或缓存的）下载，不再重复解析
+            result = ydl.process_ie_result(info, download=True)
+        if not result:
+            raise RuntimeError(f"音频下载失败：{info.get('webpage_url') or info.get('id')}")
+        # 下载完成时后处理回调已给出最终文件路径，无需轮询等待
+        audio_filename = task.take_audio_path() or self._downloaded_path(result) or ydl.prepare_filename(result)
+        return audio_filename, result
+
+    def _download_part(self, task: _TaskContext, part: dict) -> Dict[str, Any]:
+        """下载单个分 P，返回该分 P 的结果事件"""
+        bvid, count, p = task.bvid, task.count, part['p']
+        url = f"{self.base_url}{bvid}?p={p}"
+        logger.info(f"处理第 {p}/{count} 个视频：{part.get('title') or url}")
+
+        filename = None
+        basename = None
+        final_filename = None
+        leased = False
+        task.begin_part(p)
         try:
-            if os.path.exists(task_file):
-                os.remove(task_file)
-                logger.info(f"清理任务状态文件：{task_id}")
-        except Exception as e:
-            logger.error(f"清理任务状态文件失败：{str(e)}")
-
-    def wait_for_file(self, filepath: str, timeout: int = 30) -> bool:
-        """等待文件出现并可访问"""
-        logger.info(f"等待文件：{os.path.basename(filepath)}")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if os.path.exists(filepath):
+            # 检查是否已下载，支持断点续传
+            is_downloaded, existing_file, can_resume = self.is_downloaded(bvid, p)
+            if is_downloaded:
+                logger.info(f"跳过已下载的文件：{existing_file}")
+                return {
+                    'status': 'skip',
+                    'message': f'已跳过重复文件：{os.path.basename(existing_file)}',
+                    'p': p
+                }
+
+            # 领取租约，其他节点正在下载时稍后再检查
+            if self.leases is not None:
+                if not self.leases.claim(bvid, p):
+                    raise PartLeased(f"第 {p} 个视频正由其他节点下载")
+                leased = True
+
+            # 优先使用缓存的解析结果（含未过期的下载地址），命中时无需再请求解析
+            info = self.info_cache.get(bvid, p)
+            cached = info is not None
+            if not cached:
+                info = self._resolve(task, bvid, p, url)
+            else:
+                logger.info(f"使用缓存的视频信息：{bvid} p{p}")
+
+            if can_resume:
+                logger.info(f"发现不完整文件，重新下载：{existing_file}")
+            # 下载前确定输出文件名，下载失败时也能清理临时文件
+            filename = task.extractor().prepare_filename(info)
+            basename = os.path.splitext(filename)[0]
+            duration = part.get('duration') or info.get('duration') or 0
+            try:
+                audio_filename, info = self._fetch_audio(task, p, info, duration)
+            except Exception:
+                if not cached or task.cancelled:
+                    raise
+                # 缓存中的下载地址可能已失效：清除缓存，重新解析后再试一次
+                logger.warning(f"使用缓存的视频信息下载失败，重新解析：{bvid} p{p}")
+                self.info_cache.invalidate(bvid, p)
+                info = self._resolve(task, bvid, p, url)
+                audio_filename, info = self._fetch_audio(task, p, info, duration)
+            ydl = task.extractor()
+
+            # 获取原始文件名（不带扩展名）
+            basename = os.path.splitext(ydl.prepare_filename(info))[0]
+            logger.info(f"基础文件名：{os.path.basename(basename)}")
+
+            if not os.path.exists(audio_filename):
+                raise FileNotFoundError(f"音频文件下载失败：{os.path.basename(audio_filename)}")
+            logger.info(f"音频下载完成：{os.path.basename(audio_filename)}")
+
+            ext = task.audio_format
+            if task.rename:
+                final_filename = os.path.join(task.base_path, f"{task.output_dir}-{p}.{ext}")
+            else:
+                final_filename = f"{basename}.{ext}"
+            metadata = self.audio_metadata(info)
+
+            if os.path.abspath(audio_filename) == os.path.abspath(final_filename):
+                # 下载结果已是目标格式且无需改名：不经 FFmpeg，由后台线程一次性写入标签和封面
+                cover_data = self.get_cover_image(info)
+                task.cover_stage.submit(final_filename, cover_data, metadata)
+                logger.info(f"标签已加入处理队列：{os.path.basename(final_filename)}")
+            else:
+                # 交给转码进程池，同时运行的 FFmpeg 进程数受 CPU 数限制；
+                # 源编码可直接封装时只做 remux，不重新编码。标签和封面在同一次输出中写入，
+                # 结果直接写到最终文件名，每个文件只写一次
+                if task.cancelled:
+                    raise RuntimeError("任务已取消")
+                acodec = info.get('acodec')
+                copy = can_stream_copy(ext, acodec)
+                if not copy and ext != 'mp3':
+                    logger.warning(f"源音频编码 {acodec} 无法直接封装为 {ext}，将重新编码")
+                cover_file = self.get_cover_file(info)
+                if not cover_file:
+                    logger.warning("无法获取封面图片")
+                single_pass = OUTPUT_FORMATS[ext]['attached_pic'] or not cover_file
+                duration = duration or info.get('duration') or 0
+                future = self.media.transcode(audio_filename, final_filename, ext,
+                                              bitrate=None if copy else os.getenv('AUDIO_QUALITY', '192k'),
+                                              nice=int(os.getenv('TRANSCODE_NICE', '0')),
+                                              copy=copy,
+                                              metadata=metadata if single_pass else None,
+                                              cover_path=cover_file if single_pass else None,
+                                              progress=(lambda seconds: task.report(p, 'transcode', fraction=seconds / duration))
+                                              if duration else None)
+                task.transcodes.add(future)
                 try:
-                    # 尝试打开文件
-                    with open(filepath, 'rb') as f:
-                        f.read(1)
-                    logger.info(f"文件已就绪：{os.path.basename(filepath)}")
-                    return True
-                except:
-                    pass
-            time.sleep(1)
-        logger.error(f"等待文件超时：{os.path.basename(filepath)}")
-        return False
-    
-    def download(self, bvid: str, output_dir: str, rename: bool = False) -> Generator[Dict[str, Any], None, None]:
-        """下载音频文件"""
+                    with task.stages.span('transcode'):
+                        future.result()
+                except subprocess.CalledProcessError as e:
+                    raise RuntimeError(f"音频转换失败：{e.stderr or str(e)}") from e
+                finally:
+                    task.transcodes.discard(future)
+                os.remove(audio_filename)
+                logger.info(f"{'封装' if copy else '转码'}完成：{os.path.basename(final_filename)}")
+
+                if not single_pass:
+                    # opus 无法由 FFmpeg 写入封面，后台线程一次性写入全部标签
+                    with open(cover_file, 'rb') as f:
+                        task.cover_stage.submit(final_filename, f.read(), metadata)
+
+            # 添加到下载历史
+            with task.stages.span('history'):
+                self.add_download_history(bvid, p, final_filename, info)
+                if leased:
+                    self.leases.complete(bvid, p, final_filename)
+                    leased = False
+
+            # 清理临时文件（成品已直接写到最终文件名，清理中间文件计入 rename 阶段）
+            with task.stages.span('rename'):
+                try:
+                    # 清理 JSON 文件
+                    info_json = f"{basename}.info.json"
+                    if os.path.exists(info_json):
+                        os.remove(info_json)
+                        logger.info("清理临时 JSON 文件")
+
+                    # 清理其他可能的临时文件
+                    for temp_ext in ['.m4a', '.webm', '.part', '.ytdl']:
+                        temp_file = f"{basename}{temp_ext}"
+                        if temp_file != final_filename and os.path.exists(temp_file):
+                            os.remove(temp_file)
+                            logger.info(f"清理临时文件：{os.path.basename(temp_file)}")
+                except Exception as e:
+                    logger.warning(f"清理临时文件失败：{str(e)}")
+
+            return {
+                'status': 'success',
+                'message': f'已下载：{os.path.basename(final_filename)}',
+                'p': p
+            }
+        except Exception:
+            if leased:
+                self.leases.release(bvid, p)
+            # 清理失败下载的临时文件
+            try:
+                if final_filename and os.path.exists(final_filename):
+                    os.remove(final_filename)
+                temp_files = []
+                if basename:
+                    temp_files += [f"{basename}{ext}" for ext in
+                                   ['.mp3', '.m4a', '.opus', '.webm', '.part', '.ytdl', '.info.json']]
+                if filename and not os.path.exists(f"{filename}.part.segments"):
+                    # yt-dlp 的 .part 在下次重试时会被续传，已下载完整时服务器返回 416，
+                    # 因此一并删除；分段下载留有分段记录，其 .part 保留用于断点续传
+                    temp_files += [f"{filename}.part", f"{filename}.ytdl"]
+                for temp_file in temp_files:
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                        logger.info(f"清理失败下载的临时文件：{os.path.basename(temp_file)}")
+            except Exception as cleanup_error:
+                logger.error(f"清理临时文件失败：{str(cleanup_error)}")
+            raise
+
+    @staticmethod
+    def make_task_id(bvid: str, output_dir: str) -> str:
+        """任务 ID：同一视频下载到同一目录时相同"""
+        return hashlib.md5(f"{bvid}_{output_dir}".encode('utf-8')).hexdigest()
+
+    def download(self, bvid: str, output_dir: str, rename: bool = False, workers: Optional[int] = None,
+                 profile: Optional[bool] = None) -> Generator[Dict[str, Any], None, None]:
+        """下载音频文件
+
+        workers 为同时处理的分 P 数量，默认读取 PARALLEL_PARTS 环境变量。
+        各分 P 的结果事件始终按分 P 顺序产出。
+        profile 为 True（未指定时读取 PROFILE_TASKS）时对本次任务做性能分析，
+        结果写入 download_tasks/<task_id>.profile/。
+        """
+        if profile is None:
+            profile = os.getenv('PROFILE_TASKS', 'false').lower() == 'true'
+        if not profile:
+            return self._download(bvid, output_dir, rename, workers)
+        return self._profiled_download(bvid, output_dir, rename, workers)
+
+    def _profiled_download(self, bvid: str, output_dir: str, rename: bool,
+                           workers: Optional[int]) -> Generator[Dict[str, Any], None, None]:
+        profiler = TaskProfiler(os.path.join(self.task_dir, f"{self.make_task_id(bvid, output_dir)}.profile"))
+        profiler.start()
+        try:
+            yield from self._download(bvid, output_dir, rename, workers)
+        finally:
+            profiler.stop()
+
+    def _download(self, bvid: str, output_dir: str, rename: bool = False,
+                  workers: Optional[int] = None) -> Generator[Dict[str, Any], None, None]:
         start_time = datetime.now()
         base_path = os.path.join(os.getenv('DOWNLOAD_DIR', 'Audiobooks'), output_dir)
         os.makedirs(base_path, exist_ok=True)
         logger.info(f"创建输出目录：{base_path}")
 
         # 生成任务ID
-        task_id = hashlib.md5(f"{bvid}_{output_dir}".encode('utf-8')).hexdigest()
+        task_id = self.make_task_id(bvid, output_dir)
         self.active_tasks[task_id] = {
             'bvid': bvid,
             'output_dir': output_dir,
@@ -366,176 +662,211 @@ class BiliDownloader:
         max_retries = int(os.getenv('MAX_RETRIES', '3'))
         timeout = int(os.getenv('TIMEOUT', '30'))
         concurrent_downloads = int(os.getenv('CONCURRENT_DOWNLOADS', '5'))
+        if workers is None:
+            workers = int(os.getenv('PARALLEL_PARTS', '1'))
+        audio_format = os.getenv('AUDIO_FORMAT', 'mp3').lower()
+        if audio_format not in OUTPUT_FORMATS:
+            logger.warning(f"不支持的输出格式 {audio_format}，使用 mp3")
+            audio_format = 'mp3'
 
-        # 进度回调函数
-        def progress_hook(d):
-            if d['status'] == 'downloading':
-                percent = d.get('_percent_str', '0%').strip('%')
-                yield {
-                    'status': 'progress',
-                    'progress': float(percent),
-                    'speed': d.get('_speed_str', 'N/A'),
-                    'eta': d.get('_eta_str', 'N/A')
-                }
-
-        # 封面处理函数
-        def process_covers():
-            while self.cover_queue:
-                mp3_path, cover_data = self.cover_queue.pop(0)
-                try:
-                    self.embed_cover(mp3_path, cover_data)
-                    logger.info(f"成功处理封面：{os.path.basename(mp3_path)}")
-                except Exception as e:
-                    logger.error(f"处理封面失败：{os.path.basename(mp3_path)} - {str(e)}")
-        
-        count = self.check_playlist(bvid)
-        logger.info(f"准备下载 {count} 个视频")
+        playlist = self.get_playlist(bvid)
+        parts = playlist['parts']
+        count = len(parts)
+        workers = max(1, min(workers, count))
+        logger.info(f"准备下载 {count} 个视频，并行数：{workers}")
         
         ydl_opts = {
-            'format': 'bestaudio/best',
+            'format': FORMAT_SELECTORS[audio_format],
             'outtmpl': os.path.join(base_path, '%(title)s.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': os.getenv('AUDIO_QUALITY', '192k'),
-            }],
             'writethumbnail': False,  # 先不下载封面
-            'ignoreerrors': True,
+            # 不忽略错误：yt-dlp 抛出的 DownloadError 带有 HTTP 状态码（如 HTTP Error 412），
+            # 由重试策略据此区分限流、网络错误和其他错误
+            'ignoreerrors': False,
             'quiet': False,
             'no_warnings': False,
             'continuedl': True,  # 支持断点续传
             'noprogress': False,
-            'progress_hooks': [progress_hook],
             'retries': max_retries,
             'socket_timeout': timeout,
             'concurrent_fragment_downloads': concurrent_downloads,
         }
+        task = _TaskContext(bvid, output_dir, base_path, rename, parts, ydl_opts, audio_format, self.extractors)
+        ydl_opts['progress_hooks'] = [task.progress_hook]
+        ydl_opts['postprocessor_hooks'] = [task.postprocessor_hook]
+        task.progress = ProgressBus(count)
+        task.governor = self.governor
+
+        def embed(*args):
+            with task.stages.span('embed'):
+                self.embed_cover(*args)
+
+        task.cover_stage = PipelineStage(
+            f"cover-{bvid}", embed,
+            workers=int(os.getenv('COVER_WORKERS', '2')),
+            max_queue=int(os.getenv('COVER_QUEUE_SIZE', '8'))
+        )
         
         success_count = 0
         skip_count = 0
         error_count = 0
-        
-        for p in range(1, count + 1):
-            url = f"{self.base_url}{bvid}?p={p}"
-            logger.info(f"处理第 {p}/{count} 个视频：{url}")
-            
-            try:
-                # 首先获取视频信息
-                with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                
-                # 检查是否已下载，支持断点续传
-                is_downloaded, existing_file, can_resume = self.is_downloaded(bvid, p, info)
-                if is_downloaded:
-                    logger.info(f"跳过已下载的文件：{existing_file}")
-                    skip_count += 1
-                    yield {
-                        'status': 'skip',
-                        'message': f'已跳过重复文件：{os.path.basename(existing_file)}',
-                        'progress': (p / count) * 100
-                    }
-                    continue
-                elif can_resume:
-                    logger.info(f"发现不完整文件，尝试断点续传：{existing_file}")
-                    ydl_opts['outtmpl'] = existing_file
-                
-                # 下载新文件
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    logger.info("开始下载音频")
-                    info = ydl.extract_info(url, download=True)
-                    
-                    # 获取原始文件名（不带扩展名）
-                    basename = os.path.splitext(ydl.prepare_filename(info))[0]
-                    logger.info(f"基础文件名：{os.path.basename(basename)}")
-                    
-                    # 等待 MP3 文件出现
-                    mp3_filename = f"{basename}.mp3"
-                    if not self.wait_for_file(mp3_filename):
-                        raise FileNotFoundError("MP3 文件生成失败")
-                    
-                    logger.info(f"音频下载完成：{os.path.basename(mp3_filename)}")
-                    
-                    # 获取封面并加入处理队列
-                    cover_data = self.get_cover_image(info)
-                    if cover_data:
-                        self.cover_queue.append((mp3_filename, cover_data))
-                        logger.info(f"封面已加入处理队列：{os.path.basename(mp3_filename)}")
-                    else:
-                        logger.warning("无法获取封面图片")
-
-                    # 如果所有音频下载完成，开始处理封面
-                    if p == count:
-                        logger.info("所有音频下载完成，开始处理封面")
-                        process_covers()
-                    
-                    final_filename = mp3_filename
-                    if rename:
-                        new_filename = os.path.join(base_path, f"{output_dir}-{p}.mp3")
-                        if os.path.exists(mp3_filename):
-                            logger.info(f"重命名文件：{os.path.basename(mp3_filename)} -> {os.path.basename(new_filename)}")
-                            os.rename(mp3_filename, new_filename)
-                            final_filename = new_filename
-                    
-                    # 添加到下载历史
-                    self.add_download_history(bvid, p, final_filename, info)
-                    
-                    # 清理临时文件
+        failed = False
+        retries = RetryScheduler()
+
+        pending = deque(enumerate(parts))
+        waiting = []  # 等待重试的分 P：(可重试时间, 分 P 序号)
+        in_flight = {}  # future -> 分 P 序号
+        finished = {}  # 分 P 序号 -> 结果事件或异常，等待按顺序产出
+        next_index = 0
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"part-{bvid}")
+        try:
+            while pending or waiting or in_flight:
+                # 到期的重试排在未开始的分 P 之前
+                now = time.monotonic()
+                while waiting and waiting[0][0] <= now:
+                    _, index = heapq.heappop(waiting)
+                    pending.appendleft((index, parts[index]))
+
+                # 保持最多 workers 个分 P 同时处理；限流退避期间不派发新的分 P
+                while pending and len(in_flight) < workers and not retries.hold_remaining():
+                    index, part = pending.popleft()
+                    future = executor.submit(self._download_part, task, part)
+                    in_flight[future] = index
+
+                # 等待任一分 P 完成或下一次重试到期，不阻塞其他分 P
+                deadlines = []
+                if waiting:
+                    deadlines.append(waiting[0][0] - now)
+                if pending and len(in_flight) < workers:
+                    deadlines.append(retries.hold_remaining())
+                progress_due = task.progress.next_due()
+                if progress_due is not None:
+                    deadlines.append(progress_due)
+                elif in_flight:
+                    # 进行中的分 P 随时可能上报进度，至少每个节流间隔检查一次
+                    deadlines.append(task.progress.interval)
+                wait_for = max(0.01, min(deadlines)) if deadlines else None
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=wait_for, return_when=FIRST_COMPLETED)
+                else:
+                    done = set()
+                    time.sleep(wait_for)
+                for future in done:
+                    index = in_flight.pop(future)
+                    p = parts[index]['p']
                     try:
-                        # 清理 JSON 文件
-                        info_json = f"{basename}.info.json"
-                        if os.path.exists(info_json):
-                            os.remove(info_json)
-                            logger.info("清理临时 JSON 文件")
-                            
-                        # 清理其他可能的临时文件
-                        for ext in ['.m4a', '.webm', '.part', '.ytdl']:
-                            temp_file = f"{basename}{ext}"
-                            if os.path.exists(temp_file):
-                                os.remove(temp_file)
-                                logger.info(f"清理临时文件：{os.path.basename(temp_file)}")
+                        finished[index] = future.result()
+                        retries.record_success(p)
+                        task.progress.part_done(p)
                     except Exception as e:
-                        logger.warning(f"清理临时文件失败：{str(e)}")
-                    
-                    success_count += 1
+                        delay = None if task.cancelled else retries.record_failure(p, e)
+                        state = retries.parts.get(p, {})
+                        if state.get('error_class') == RATE_LIMIT:
+                            # yt-dlp 遇到的 412/429 同样降低全局请求速率
+                            self.governor.on_response(412)
+                        self.active_tasks[task_id]['retries'] = retries.snapshot()
+                        self.save_task_state(task_id, self.active_tasks[task_id])
+                        if delay is None:
+                            finished[index] = e
+                            task.progress.part_done(p)
+                            continue
+                        task.progress.part_reset(p)
+                        # 重新排队，稍后重试该分 P
+                        if isinstance(e, PartLeased):
+                            message = f'{str(e)}，{delay:.0f} 秒后再检查'
+                            logger.info(message)
+                        else:
+                            message = f'第 {p} 个视频下载失败，{delay:.0f} 秒后重试：{str(e)}'
+                            logger.warning(f"第 {p} 个视频下载失败（{state.get('error_class')}），"
+                                           f"{delay:.1f} 秒后重试：{str(e)}")
+                        heapq.heappush(waiting, (time.monotonic() + delay, index))
+                        self.part_results.inc(status='retry')
+                        yield {
+                            'status': 'retry',
+                            'message': message,
+                            'progress': task.progress.overall(),
+                            'p': p,
+                            'error_class': state.get('error_class'),
+                            'retry_in': round(delay, 1),
+                            'retries_left': state.get('retries_left', 0)
+                        }
+
+                # 按分 P 顺序产出已完成的结果
+                while next_index in finished:
+                    index = next_index
+                    result = finished.pop(index)
+                    next_index += 1
+                    p = parts[index]['p']
+                    self.active_tasks[task_id]['progress'] = task.progress.overall()
+                    self.active_tasks[task_id]['cover_stage'] = task.cover_stage.stats()
+                    self.active_tasks[task_id]['stages'] = task.stages.breakdown()
+                    self.save_task_state(task_id, self.active_tasks[task_id])
+                    if not isinstance(result, Exception):
+                        if result['status'] == 'skip':
+                            skip_count += 1
+                        else:
+                            success_count += 1
+                        result['progress'] = task.progress.overall()
+                        self.part_results.inc(status=result['status'])
+                        yield result
+                        continue
+
+                    # 重试预算用完：记录失败，继续处理其他分 P
+                    e = result
+                    logger.error(f"视频 {p} 下载失败，已达到最大重试次数：{str(e)}")
+                    error_count += 1
+                    failed = True
+                    self.active_tasks[task_id]['error'] = str(e)
+                    self.part_results.inc(status='error')
                     yield {
-                        'status': 'success',
-                        'message': f'已下载：{os.path.basename(final_filename)}',
-                        'progress': (p / count) * 100
+                        'status': 'error',
+                        'message': f'下载失败：{str(e)}',
+                        'progress': task.progress.overall(),
+                        'p': p,
+                        'error_class': retries.parts.get(p, {}).get('error_class'),
+                        'retries_left': 0
                     }
-            except Exception as e:
-                logger.error(f"下载失败：{str(e)}")
-                error_count += 1
-                # 清理失败下载的临时文件
-                try:
-                    if 'basename' in locals():
-                        for ext in ['.mp3', '.m4a', '.webm', '.part', '.ytdl', '.info.json']:
-                            temp_file = f"{basename}{ext}"
-                            if os.path.exists(temp_file):
-                                os.remove(temp_file)
-                                logger.info(f"清理失败下载的临时文件：{os.path.basename(temp_file)}")
-                except Exception as cleanup_error:
-                    logger.error(f"清理临时文件失败：{str(cleanup_error)}")
-                
-                yield {
-                    'status': 'error',
-                    'message': f'下载失败：{str(e)}',
-                    'progress': (p / count) * 100,
-                    'retries_left': 5 - error_count
-                }
-                
-                # 如果重试次数未用完，等待后重试
-                if error_count < 5:
-                    time.sleep(5 * error_count)  # 重试间隔时间逐渐增加
-                    continue
-                else:
-                    logger.error(f"视频 {p} 下载失败，已达到最大重试次数")
-                    # 更新任务状态
-                    self.active_tasks[task_id]['status'] = 'failed'
-                    self.active_tasks[task_id]['end_time'] = datetime.now().isoformat()
-                    self.active_tasks[task_id]['error'] = str(e)
-                    self.save_task_state(task_id, self.active_tasks[task_id])
-                    self.cleanup_task_state(task_id)
-                    break
+
+                # 字节级进度：节流合并后产出，不写磁盘
+                event = task.progress.poll()
+                if event:
+                    yield event
+        finally:
+            # 任务结束或客户端断开时取消尚未开始的分 P
+            executor.shutdown(wait=False, cancel_futures=True)
+            if in_flight:
+                # 中途结束：不再开始新的转码，并终止正在运行的 FFmpeg
+                task.cancelled = True
+                for future in list(task.transcodes):
+                    self.media.scheduler.cancel(future)
+                # 仍在运行的分 P 结束后再关闭解析器
+                def close_when_idle(futures=list(in_flight)):
+                    wait(futures)
+                    task.close()
+                threading.Thread(target=close_when_idle, daemon=True).start()
+            else:
+                task.close()
+
+        # 等待已提交的封面嵌入完成（任务失败时已完成的分 P 同样嵌入封面）
+        if not in_flight:
+            task.cover_stage.join()
+        self.active_tasks[task_id]['cover_stage'] = task.cover_stage.stats()
+        self.active_tasks[task_id]['stages'] = task.stages.breakdown()
+
+        if failed:
+            # 更新任务状态
+            self.active_tasks[task_id]['status'] = 'failed'
+            self.active_tasks[task_id]['end_time'] = datetime.now().isoformat()
+            self.task_durations.observe((datetime.now() - start_time).total_seconds(), status='failed')
+            # 保留最终状态（各分 P 的重试记录、错误和阶段耗时）供 /task_status 查询，
+            # 同一任务再次开始时覆盖
+            self.save_task_state(task_id, self.active_tasks[task_id])
+            # 最后一个事件表明任务失败，调用方据此记录任务状态
+            yield {
+                'status': 'failed',
+                'message': f'下载失败：{error_count}/{count} 个视频未能下载',
+                'progress': task.progress.overall()
+            }
+            return
         
         end_time = datetime.now()
         duration = end_time - start_time
@@ -545,10 +876,15 @@ class BiliDownloader:
         logger.info(f"跳过：{skip_count} 个")
         logger.info(f"失败：{error_count} 个")
         logger.info(f"总耗时：{duration.total_seconds():.1f} 秒")
+        logger.info(f"封面缓存：{self.cover_cache.stats()}")
+        logger.info(f"阶段耗时：{self.active_tasks[task_id]['stages']}")
+        self.task_durations.observe(duration.total_seconds(), status='completed')
 
         # 更新任务状态
         self.active_tasks[task_id]['status'] = 'completed'
         self.active_tasks[task_id]['end_time'] = end_time.isoformat()
         self.active_tasks[task_id]['duration'] = duration.total_seconds()
+        self.active_tasks[task_id]['cover_cache'] = self.cover_cache.stats()
+        if self.leases is not None:
+            self.active_tasks[task_id]['leases'] = self.leases.stats()
         self.save_task_state(task_id, self.active_tasks[task_id])
-        self.cleanup_task_state(task_id)
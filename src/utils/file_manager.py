@@ -4,6 +4,7 @@ import hashlib
 from typing import Dict, Optional
 import logging
 from datetime import datetime
+from .library_reconciler import local_path
 
 logger = logging.getLogger('FileManager')
 
@@ -34,19 +35,23 @@ class FileManager:
         """检查文件是否存在且完整"""
         entry = self.metadata.get(bvid, {})
         file_path = entry.get(f'{file_type}_path')
-        
-        if not file_path or not os.path.exists(file_path):
+        if not file_path:
+            return None
+        # 兼容在其他系统上写入的路径（如 Windows 分隔符），只 stat 一次
+        file_path = local_path(file_path, self.base_path)
+        try:
+            current_size = os.stat(file_path).st_size
+        except OSError:
             return None
             
         file_info = {
             'path': file_path,
-            'size': os.path.getsize(file_path),
+            'size': current_size,
             'completed': False
         }
         
         # 检查元数据中的校验信息
         if entry.get('checksum') and entry.get('file_size'):
-            current_size = os.path.getsize(file_path)
             if current_size == entry['file_size']:
                 if self.validate_file_integrity(file_path, entry['checksum']):
                     file_info['completed'] = True
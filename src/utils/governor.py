@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from typing import Optional
+import logging
+
+logger = logging.getLogger('Governor')
+
+RATE_LIMIT_STATUS = (412, 429)
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量；rate <= 0 表示不限制
+
+    令牌不足时先记账再等待（允许余额为负），单次取用超过容量的数据块也能按速率放行，
+    并且先到的调用方先被放行。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n: float = 1) -> float:
+        """取用 n 个令牌，返回需要等待的秒数"""
+        with self.lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self, n: float = 1) -> float:
+        """取用 n 个令牌，不足时阻塞等待，返回等待的秒数"""
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate: float, burst: Optional[float] = None):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if burst is not None:
+                self.burst = burst
+                self.tokens = min(self.tokens, burst)
+
+
+class Governor:
+    """进程级的请求速率和带宽限制，所有任务共享
+
+    请求速率按 AIMD 自适应：收到 412/429 时减半（不低于下限）并进入冷却期，
+    冷却结束后每个成功响应增加配置速率的 5%，直到恢复配置值。
+    """
+
+    def __init__(self, request_rate: Optional[float] = None, bandwidth: Optional[float] = None,
+                 min_request_rate: Optional[float] = None, cooldown: Optional[float] = None):
+        self.configured_rate = request_rate if request_rate is not None else float(os.getenv('GOVERNOR_REQUEST_RATE', '10'))
+        self.bandwidth = bandwidth if bandwidth is not None else float(os.getenv('GOVERNOR_BANDWIDTH', '0'))
+        self.min_request_rate = min_request_rate if min_request_rate is not None else float(os.getenv('GOVERNOR_MIN_REQUEST_RATE', '0.5'))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv('GOVERNOR_COOLDOWN', '30'))
+        self.requests = TokenBucket(self.configured_rate, burst=max(1.0, self.configured_rate * 2))
+        self.bytes = TokenBucket(self.bandwidth, burst=max(1.0, self.bandwidth))
+        self.lock = threading.Lock()
+        self.request_rate = self.configured_rate
+        self.cooldown_until = 0.0
+        self.counters = {'requests': 0, 'bytes': 0, 'rate_limited': 0,
+                         'request_wait': 0.0, 'bandwidth_wait': 0.0}
+
+    def acquire_request(self):
+        """发出一个请求前调用，超过速率时阻塞"""
+        wait = self.requests.acquire()
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['request_wait'] += wait
+
+    def consume_bytes(self, n: int):
+        """收到 n 字节后调用，超过带宽时阻塞"""
+        if n <= 0:
+            return
+        wait = self.bytes.acquire(n)
+        with self.lock:
+            self.counters['bytes'] += n
+            self.counters['bandwidth_wait'] += wait
+
+    def on_response(self, status: int):
+        """根据响应状态调整请求速率"""
+        if self.configured_rate <= 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if status in RATE_LIMIT_STATUS:
+                self.counters['rate_limited'] += 1
+                new_rate = max(self.min_request_rate, self.request_rate / 2)
+                self.cooldown_until = now + self.cooldown
+            elif status < 400 and now >= self.cooldown_until and self.request_rate < self.configured_rate:
+                new_rate = min(self.configured_rate, self.request_rate + self.configured_rate * 0.05)
+            else:
+                return
+            changed = new_rate != self.request_rate
+            self.request_rate = new_rate
+        if changed:
+            self.requests.set_rate(new_rate, burst=max(1.0, new_rate * 2))
+            if status in RATE_LIMIT_STATUS:
+                logger.warning(f"收到 HTTP {status}，请求速率降至 {new_rate:.2f}/s")
+
+    def state(self) -> dict:
+        """当前速率、令牌余量及累计计数，供监控查询"""
+        with self.lock:
+            state = dict(self.counters)
+            state.update({
+                'request_rate': round(self.request_rate, 3),
+                'configured_request_rate': self.configured_rate,
+                'bandwidth': self.bandwidth,
+                'cooldown_remaining': round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+            })
+        state['request_tokens'] = round(self.requests.tokens, 2)
+        state['bandwidth_tokens'] = round(self.bytes.tokens)
+        state['request_wait'] = round(state['request_wait'], 3)
+        state['bandwidth_wait'] = round(state['bandwidth_wait'], 3)
+        return state
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> Governor:
+    """进程内共享的 Governor 实例"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+        return _governor
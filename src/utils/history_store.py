@@ -0,0 +1,93 @@
+import os
+import json
+from typing import Optional
+import logging
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger('HistoryStore')
+
+HISTORY_COLUMNS = ('bvid', 'p', 'title', 'file_path', 'download_time', 'file_size',
+                   'duration', 'uploader', 'upload_date')
+INSERT_SQL = (f"INSERT OR REPLACE INTO history ({', '.join(HISTORY_COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})")
+
+
+def _values(record: dict) -> tuple:
+    numeric = ('p', 'file_size', 'duration')
+    return tuple(record.get(column) or (0 if column in numeric else '') for column in HISTORY_COLUMNS)
+
+
+class HistoryStore(SQLiteStore):
+    """下载历史记录，按 (bvid, 分 P) 索引，逐条写入"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS history (
+            bvid          TEXT NOT NULL,
+            p             INTEGER NOT NULL,
+            title         TEXT NOT NULL DEFAULT '',
+            file_path     TEXT NOT NULL,
+            download_time TEXT NOT NULL,
+            file_size     INTEGER NOT NULL DEFAULT 0,
+            duration      REAL NOT NULL DEFAULT 0,
+            uploader      TEXT NOT NULL DEFAULT '',
+            upload_date   TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (bvid, p)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    '''
+
+    def get(self, bvid: str, p: int) -> Optional[dict]:
+        """按 BV 号和分 P 查找记录"""
+        row = self.connect().execute('SELECT * FROM history WHERE bvid = ? AND p = ?', (bvid, p)).fetchone()
+        return dict(row) if row else None
+
+    def add(self, record: dict):
+        """写入一条记录，同一分 P 的旧记录被覆盖"""
+        with self.transaction() as conn:
+            conn.execute(INSERT_SQL, _values(record))
+
+    def delete(self, bvid: str, p: int):
+        """删除一条记录"""
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM history WHERE bvid = ? AND p = ?', (bvid, p))
+
+    def records(self) -> list:
+        """所有记录的 bvid、分 P、文件路径和大小（批量核对用）"""
+        return [dict(row) for row in self.connect().execute('SELECT bvid, p, file_path, file_size FROM history')]
+
+    def apply_changes(self, relinked: list, removed: list):
+        """一个事务内批量修改文件路径 [(新路径, bvid, p, 原路径)] 并删除记录 [(bvid, p, 原路径)]
+
+        条件中带原路径：核对期间被重新下载改写的记录不受影响。
+        """
+        if not relinked and not removed:
+            return
+        with self.transaction() as conn:
+            conn.executemany('UPDATE history SET file_path = ? WHERE bvid = ? AND p = ? AND file_path = ?', relinked)
+            conn.executemany('DELETE FROM history WHERE bvid = ? AND p = ? AND file_path = ?', removed)
+
+    def count(self) -> int:
+        """记录总数"""
+        return self.connect().execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def import_json(self, json_path: str):
+        """导入旧版 history.json（只导入一次，原文件保留）"""
+        conn = self.connect()
+        if not os.path.exists(json_path) or conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            # 同一分 P 有多条记录时保留最新下载的
+            records = sorted(entries.values(), key=lambda entry: entry.get('download_time', ''))
+            with self.transaction() as conn:
+                conn.executemany(INSERT_SQL, [_values(record) for record in records
+                                              if record.get('bvid') and record.get('file_path')])
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (json_path,))
+            logger.info(f"已导入 {len(records)} 条下载历史记录：{json_path}")
+        except Exception as e:
+            logger.error(f"导入下载历史记录失败：{str(e)}")
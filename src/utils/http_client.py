@@ -0,0 +1,98 @@
+import os
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+from .governor import Governor, get_governor
+
+logger = logging.getLogger('HttpClient')
+
+# 连接层自动重试的状态码。412/429（风控）不在其中：自动重试不经过 Governor 的令牌桶，
+# 退避交给 Governor（降低全局速率）和 RetryScheduler（分 P 级重试）
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+def _env_flag(name: str, default: str = 'false') -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+class HttpClient:
+    """yt-dlp 之外所有请求共用的 HTTP 客户端
+
+    按主机复用连接池，统一连接/读取超时，对幂等请求按指数退避重试。
+    设置 HTTP2=true 且安装了 httpx[http2] 时，普通 GET 走 HTTP/2。
+    requests.Session 的连接池是线程安全的，多个分 P 并行时共享同一实例。
+    所有请求受进程级 Governor 的请求速率和带宽限制。
+    """
+
+    def __init__(self, headers: dict, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 retries: Optional[int] = None, backoff: Optional[float] = None,
+                 http2: Optional[bool] = None, governor: Optional[Governor] = None):
+        self.headers = headers
+        self.governor = governor or get_governor()
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv('HTTP_POOL_SIZE', '16'))
+        connect_timeout = connect_timeout if connect_timeout is not None else float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+        read_timeout = read_timeout if read_timeout is not None else float(os.getenv('HTTP_READ_TIMEOUT', os.getenv('TIMEOUT', '30')))
+        self.timeout = (connect_timeout, read_timeout)
+        retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', '3'))
+        backoff = backoff if backoff is not None else float(os.getenv('HTTP_BACKOFF', '0.5'))
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.http2_client = None
+        if http2 if http2 is not None else _env_flag('HTTP2'):
+            try:
+                import httpx
+                self.http2_client = httpx.Client(
+                    http2=True,
+                    headers=headers,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                    transport=httpx.HTTPTransport(http2=True, retries=retries),
+                    follow_redirects=True,
+                )
+                logger.info("已启用 HTTP/2")
+            except ImportError:
+                logger.warning("未安装 httpx[http2]，使用 HTTP/1.1")
+
+    def get(self, url: str, **kwargs):
+        """发送 GET 请求，返回带 status_code/content/text/json() 的响应对象
+
+        请求前后经过全局 Governor：按请求速率放行，按响应状态调整速率；
+        非流式响应的正文计入带宽，流式响应由调用方按读取的数据块计入。
+        """
+        stream = kwargs.get('stream')
+        self.governor.acquire_request()
+        if self.http2_client is not None and not stream:
+            kwargs.setdefault('timeout', self.timeout[1])
+            response = self.http2_client.get(url, **kwargs)
+        else:
+            kwargs.setdefault('timeout', self.timeout)
+            response = self.session.get(url, **kwargs)
+        self.governor.on_response(response.status_code)
+        if not stream:
+            self.governor.consume_bytes(len(response.content))
+        return response
+
+    def close(self):
+        """关闭所有连接"""
+        self.session.close()
+        if self.http2_client is not None:
+            self.http2_client.close()
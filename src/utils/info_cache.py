@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+import logging
+
+logger = logging.getLogger('InfoCache')
+
+# 带签名的下载地址中的过期时间（Unix 时间戳）
+DEADLINE_PATTERN = re.compile(r'[?&](?:deadline|expires)=(\d{9,})')
+
+# 下载地址在过期前这么多秒即视为失效，留出下载所需的时间
+EXPIRY_MARGIN = 300
+
+
+def url_deadline(info: dict) -> Optional[float]:
+    """解析结果中各下载地址最早的过期时间；地址不带过期时间时返回 None"""
+    deadlines = []
+    for url in [info.get('url')] + [fmt.get('url') for fmt in info.get('formats') or []]:
+        match = DEADLINE_PATTERN.search(url or '')
+        if match:
+            deadlines.append(int(match.group(1)))
+    return min(deadlines) if deadlines else None
+
+
+class InfoCache:
+    """按 bvid + 分 P 持久化 yt-dlp 解析结果（含下载地址），命中时可直接下载而无需再次解析
+
+    记录在 TTL 到期或其中带签名的下载地址即将过期时失效，以先到者为准。
+    内存中最多保留 max_items 条（LRU），磁盘上过期的文件每隔一个 TTL 清理一次。
+    """
+
+    def __init__(self, cache_dir: str, ttl: Optional[int] = None, max_items: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl if ttl is not None else int(os.getenv('INFO_CACHE_TTL', '3600'))
+        self.max_items = max_items if max_items is not None else int(os.getenv('INFO_CACHE_SIZE', '600'))
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (失效时间, info)，按最近使用排序
+        self.next_sweep = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.sweep()
+
+    def _key(self, bvid: str, p: int) -> str:
+        return f"{bvid}_p{p}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.md5(key.encode('utf-8')).hexdigest()}.json")
+
+    def _remember(self, key: str, entry: tuple):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+
+    def sweep(self) -> int:
+        """删除磁盘上已过 TTL 的缓存文件，返回删除的文件数
+
+        写入时间加 TTL 是记录失效时间的上限，按文件 mtime 判断，无需读取内容；
+        因下载地址提前失效的记录在读取时删除。
+        """
+        now = time.time()
+        self.next_sweep = now + max(self.ttl, 60)
+        removed = 0
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime + self.ttl <= now:
+                            os.remove(entry.path)
+                            removed += 1
+                    except OSError as e:
+                        logger.warning(f"清理解析缓存失败：{entry.name} - {str(e)}")
+        except OSError as e:
+            logger.warning(f"清理解析缓存失败：{str(e)}")
+        if removed:
+            logger.info(f"清理过期的解析缓存：{removed} 个")
+        return removed
+
+    def get(self, bvid: str, p: int) -> Optional[dict]:
+        """读取未过期的解析结果"""
+        if self.ttl <= 0:
+            return None
+        key = self._key(bvid, p)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+        if entry is None:
+            path = self._path(key)
+            try:
+                if not os.path.exists(path):
+                    return None
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if 'expires_at' not in data:
+                    # 旧版缓存不含下载地址，无法直接用于下载
+                    self.invalidate(bvid, p)
+                    return None
+                entry = (data['expires_at'], data['info'])
+            except Exception as e:
+                logger.warning(f"读取解析缓存失败：{key} - {str(e)}")
+                return None
+            self._remember(key, entry)
+
+        expires_at, info = entry
+        if time.time() >= expires_at:
+            self.invalidate(bvid, p)
+            return None
+        return dict(info)
+
+    def put(self, bvid: str, p: int, info: dict):
+        """写入解析结果（应已经过 YoutubeDL.sanitize_info 处理）"""
+        if self.ttl <= 0 or not info:
+            return
+        key = self._key(bvid, p)
+        now = time.time()
+        expires_at = now + self.ttl
+        deadline = url_deadline(info)
+        if deadline is not None:
+            expires_at = min(expires_at, deadline - EXPIRY_MARGIN)
+        if expires_at <= now:
+            return
+        entry = (expires_at, info)
+        path = self._path(key)
+        try:
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'cached_at': now, 'expires_at': expires_at, 'info': info}, f,
+                          ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入解析缓存失败：{key} - {str(e)}")
+        self._remember(key, entry)
+        if now >= self.next_sweep:
+            self.sweep()
+
+    def invalidate(self, bvid: str, p: int):
+        """删除指定分 P 的缓存"""
+        key = self._key(bvid, p)
+        with self.lock:
+            self.memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"删除解析缓存失败：{key} - {str(e)}")
@@ -0,0 +1,282 @@
+import os
+import time
+import queue
+import itertools
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger('JobQueue')
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def is_progress(event: dict) -> bool:
+    """字节级进度事件：是整个任务的进度快照，只保留最新一个，不写入事件日志"""
+    return event.get('status') == 'progress'
+
+
+class Job:
+    """一个下载任务：由工作线程产生事件，任意数量的订阅者按顺序读取
+
+    状态变化事件（开始、重试、跳过、完成、失败）保存在任务自己的事件日志中，订阅者可从
+    任意位置开始读取，断开后重新订阅不会丢失事件，也不影响任务本身。字节级进度事件只保留
+    最新的快照，订阅者读到日志末尾后收到一次当前快照，因此长时间运行的任务占用的内存和
+    重连时重放的事件数都有上限。日志最多保留 max_events 个事件，序号始终从任务开始计数，
+    更早的事件被丢弃后从仍保留的第一个事件开始重放。
+    """
+
+    def __init__(self, job_id: str, bvid: str, output_dir: str, rename: bool = False,
+                 workers: Optional[int] = None, priority: int = 0, profile: bool = False,
+                 max_events: Optional[int] = None):
+        self.job_id = job_id
+        self.bvid = bvid
+        self.output_dir = output_dir
+        self.rename = rename
+        self.workers = workers
+        self.priority = priority
+        self.profile = profile  # 是否为本次执行生成性能分析文件
+        self.status = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        max_events = max_events if max_events is not None else int(os.getenv('JOB_EVENT_LOG', '1000'))
+        self.events = deque(maxlen=max(1, max_events))
+        self.dropped = 0  # 已从日志开头丢弃的事件数
+        self.progress = None  # 最新的进度快照
+        self.progress_version = 0  # 每次更新进度快照加一
+        self.last_progress = 0
+        self.subscribers = 0
+        self.listeners = set()  # 事件循环中的订阅者，有新事件时回调
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+    @property
+    def event_count(self) -> int:
+        """任务开始以来写入日志的事件总数（含已丢弃的），即日志末尾的序号"""
+        return self.dropped + len(self.events)
+
+    def publish(self, event: dict):
+        """追加一个事件（进度事件替换快照）并唤醒所有订阅者"""
+        with self.condition:
+            if is_progress(event):
+                self.progress = event
+                self.progress_version += 1
+            else:
+                if len(self.events) == self.events.maxlen:
+                    self.dropped += 1
+                self.events.append(event)
+            self.last_progress = event.get('progress', self.last_progress)
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        self._notify(listeners)
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        self._notify(listeners)
+
+    @staticmethod
+    def _notify(listeners: list):
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"通知订阅者失败：{str(e)}")
+
+    def add_listener(self, listener: Callable[[], None]):
+        """注册回调，每次有新事件或任务结束时在生产者线程中调用
+
+        供异步订阅者使用：回调只需唤醒事件循环，再通过 events_since() 读取事件，
+        空闲的订阅者不占用线程。
+        """
+        with self.condition:
+            self.listeners.add(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        with self.condition:
+            self.listeners.discard(listener)
+
+    def _read(self, index: int, seen: int) -> list:
+        """第 index 个之后仍在日志中的事件，以 (序号, 事件) 返回，序号为包含该事件在内的日志事件数；
+        进度快照比 seen 版本新时附在最后，序号为日志末尾的序号（需持有 condition）"""
+        start = max(index, self.dropped)
+        pending = [(start + i + 1, event) for i, event in
+                   enumerate(itertools.islice(self.events, start - self.dropped, None))]
+        if self.progress is not None and self.progress_version != seen:
+            pending.append((self.event_count, self.progress))
+        return pending
+
+    def events_since(self, index: int, seen: int = 0):
+        """不阻塞地返回 ([(序号, 事件)], 进度快照版本, 任务是否已结束)
+
+        seen 为订阅者已收到的进度快照版本，快照有更新时附在事件最后。
+        """
+        with self.condition:
+            return self._read(index, seen), self.progress_version, self.finished
+
+    def subscribe(self, since: int = 0, timeout: Optional[float] = None) -> Iterator[Optional[tuple]]:
+        """从第 since 个事件开始依次返回 (序号, 事件)，任务结束且事件读完后停止
+
+        序号可作为断线重连时的 since；读到日志末尾时附带一次最新的进度快照（有更新时）。
+        指定 timeout 时，超过该时间没有新事件会返回 None，调用方可借此发送心跳。
+        """
+        index = max(0, since)
+        seen = 0
+        with self.condition:
+            self.subscribers += 1
+        try:
+            while True:
+                with self.condition:
+                    if index >= self.event_count and seen == self.progress_version and not self.finished:
+                        self.condition.wait(timeout)
+                    pending = self._read(index, seen)
+                    seen = self.progress_version
+                    done = self.finished
+                if not pending:
+                    if done:
+                        return
+                    yield None
+                    continue
+                for item in pending:
+                    yield item
+                index = pending[-1][0]
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+    def summary(self) -> dict:
+        """任务概要（不含事件内容）"""
+        with self.condition:
+            return {
+                'job_id': self.job_id,
+                'bvid': self.bvid,
+                'output_dir': self.output_dir,
+                'rename': self.rename,
+                'priority': self.priority,
+                'profile': self.profile,
+                'status': self.status,
+                'progress': self.last_progress,
+                'events': self.event_count,
+                'subscribers': self.subscribers + len(self.listeners),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobQueue:
+    """服务端下载队列：固定数量的工作线程按优先级执行任务
+
+    同一 (bvid, output_dir) 已在排队或运行时不会重复创建任务，而是返回已有任务。
+    runner(job) 返回事件迭代器，工作线程把每个事件发布给该任务的订阅者；
+    runner 抛出异常或产出 status 为 failed 的事件时任务记为失败。
+    客户端断开只是取消订阅，任务继续在后台执行。
+    """
+
+    def __init__(self, runner: Callable[[Job], Iterable[dict]], workers: Optional[int] = None,
+                 max_finished: Optional[int] = None):
+        self.runner = runner
+        self.workers = workers if workers is not None else int(os.getenv('JOB_WORKERS', '2'))
+        self.max_finished = max_finished if max_finished is not None else int(os.getenv('JOB_HISTORY', '100'))
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()  # job_id -> Job，按提交顺序
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.closed = False
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, self.workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @staticmethod
+    def job_id(bvid: str, output_dir: str) -> str:
+        return f"{bvid}_{output_dir}"
+
+    def submit(self, bvid: str, output_dir: str, rename: bool = False,
+               workers: Optional[int] = None, priority: int = 0, profile: bool = False):
+        """提交任务，返回 (任务, 是否新建)；priority 越大越先执行"""
+        if self.closed:
+            raise RuntimeError("下载队列已关闭")
+        job_id = self.job_id(bvid, output_dir)
+        with self.lock:
+            existing = self.jobs.get(job_id)
+            if existing is not None and not existing.finished:
+                logger.info(f"任务已在队列中：{job_id}（{existing.status}）")
+                return existing, False
+            job = Job(job_id, bvid, output_dir, rename, workers, priority, profile)
+            self.jobs.pop(job_id, None)
+            self.jobs[job_id] = job
+            self._prune()
+            waiting = sum(1 for j in self.jobs.values() if j.status == 'queued')
+        job.publish({'status': 'queued', 'message': f'任务排队中（前方 {waiting - 1} 个）', 'progress': 0})
+        self.queue.put((-priority, next(self.sequence), job))
+        logger.info(f"任务已加入队列：{job_id}，优先级 {priority}")
+        return job, True
+
+    def _prune(self):
+        """只保留最近的若干个已结束任务"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[dict]:
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.summary() for job in jobs]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            jobs = list(self.jobs.values())
+        stats = {'workers': len(self.threads)}
+        for status in ('queued', 'running', 'completed', 'failed'):
+            stats[status] = sum(1 for job in jobs if job.status == status)
+        return stats
+
+    def _worker(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                return
+            with job.condition:
+                job.status = 'running'
+                job.started_at = time.time()
+            logger.info(f"开始执行任务：{job.job_id}")
+            try:
+                failure = None
+                for event in self.runner(job):
+                    job.publish(event)
+                    if event.get('status') == 'failed':
+                        failure = event.get('message') or 'failed'
+                if failure is None:
+                    job._finish('completed')
+                else:
+                    logger.error(f"任务执行失败：{job.job_id} - {failure}")
+                    job._finish('failed', failure)
+            except Exception as e:
+                logger.error(f"任务执行失败：{job.job_id} - {str(e)}")
+                job.publish({'error': str(e)})
+                job._finish('failed', str(e))
+
+    def shutdown(self):
+        """不再接受新任务；工作线程在当前任务完成后退出"""
+        self.closed = True
+        for _ in self.threads:
+            # 优先级最低，排在已有任务之后
+            self.queue.put((float('inf'), next(self.sequence), None))
@@ -0,0 +1,162 @@
+import os
+import time
+import socket
+import threading
+from typing import Optional
+import logging
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger('LeaseStore')
+
+
+class PartLeased(RuntimeError):
+    """分 P 正由其他节点下载，稍后重试（届时对方已完成或租约已过期）"""
+
+    error_class = 'leased'
+
+
+def default_node_id() -> str:
+    return os.getenv('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseStore(SQLiteStore):
+    """多个节点共享下载目录时按 (bvid, 分 P) 分配下载任务
+
+    节点下载前先领取租约，持有期间由后台线程定期续期；节点退出或崩溃后租约过期，
+    其他节点可以重新领取。完成的分 P 保留记录，所有节点的跳过检查都能看到。
+    数据库应放在各节点共同挂载的本地卷上（SQLite 的文件锁在网络文件系统上不可靠）。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS leases (
+            bvid       TEXT NOT NULL,
+            p          INTEGER NOT NULL,
+            owner      TEXT NOT NULL,
+            status     TEXT NOT NULL,
+            expires_at REAL NOT NULL DEFAULT 0,
+            file_path  TEXT NOT NULL DEFAULT '',
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (bvid, p)
+        );
+        CREATE INDEX IF NOT EXISTS idx_leases_expires_at ON leases (status, expires_at);
+    '''
+
+    def __init__(self, db_path: str, owner: Optional[str] = None, ttl: Optional[float] = None):
+        super().__init__(db_path)
+        self.owner = owner or default_node_id()
+        self.ttl = ttl if ttl is not None else float(os.getenv('LEASE_TTL', '120'))
+        self.lock = threading.Lock()
+        self.held = set()  # 本节点持有的 (bvid, p)
+        self.renewer = None
+        self.stopped = threading.Event()
+        self.counters = {'claimed': 0, 'reclaimed': 0, 'contended': 0, 'completed': 0, 'lost': 0}
+
+    def claim(self, bvid: str, p: int) -> bool:
+        """领取分 P；已完成或被其他节点持有且未过期时返回 False"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT owner, status, expires_at FROM leases WHERE bvid = ? AND p = ?',
+                               (bvid, p)).fetchone()
+            if row is not None:
+                if row['status'] == 'done' or (row['owner'] != self.owner and row['expires_at'] > now):
+                    self._count('contended')
+                    return False
+                if row['owner'] != self.owner:
+                    logger.info(f"回收过期租约：{bvid} p{p}（原持有者 {row['owner']}）")
+                    self._count('reclaimed')
+            conn.execute('''
+                INSERT OR REPLACE INTO leases (bvid, p, owner, status, expires_at, file_path, updated_at)
+                VALUES (?, ?, ?, 'claimed', ?, '', ?)
+            ''', (bvid, p, self.owner, now + self.ttl, now))
+        self._count('claimed')
+        with self.lock:
+            self.held.add((bvid, p))
+        self._start_renewer()
+        return True
+
+    def renew(self, bvid: str, p: int) -> bool:
+        """延长本节点持有的租约，租约已被其他节点回收时返回 False"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE leases SET expires_at = ?, updated_at = ?
+                WHERE bvid = ? AND p = ? AND owner = ? AND status = 'claimed'
+            ''', (now + self.ttl, now, bvid, p, self.owner))
+        return cursor.rowcount > 0
+
+    def complete(self, bvid: str, p: int, file_path: str):
+        """标记分 P 已完成，记录文件路径供其他节点跳过"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO leases (bvid, p, owner, status, expires_at, file_path, updated_at)
+                VALUES (?, ?, ?, 'done', 0, ?, ?)
+            ''', (bvid, p, self.owner, file_path, now))
+        self._count('completed')
+        with self.lock:
+            self.held.discard((bvid, p))
+
+    def release(self, bvid: str, p: int):
+        """放弃本节点持有的租约（下载失败时），其他节点可立即领取"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE bvid = ? AND p = ? AND owner = ? AND status = 'claimed'",
+                         (bvid, p, self.owner))
+        with self.lock:
+            self.held.discard((bvid, p))
+
+    def done_path(self, bvid: str, p: int) -> Optional[str]:
+        """分 P 已由任一节点完成时返回文件路径"""
+        row = self.connect().execute("SELECT file_path FROM leases WHERE bvid = ? AND p = ? AND status = 'done'",
+                                     (bvid, p)).fetchone()
+        return row['file_path'] if row else None
+
+    def forget(self, bvid: str, p: int):
+        """删除已完成记录（文件已不存在时），允许重新下载"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE bvid = ? AND p = ? AND status = 'done'", (bvid, p))
+
+    def reclaim_expired(self) -> int:
+        """删除所有已过期的租约，返回删除数量"""
+        with self.transaction() as conn:
+            cursor = conn.execute("DELETE FROM leases WHERE status = 'claimed' AND expires_at <= ?", (time.time(),))
+        if cursor.rowcount:
+            self._count('reclaimed', cursor.rowcount)
+        return cursor.rowcount
+
+    def _count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def _start_renewer(self):
+        with self.lock:
+            if self.renewer is not None:
+                return
+            self.renewer = threading.Thread(target=self._renew_loop, name='lease-renewer', daemon=True)
+        self.renewer.start()
+
+    def _renew_loop(self):
+        """每 1/3 个租期续期一次本节点持有的全部租约"""
+        while not self.stopped.wait(self.ttl / 3):
+            with self.lock:
+                held = list(self.held)
+            for bvid, p in held:
+                try:
+                    if not self.renew(bvid, p):
+                        logger.warning(f"租约已失效：{bvid} p{p}")
+                        self._count('lost')
+                        with self.lock:
+                            self.held.discard((bvid, p))
+                except Exception as e:
+                    logger.error(f"续期租约失败：{bvid} p{p} - {str(e)}")
+
+    def stats(self) -> dict:
+        """本节点的领取/回收/冲突计数及当前持有的租约数"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['held'] = len(self.held)
+        stats['owner'] = self.owner
+        return stats
+
+    def close(self):
+        self.stopped.set()
+        super().close()
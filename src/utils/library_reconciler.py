@@ -0,0 +1,214 @@
+import os
+import re
+import functools
+import stat
+import time
+import threading
+from collections import defaultdict
+from typing import Optional
+import logging
+from .history_store import HistoryStore
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger('LibraryReconciler')
+
+# 建立索引的文件类型（与 MediaProcessor 的输出格式一致）
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.opus')
+
+# 目录在扫描前这么多秒内修改过时不缓存其 mtime：同一时间刻度内的后续修改无法通过 mtime 发现
+MTIME_GRACE = 2.0
+
+WINDOWS_DRIVE = re.compile(r'^[A-Za-z]:/')
+
+
+@functools.lru_cache(maxsize=8)
+def _root_prefix(root: str, cwd: str) -> tuple:
+    root = os.path.normpath(os.path.join(cwd, root)).replace(os.sep, '/')
+    return root.rstrip('/') + '/', os.path.basename(root).lower()
+
+
+def normalize_path(path: str, root: str) -> Optional[str]:
+    """把历史记录中的文件路径转换为相对下载目录的路径（以 / 分隔），不在下载目录下时返回 None
+
+    兼容在 Windows 上写入的记录：反斜杠分隔、带盘符、下载目录名大小写不同
+    （如 audiobooks\\书名\\1.mp3 对应 Audiobooks/书名/1.mp3）。
+    """
+    cwd = os.getcwd()
+    prefix, name = _root_prefix(root, cwd)
+    posix = path.replace('\\', '/')
+    drive = WINDOWS_DRIVE.match(posix)
+    if not drive:
+        # 批量核对时每条记录都要转换，这里只做字符串处理，不用 relpath
+        full = os.path.normpath(os.path.join(cwd, posix)).replace(os.sep, '/')
+        if full.startswith(prefix):
+            return full[len(prefix):]
+    # 不在本机下载目录下：按路径中最后一个与下载目录同名的目录截取
+    parts = [part for part in posix[len(drive.group(0)) if drive else 0:].split('/') if part not in ('', '.')]
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i].lower() == name:
+            rest = parts[i + 1:]
+            return '/'.join(rest) if rest and '..' not in rest else None
+    return None
+
+
+def local_path(path: str, root: str) -> str:
+    """历史记录中的路径在本机上的位置：下载目录下的文件转换为 root 下的路径，其余原样返回"""
+    relative = normalize_path(path, root)
+    return os.path.join(root, *relative.split('/')) if relative else path
+
+
+class LibraryIndex(SQLiteStore):
+    """下载目录中音频文件的索引，按目录记录 mtime，未变化的目录再次扫描时跳过"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS dirs (
+            path     TEXT PRIMARY KEY,
+            parent   TEXT,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent);
+        CREATE TABLE IF NOT EXISTS files (
+            path     TEXT PRIMARY KEY,
+            dir      TEXT NOT NULL,
+            size     INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+    '''
+
+    def scan(self, root: str, full: bool = False) -> dict:
+        """增量扫描 root，更新索引；full=True 时忽略 mtime 缓存重新列出所有目录
+
+        目录的 mtime 只在其中增删、重命名条目时变化，文件原地改写不会被发现；
+        下载流程总是先写临时文件再重命名，因此不受影响。
+        """
+        conn = self.connect()
+        cached, children = {}, defaultdict(list)
+        for row in conn.execute('SELECT path, parent, mtime_ns FROM dirs'):
+            cached[row['path']] = row['mtime_ns']
+            children[row['parent']].append(row['path'])
+
+        started = time.time()
+        seen, listed = set(), []
+        stack = [('', os.stat(root).st_mtime_ns)]
+        while stack:
+            relative, mtime = stack.pop()
+            seen.add(relative)
+            if not full and cached.get(relative) == mtime:
+                # 目录未变化：子目录列表沿用索引，只检查子目录自身的 mtime
+                for child in children[relative]:
+                    try:
+                        st = os.stat(os.path.join(root, child))
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append((child, st.st_mtime_ns))
+                continue
+
+            files = []
+            try:
+                with os.scandir(os.path.join(root, relative)) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        path = f"{relative}/{entry.name}" if relative else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and entry.is_file():
+                            st = entry.stat()
+                            files.append((path, relative, st.st_size, st.st_mtime_ns))
+            except OSError as e:
+                logger.warning(f"无法读取目录 {relative or root}：{str(e)}")
+                seen.discard(relative)
+                continue
+            listed.append((relative, mtime, files))
+
+        removed = [path for path in cached if path not in seen]
+        with self.transaction() as conn:
+            for relative, mtime, files in listed:
+                if started - mtime / 1e9 < MTIME_GRACE:
+                    mtime = 0
+                parent = relative.rpartition('/')[0] if relative else None
+                conn.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)',
+                             (relative, parent, mtime))
+                conn.execute('DELETE FROM files WHERE dir = ?', (relative,))
+                conn.executemany('INSERT OR REPLACE INTO files (path, dir, size, mtime_ns) VALUES (?, ?, ?, ?)', files)
+            for relative in removed:
+                conn.execute('DELETE FROM dirs WHERE path = ?', (relative,))
+                conn.execute('DELETE FROM files WHERE dir = ?', (relative,))
+        return {'dirs': len(seen), 'dirs_scanned': len(listed), 'dirs_removed': len(removed)}
+
+    def files(self) -> dict:
+        """索引中的所有文件：相对路径 -> 大小"""
+        return {row['path']: row['size'] for row in self.connect().execute('SELECT path, size FROM files')}
+
+
+class LibraryReconciler:
+    """批量核对下载历史和下载目录中的文件
+
+    增量扫描下载目录后，把路径写法不同（Windows 分隔符、目录名大小写）但文件仍在的记录改写为
+    本机路径，删除文件已不存在的记录，所有修改在一个事务中完成。启动时在后台运行一次，
+    之后可通过 /reconcile 手动触发。
+    """
+
+    def __init__(self, history: HistoryStore, root: str, index_path: str):
+        self.history = history
+        self.root = root
+        self.index = LibraryIndex(index_path)
+        self.lock = threading.Lock()
+        self.last = None
+
+    def reconcile(self, full: bool = False) -> dict:
+        """扫描并核对一次，返回统计；同一时间只运行一次"""
+        with self.lock:
+            if not os.path.isdir(self.root):
+                # 下载目录不存在（如共享卷未挂载）时不能据此删除历史记录
+                logger.warning(f"下载目录不存在，跳过核对：{self.root}")
+                self.last = {'status': 'skipped', 'root': self.root, 'finished_at': time.time()}
+                return self.last
+
+            start = time.perf_counter()
+            result = self.index.scan(self.root, full)
+            files = self.index.files()
+            folded = None
+            base = os.path.join(self.root, '')
+            relinked, missing = [], []
+            records = self.history.records()
+            for record in records:
+                relative = normalize_path(record['file_path'], self.root)
+                if relative is None:
+                    # 下载目录之外的文件不在索引中，逐个检查
+                    if not os.path.exists(record['file_path']):
+                        missing.append(record)
+                    continue
+                if relative not in files:
+                    if folded is None:
+                        folded = {path.lower(): path for path in files}
+                    relative = folded.get(relative.lower())
+                if relative is None:
+                    missing.append(record)
+                    continue
+                path = base + relative.replace('/', os.sep)
+                if path != record['file_path']:
+                    relinked.append((path, record['bvid'], record['p'], record['file_path']))
+
+            # 扫描之后才完成的下载也可能出现在历史记录中，删除前逐条确认
+            removed = [(record['bvid'], record['p'], record['file_path']) for record in missing
+                       if not os.path.exists(record['file_path'])]
+            self.history.apply_changes(relinked, removed)
+
+            result.update({
+                'status': 'done',
+                'root': self.root,
+                'files': len(files),
+                'records': len(records),
+                'relinked': len(relinked),
+                'removed': len(removed),
+                'elapsed': round(time.perf_counter() - start, 3),
+                'finished_at': time.time(),
+            })
+            self.last = result
+            logger.info(f"下载目录核对完成：{result['files']} 个文件（重新列出 {result['dirs_scanned']}/"
+                        f"{result['dirs']} 个目录），{result['records']} 条记录，修正路径 {result['relinked']} 条，"
+                        f"删除 {result['removed']} 条，耗时 {result['elapsed']:.2f} 秒")
+            return result
@@ -1,107 +1,387 @@
 import os
+import base64
 import subprocess
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, Future
 import mutagen
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, APIC
-from typing import Optional
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.oggopus import OggOpus
+from mutagen.flac import Picture
+from typing import Callable, Optional, List
 import logging
 
 logger = logging.getLogger('MediaProcessor')
 
+
+def available_cpus() -> int:
+    """当前进程可用的 CPU 数，考虑 CPU 亲和性和容器的 cgroup 配额"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2: "配额 周期"，无限制时为 "max 周期"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if quota > 0:
+                cpus = min(cpus, max(1, quota // period))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+
+@functools.lru_cache(maxsize=None)
+def probe_ffmpeg(ffmpeg_path: str) -> dict:
+    """探测 FFmpeg 版本和可用编码器（每个路径只执行一次）"""
+    try:
+        version = subprocess.run([ffmpeg_path, '-hide_banner', '-version'], check=True,
+                                 capture_output=True, text=True).stdout.splitlines()[0]
+        encoders_output = subprocess.run([ffmpeg_path, '-hide_banner', '-encoders'], check=True,
+                                         capture_output=True, text=True).stdout
+    except FileNotFoundError as e:
+        logger.error(f"FFmpeg未找到: {str(e)}")
+        raise RuntimeError(f"FFmpeg未安装或不可用: {str(e)}")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg不可用: {str(e)}") from e
+
+    encoders = set()
+    for line in encoders_output.splitlines():
+        parts = line.split()
+        # 编码器行形如 " A....D libmp3lame  libmp3lame MP3 ..."
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+    logger.info(f"FFmpeg: {version}")
+    return {'version': version, 'encoders': encoders}
+
+
+class TranscodeCancelled(RuntimeError):
+    """转码任务被取消"""
+
+
+class TranscodeScheduler:
+    """FFmpeg 进程池：同时运行的进程数不超过可用 CPU 数
+
+    submit() 返回 Future；cancel() 可取消排队中的任务或终止正在运行的进程。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv('TRANSCODE_WORKERS', '0')) or available_cpus()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ffmpeg')
+        self.lock = threading.Lock()
+        self.processes = {}  # Future -> 正在运行的 Popen
+        self.cancelled = set()
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        logger.info(f"转码进程池大小：{self.max_workers}")
+
+    def submit(self, cmd: List[str], nice: int = 0,
+               on_output: Optional[Callable[[str], None]] = None) -> Future:
+        """提交一条 FFmpeg 命令，nice 为进程优先级调整值（仅 POSIX 有效）
+
+        指定 on_output 时逐行回调进程的标准输出（用于 -progress pipe:1）。
+        """
+        future = Future()
+        with self.lock:
+            self.submitted += 1
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._run(future, cmd, nice, on_output))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.completed += 1
+
+        self.executor.submit(run)
+        return future
+
+    def _run(self, future: Future, cmd: List[str], nice: int,
+             on_output: Optional[Callable[[str], None]] = None) -> int:
+        preexec_fn = (lambda: os.nice(nice)) if nice and hasattr(os, 'nice') else None
+        with self.lock:
+            if future in self.cancelled:
+                raise TranscodeCancelled(' '.join(cmd))
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE if on_output else subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, preexec_fn=preexec_fn)
+            self.processes[future] = process
+            self.running += 1
+        try:
+            if on_output:
+                # 标准错误在后台线程读取，避免管道写满阻塞 FFmpeg
+                stderr_chunks = []
+                reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+                reader.start()
+                for line in process.stdout:
+                    try:
+                        on_output(line.decode('utf-8', 'replace').strip())
+                    except Exception as e:
+                        logger.warning(f"转码进度回调失败：{str(e)}")
+                process.wait()
+                reader.join()
+                stderr = b''.join(stderr_chunks)
+            else:
+                _, stderr = process.communicate()
+        finally:
+            with self.lock:
+                self.processes.pop(future, None)
+                self.running -= 1
+                cancelled = future in self.cancelled
+                self.cancelled.discard(future)
+        if cancelled:
+            raise TranscodeCancelled(' '.join(cmd))
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd,
+                                                stderr=stderr.decode('utf-8', 'replace'))
+        return process.returncode
+
+    def cancel(self, future: Future) -> bool:
+        """取消任务：排队中的直接取消，运行中的终止 FFmpeg 进程"""
+        if future.cancel():
+            return True
+        with self.lock:
+            if future.done():
+                return False
+            self.cancelled.add(future)
+            process = self.processes.get(future)
+        if process is not None:
+            process.terminate()
+        return True
+
+    def stats(self) -> dict:
+        """进程池大小、运行中和排队中的任务数"""
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'running': self.running,
+                'queued': self.submitted - self.completed - self.running,
+                'completed': self.completed,
+            }
+
+    def shutdown(self, cancel_pending: bool = True):
+        """关闭进程池"""
+        self.executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+
+# 输出格式：扩展名 -> 重新编码时使用的编码器、可直接复制的源编码，
+# 以及 FFmpeg 能否在封装时写入封面（Ogg 不支持附加图片流）
+OUTPUT_FORMATS = {
+    'mp3': {'encoder': 'libmp3lame', 'copy_codecs': ('mp3',), 'attached_pic': True},
+    'm4a': {'encoder': 'aac', 'copy_codecs': ('mp4a', 'aac', 'alac', 'flac', 'ec-3', 'ac-3'), 'attached_pic': True},
+    'opus': {'encoder': 'libopus', 'copy_codecs': ('opus',), 'attached_pic': False},
+}
+
+METADATA_FIELDS = ('title', 'artist', 'album', 'date')
+
+
+def can_stream_copy(output_format: str, acodec: Optional[str]) -> bool:
+    """源音频编码能否不经重新编码直接封装到目标格式"""
+    if not acodec or output_format not in OUTPUT_FORMATS:
+        return False
+    return acodec.lower().split('.')[0] in OUTPUT_FORMATS[output_format]['copy_codecs']
+
+
 class MediaProcessor:
-    def __init__(self, ffmpeg_path: str = 'ffmpeg'):
+    def __init__(self, ffmpeg_path: str = 'ffmpeg', scheduler: Optional[TranscodeScheduler] = None):
         self.ffmpeg_path = ffmpeg_path
-        
+        self.scheduler = scheduler or TranscodeScheduler()
+
+    def probe(self) -> dict:
+        """FFmpeg 能力探测结果（缓存）"""
+        return probe_ffmpeg(self.ffmpeg_path)
+
+    def transcode(self, input_path: str, output_path: str, output_format: str = 'mp3',
+                  bitrate: Optional[str] = None, nice: int = 0, copy: bool = False,
+                  metadata: Optional[dict] = None, cover_path: Optional[str] = None,
+                  progress: Optional[Callable[[float], None]] = None) -> Future:
+        """提交转码任务；copy=True 时只复制音频流（remux），不重新编码
+
+        MP3 未指定 bitrate 时使用最高质量 VBR。metadata 和 cover_path 在同一次
+        FFmpeg 输出中写入标签和封面，之后无需再用 mutagen 改写文件；
+        不支持附加图片的格式（opus）忽略 cover_path。progress 以已处理的音频秒数回调。
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式：{output_format}")
+        capabilities = self.probe()
+        attach_cover = bool(cover_path) and OUTPUT_FORMATS[output_format]['attached_pic']
+        cmd = [
+            self.ffmpeg_path,
+            '-hide_banner',
+            '-loglevel', 'error',
+            '-i', input_path,
+        ]
+        if attach_cover:
+            cmd += ['-i', cover_path, '-map', '0:a', '-map', '1:v',
+                    '-c:v', 'copy', '-disposition:v', 'attached_pic',
+                    '-metadata:s:v', 'title=Cover', '-metadata:s:v', 'comment=Cover (front)']
+        else:
+            cmd += ['-map', '0:a', '-vn']
+        if copy:
+            cmd += ['-c:a', 'copy']
+        else:
+            encoder = OUTPUT_FORMATS[output_format]['encoder']
+            if encoder not in capabilities['encoders']:
+                raise RuntimeError(f"FFmpeg 不支持编码器：{encoder}")
+            cmd += ['-c:a', encoder]
+            if bitrate:
+                cmd += ['-b:a', bitrate]
+            elif output_format == 'mp3':
+                cmd += ['-q:a', '0']
+        # 源文件自带的标签不带入输出，只写入 metadata 中的字段
+        cmd += ['-map_metadata', '-1']
+        for field in METADATA_FIELDS:
+            if metadata and metadata.get(field):
+                cmd += ['-metadata', f"{field}={metadata[field]}"]
+        if output_format == 'mp3':
+            cmd += ['-id3v2_version', '3']  # ID3v2.3 兼容性最好
+        elif output_format == 'm4a':
+            cmd += ['-movflags', '+faststart']
+        on_output = None
+        if progress:
+            cmd += ['-progress', 'pipe:1', '-nostats']
+
+            def on_output(line: str):
+                # out_time_us（旧版本为 out_time_ms，单位同为微秒）
+                key, _, value = line.partition('=')
+                if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                    progress(int(value) / 1000000)
+        cmd += ['-y', output_path]
+        return self.scheduler.submit(cmd, nice, on_output)
+
     def extract_audio(self,
                      input_path: str,
                      output_path: str,
                      metadata: Optional[dict] = None,
-                     cover_path: Optional[str] = None) -> bool:
+                     cover_path: Optional[str] = None,
+                     bitrate: Optional[str] = None,
+                     nice: int = 0) -> bool:
         """转换音频格式并添加元数据"""
         try:
-            # 检查ffmpeg可用性
-            subprocess.run([self.ffmpeg_path, '-version'], check=True, 
-                          stdout=subprocess.DEVNULL, 
-                          stderr=subprocess.DEVNULL)
-            
-            # 转码为MP3
-            cmd = [
-                self.ffmpeg_path,
-                '-hide_banner',
-                '-loglevel', 'error',
-                '-i', input_path,
-                '-q:a', '0',
-                '-map', 'a',
-                '-vn',
-                '-y',
-                output_path
-            ]
-            subprocess.run(cmd, check=True)
-            
-            # 添加元数据和封面
-            if metadata or cover_path:
+            # 按输出文件扩展名转码
+            output_format = os.path.splitext(output_path)[1].lstrip('.').lower()
+            if output_format in OUTPUT_FORMATS and cover_path and not OUTPUT_FORMATS[output_format]['attached_pic']:
+                # FFmpeg 无法写入封面的格式，转码后一次性保存全部标签
+                self.transcode(input_path, output_path, output_format, bitrate, nice).result()
                 self.add_metadata(output_path, metadata, cover_path)
+            else:
+                self.transcode(input_path, output_path, output_format, bitrate, nice,
+                               metadata=metadata, cover_path=cover_path).result()
                 
             return True
-        except FileNotFoundError as e:
-            logger.error(f"FFmpeg未找到: {str(e)}")
-            raise RuntimeError(f"FFmpeg未安装或不可用: {str(e)}")
         except subprocess.CalledProcessError as e:
             logger.error(f"FFmpeg转换失败: {str(e)}")
-            raise RuntimeError(f"音频转换失败: {str(e)}") from e
+            raise RuntimeError(f"音频转换失败: {e.stderr or str(e)}") from e
+        except RuntimeError:
+            raise
         except Exception as e:
             logger.error(f"元数据处理失败: {str(e)}")
         return False
 
     def add_metadata(self, 
-                    mp3_path: str,
+                    audio_path: str,
                     metadata: Optional[dict],
-                    cover_path: Optional[str] = None):
-        """添加ID3元数据"""
+                    cover_path: Optional[str] = None,
+                    cover_data: Optional[bytes] = None):
+        """添加元数据和封面，按扩展名写入 ID3（MP3）、MP4 或 Vorbis Comment（Opus）标签"""
         try:
-            audio = MP3(mp3_path, ID3=ID3)
-            
-            # 创建或更新标签
-            if audio.tags is None:
-                audio.add_tags()
-                
-            tags = audio.tags
-            
-            # 基础元数据
-            if metadata:
-                tags.add(TIT2(encoding=3, text=metadata.get('title', '')))
-                tags.add(TPE1(encoding=3, text=metadata.get('artist', '')))
-                tags.add(TALB(encoding=3, text=metadata.get('album', '')))
-                tags.add(TDRC(encoding=3, text=metadata.get('date', '')))
-                
+            mime_type = 'image/jpeg'
             # 添加封面（支持多种格式）
             if cover_path and os.path.exists(cover_path):
                 _, ext = os.path.splitext(cover_path)
                 mime_type = 'image/jpeg' if ext.lower() in ('.jpg', '.jpeg') else 'image/png'
-                
                 with open(cover_path, 'rb') as f:
                     cover_data = f.read()
-                    tags.add(
-                        APIC(
-                            encoding=3,
-                            mime=mime_type,
-                            type=3,  # 封面图片
-                            desc='Cover',
-                            data=cover_data
-                        )
-                    )
-                logger.info(f"成功添加封面: {os.path.basename(cover_path)}")
-                
-            audio.save(v2_version=3)  # 强制保存ID3v2.3格式确保兼容性
+
+            ext = os.path.splitext(audio_path)[1].lower()
+            if ext == '.m4a':
+                self._tag_mp4(audio_path, metadata, cover_data, mime_type)
+            elif ext == '.opus':
+                self._tag_opus(audio_path, metadata, cover_data, mime_type)
+            else:
+                self._tag_mp3(audio_path, metadata, cover_data, mime_type)
+            if cover_data:
+                logger.info(f"成功添加封面: {os.path.basename(audio_path)}")
         except Exception as e:
             logger.error(f"元数据添加失败: {str(e)}")
             raise RuntimeError(f"无法添加元数据: {str(e)}") from e
+
+    def _tag_mp3(self, path: str, metadata: Optional[dict], cover_data: Optional[bytes], mime_type: str):
+        audio = MP3(path, ID3=ID3)
+        
+        # 创建或更新标签
+        if audio.tags is None:
+            audio.add_tags()
+            
+        tags = audio.tags
+        
+        # 基础元数据
+        if metadata:
+            tags.add(TIT2(encoding=3, text=metadata.get('title', '')))
+            tags.add(TPE1(encoding=3, text=metadata.get('artist', '')))
+            tags.add(TALB(encoding=3, text=metadata.get('album', '')))
+            tags.add(TDRC(encoding=3, text=metadata.get('date', '')))
+            
+        if cover_data:
+            tags.add(
+                APIC(
+                    encoding=3,
+                    mime=mime_type,
+                    type=3,  # 封面图片
+                    desc='Cover',
+                    data=cover_data
+                )
+            )
+            
+        audio.save(v2_version=3)  # 强制保存ID3v2.3格式确保兼容性
+
+    def _tag_mp4(self, path: str, metadata: Optional[dict], cover_data: Optional[bytes], mime_type: str):
+        audio = MP4(path)
+        if audio.tags is None:
+            audio.add_tags()
+        if metadata:
+            for key, field in (('\xa9nam', 'title'), ('\xa9ART', 'artist'),
+                               ('\xa9alb', 'album'), ('\xa9day', 'date')):
+                audio.tags[key] = [metadata.get(field, '')]
+        if cover_data:
+            image_format = MP4Cover.FORMAT_JPEG if mime_type == 'image/jpeg' else MP4Cover.FORMAT_PNG
+            audio.tags['covr'] = [MP4Cover(cover_data, imageformat=image_format)]
+        audio.save()
+
+    def _tag_opus(self, path: str, metadata: Optional[dict], cover_data: Optional[bytes], mime_type: str):
+        audio = OggOpus(path)
+        if metadata:
+            for field in METADATA_FIELDS:
+                audio[field] = [metadata.get(field, '')]
+        if cover_data:
+            # Vorbis Comment 中的封面为 base64 编码的 FLAC PICTURE 块
+            picture = Picture()
+            picture.type = 3  # 封面图片
+            picture.mime = mime_type
+            picture.desc = 'Cover'
+            picture.data = cover_data
+            audio['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+        audio.save()
         
     @staticmethod
     def validate_audio(file_path: str) -> bool:
         """验证音频文件完整性"""
         try:
-            audio = MP3(file_path)
+            audio = mutagen.File(file_path)
             return audio.info.length > 0
         except:
             return False
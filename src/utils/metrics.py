@@ -0,0 +1,240 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import logging
+
+logger = logging.getLogger('Metrics')
+
+# 单个分 P 处理流程中计时的阶段
+STAGES = ('resolve', 'download', 'transcode', 'cover_fetch', 'cover_process', 'embed', 'rename', 'history')
+
+# 阶段耗时直方图的桶上界（秒），覆盖从毫秒级的历史写入到小时级的长音频下载
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in labels]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数，按标签值分组"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}  # 标签值元组 -> 计数
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram:
+    """按桶统计观测值的分布，同时记录总和与次数"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.series = {}  # 标签值元组 -> [各桶计数, 总和, 次数]
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            return series[2] if series else 0
+
+    def render(self) -> list:
+        with self.lock:
+            series = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self.series.items())
+        lines = []
+        for key, (counts, total, n) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {n}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标集合，按 Prometheus 文本格式导出
+
+    计数和直方图由各模块直接更新；其他模块已有的状态（限速器、任务队列等）
+    通过 collector 回调在导出时读取，作为 gauge 输出。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标类型冲突：{name}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def register_collector(self, collector: Callable[[], Dict[str, Tuple[str, float]]]):
+        """collector() 返回 {指标名: (说明, 数值)}，导出时调用"""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+            collectors = list(self.collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.error(f"读取指标失败：{str(e)}")
+                continue
+            for name, (help, value) in sorted(gauges.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """进程内共享的指标集合"""
+    return _registry
+
+
+_current = threading.local()
+
+
+class StageTimer:
+    """一个下载任务内各阶段的耗时汇总，每次计时同时计入全局直方图
+
+    工作线程开始处理某个分 P 前调用 bind()，之后同一线程中不直接持有任务对象的代码
+    （如封面缓存）也能通过模块级的 span() 把耗时记到该任务上。
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        registry = registry or get_registry()
+        self.durations = registry.histogram('bili_stage_duration_seconds', '分 P 处理各阶段耗时（秒）', ('stage',))
+        self.errors = registry.counter('bili_stage_errors_total', '分 P 处理各阶段失败次数', ('stage',))
+        self.lock = threading.Lock()
+        self.stages = {}  # 阶段 -> {'count', 'total', 'max', 'errors'}
+
+    def bind(self):
+        """把当前线程之后的 span() 计时归到本任务"""
+        _current.timer = self
+
+    def record(self, stage: str, seconds: float, ok: bool = True):
+        self.durations.observe(seconds, stage=stage)
+        if not ok:
+            self.errors.inc(stage=stage)
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0})
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            if not ok:
+                entry['errors'] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        """计时一个阶段；阶段内抛出异常时计为失败"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(stage, time.perf_counter() - start, ok)
+
+    def breakdown(self) -> dict:
+        """各阶段的次数、总耗时、平均和最大耗时（秒），按 STAGES 顺序"""
+        with self.lock:
+            stages = {stage: dict(entry) for stage, entry in self.stages.items()}
+        ordered = sorted(stages, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES))
+        return {stage: {
+            'count': stages[stage]['count'],
+            'total': round(stages[stage]['total'], 3),
+            'avg': round(stages[stage]['total'] / stages[stage]['count'], 3),
+            'max': round(stages[stage]['max'], 3),
+            'errors': stages[stage]['errors'],
+        } for stage in ordered}
+
+
+@contextmanager
+def span(stage: str):
+    """计时一个阶段，记到当前线程绑定的任务上；未绑定时只计入全局直方图"""
+    timer = getattr(_current, 'timer', None)
+    if timer is None:
+        timer = StageTimer()
+    with timer.span(stage):
+        yield
@@ -0,0 +1,100 @@
+import time
+import queue
+import threading
+from typing import Callable
+import logging
+
+logger = logging.getLogger('Pipeline')
+
+_STOP = object()
+
+
+class PipelineStage:
+    """异步处理阶段：有界队列 + 固定数量的工作线程
+
+    队列满时 submit() 阻塞，形成背压；stats() 返回队列深度和阶段耗时，
+    耗时分为排队等待（wait）和实际处理（run）两部分。
+    """
+
+    def __init__(self, name: str, handler: Callable, workers: int = 1, max_queue: int = 0):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.in_progress = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+        self.closed = False
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, *args):
+        """提交一个任务，队列已满时等待"""
+        if self.closed:
+            raise RuntimeError(f"处理阶段已关闭：{self.name}")
+        with self.lock:
+            self.queued += 1
+        self.queue.put((time.monotonic(), args))
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            submitted_at, args = item
+            started_at = time.monotonic()
+            with self.lock:
+                self.queued -= 1
+                self.in_progress += 1
+            ok = True
+            try:
+                self.handler(*args)
+            except Exception as e:
+                ok = False
+                logger.error(f"{self.name} 处理失败：{str(e)}")
+            finished_at = time.monotonic()
+            with self.lock:
+                self.in_progress -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.wait_total += started_at - submitted_at
+                self.run_total += finished_at - started_at
+                self.run_max = max(self.run_max, finished_at - started_at)
+
+    def close(self):
+        """不再接受新任务，已排队的任务处理完后工作线程退出"""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.threads:
+            self.queue.put(_STOP)
+
+    def join(self):
+        """关闭并等待所有已提交的任务完成"""
+        self.close()
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self) -> dict:
+        """队列深度、完成数量及平均/最大耗时（秒）"""
+        with self.lock:
+            done = self.completed + self.failed
+            return {
+                'queue_depth': self.queued,
+                'in_progress': self.in_progress,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_wait': self.wait_total / done if done else 0.0,
+                'avg_run': self.run_total / done if done else 0.0,
+                'max_run': self.run_max,
+            }
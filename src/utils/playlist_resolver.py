@@ -0,0 +1,61 @@
+import os
+import time
+import threading
+from typing import Optional
+import logging
+from .http_client import HttpClient
+
+logger = logging.getLogger('PlaylistResolver')
+
+
+class PlaylistResolver:
+    """通过视频信息接口一次性获取全部分 P 的 cid、标题和时长"""
+
+    def __init__(self, http: HttpClient, api_base: Optional[str] = None, ttl: Optional[int] = None):
+        self.http = http
+        self.api_base = (api_base or os.getenv('BILIBILI_API_BASE', 'https://api.bilibili.com')).rstrip('/')
+        self.ttl = ttl if ttl is not None else int(os.getenv('PLAYLIST_CACHE_TTL', '600'))
+        self.lock = threading.Lock()
+        self.cache = {}  # bvid -> (cached_at, playlist)
+
+    def resolve(self, bvid: str) -> dict:
+        """返回视频标题、封面、UP 主及按分 P 排序的分 P 列表"""
+        with self.lock:
+            entry = self.cache.get(bvid)
+        if entry and time.time() - entry[0] <= self.ttl:
+            return entry[1]
+
+        url = f"{self.api_base}/x/web-interface/view"
+        response = self.http.get(url, params={'bvid': bvid})
+        if response.status_code != 200:
+            raise RuntimeError(f"获取分 P 列表失败：HTTP {response.status_code}")
+        payload = response.json()
+        if payload.get('code') != 0:
+            raise RuntimeError(f"获取分 P 列表失败：{payload.get('message', payload.get('code'))}")
+
+        data = payload.get('data') or {}
+        pages = data.get('pages') or [{'page': 1, 'cid': data.get('cid'), 'part': data.get('title', ''),
+                                       'duration': data.get('duration', 0)}]
+        playlist = {
+            'bvid': data.get('bvid', bvid),
+            'title': data.get('title', ''),
+            'cover': data.get('pic', ''),
+            'uploader': (data.get('owner') or {}).get('name', ''),
+            'pubdate': data.get('pubdate', 0),
+            'parts': sorted(({
+                'p': page.get('page'),
+                'cid': page.get('cid'),
+                'title': page.get('part', ''),
+                'duration': page.get('duration', 0),
+            } for page in pages), key=lambda part: part['p']),
+        }
+        logger.info(f"获取分 P 列表：{bvid} 共 {len(playlist['parts'])} 个分 P")
+
+        with self.lock:
+            self.cache[bvid] = (time.time(), playlist)
+        return playlist
+
+    def invalidate(self, bvid: str):
+        """清除指定视频的缓存"""
+        with self.lock:
+            self.cache.pop(bvid, None)
@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+import logging
+
+logger = logging.getLogger('TaskProfiler')
+
+# 分析结果目录中的文件
+ARTIFACTS = ('summary.json', 'cpu.folded', 'cpu_top.txt', 'memory_top.txt', 'memory.snapshot')
+
+# 栈顶位于这些模块时视为线程空闲等待（锁、队列、select），不计入繁忙采样
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py')
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _start_tracemalloc(frames: int) -> bool:
+    """引用计数式开启 tracemalloc，多个任务同时分析时共用；返回本次是否由我们开启"""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            return False  # 已由外部开启，不接管
+        if _tracemalloc_users == 0:
+            tracemalloc.start(frames)
+        _tracemalloc_users += 1
+        return True
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _max_rss_mb() -> Optional[float]:
+    """本进程的峰值 RSS（MB）；resource 模块只在 POSIX 上可用，Windows 上返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+class TaskProfiler:
+    """单个下载任务的采样式性能分析和内存分配快照
+
+    后台线程按固定间隔读取 sys._current_frames()，记录所有线程（同一进程内并发的
+    其他任务也会被采到）的调用栈，输出火焰图可用的折叠栈和按函数汇总的排行；
+    同时用 tracemalloc 对比任务开始和结束时的内存分配。只在显式开启时创建，
+    未开启分析的任务没有任何额外开销。
+    """
+
+    def __init__(self, out_dir: str, interval: Optional[float] = None, memory: Optional[bool] = None,
+                 trace_frames: Optional[int] = None, top: Optional[int] = None):
+        self.out_dir = out_dir
+        self.interval = interval if interval is not None else float(os.getenv('PROFILE_INTERVAL', '0.01'))
+        self.memory = memory if memory is not None else os.getenv('PROFILE_MEMORY', 'true').lower() == 'true'
+        self.trace_frames = trace_frames if trace_frames is not None else int(os.getenv('PROFILE_TRACE_FRAMES', '1'))
+        self.top = top if top is not None else int(os.getenv('PROFILE_TOP', '30'))
+        self.stacks = Counter()  # (线程组, 调用栈) -> 采样次数
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.tracing = False
+        self.start_snapshot = None
+        self.started_at = None
+        self.started_cpu = None
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.started_at = time.monotonic()
+        self.started_cpu = time.process_time()
+        if self.memory:
+            self.tracing = _start_tracemalloc(self.trace_frames)
+            if self.tracing:
+                self.start_snapshot = tracemalloc.take_snapshot()
+            else:
+                logger.warning("tracemalloc 已由其他代码开启，跳过内存分析")
+        self.sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self.sampler.start()
+        logger.info(f"开始性能分析：{self.out_dir}（采样间隔 {self.interval * 1000:.0f} ms）")
+
+    @staticmethod
+    def _thread_group(name: str) -> str:
+        """去掉线程池线程名末尾的序号，同一池的线程合并统计"""
+        return re.sub(r'[-_]\d+$', '', name)
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[(self._thread_group(names.get(ident, str(ident))), tuple(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> dict:
+        """停止采样并写出分析文件，返回概要"""
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        summary = {
+            'wall': round(time.monotonic() - self.started_at, 3),
+            'cpu': round(time.process_time() - self.started_cpu, 3),
+            'interval': self.interval,
+            'samples': self.samples,
+            'max_rss_mb': _max_rss_mb(),
+        }
+        try:
+            self._write_cpu()
+            if self.tracing:
+                summary.update(self._write_memory())
+            with open(os.path.join(self.out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            logger.info(f"性能分析完成：{self.out_dir}（{self.samples} 次采样）")
+        except Exception as e:
+            logger.error(f"写入性能分析结果失败：{str(e)}")
+        finally:
+            if self.tracing:
+                _stop_tracemalloc()
+                self.tracing = False
+        return summary
+
+    def _write_cpu(self):
+        # 折叠栈：每行 "线程组;外层函数;...;内层函数 采样次数"，可直接交给 flamegraph.pl / speedscope
+        with open(os.path.join(self.out_dir, 'cpu.folded'), 'w', encoding='utf-8') as f:
+            for (group, stack), count in self.stacks.most_common():
+                f.write(f"{';'.join((group,) + stack)} {count}\n")
+
+        own, total = Counter(), Counter()
+        busy = 0
+        for (_, stack), count in self.stacks.items():
+            if not stack or stack[-1].split('(')[-1].split(':')[0] in IDLE_MODULES:
+                continue
+            busy += count
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        lines = [f"繁忙采样 {busy} 次（已排除栈顶为锁/队列/select 等待的采样），间隔 {self.interval * 1000:.0f} ms"]
+        for title, ranking in (('按自身采样排序', own), ('按累计采样排序（含调用的函数）', total)):
+            lines += ['', title, f"{'自身':>8} {'自身%':>7} {'累计':>8} {'累计%':>7}  函数"]
+            for label, _ in ranking.most_common(self.top):
+                lines.append(f"{own[label]:>8} {own[label] / busy * 100:>6.1f}% {total[label]:>8} "
+                             f"{total[label] / busy * 100:>6.1f}%  {label}")
+        with open(os.path.join(self.out_dir, 'cpu_top.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    @staticmethod
+    def _exclude_self(snapshot: 'tracemalloc.Snapshot') -> 'tracemalloc.Snapshot':
+        """去掉采样器和 tracemalloc 自身的分配"""
+        return snapshot.filter_traces((tracemalloc.Filter(False, __file__),
+                                       tracemalloc.Filter(False, tracemalloc.__file__)))
+
+    def _write_memory(self) -> dict:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot.dump(os.path.join(self.out_dir, 'memory.snapshot'))
+        stats = self._exclude_self(snapshot).compare_to(self._exclude_self(self.start_snapshot), 'lineno')
+        lines = [f"当前已分配 {current / 1024 / 1024:.1f} MB，峰值 {peak / 1024 / 1024:.1f} MB", '',
+                 '任务期间净增最多的分配位置：']
+        lines.extend(str(stat) for stat in stats[:self.top])
+        with open(os.path.join(self.out_dir, 'memory_top.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return {'traced_current_mb': round(current / 1024 / 1024, 2),
+                'traced_peak_mb': round(peak / 1024 / 1024, 2),
+                'traced_growth_mb': round(sum(stat.size_diff for stat in stats) / 1024 / 1024, 2)}
+
+
+def list_profiles(task_dir: str) -> list:
+    """task_dir 下所有任务的分析结果概要，按时间倒序"""
+    profiles = []
+    try:
+        entries = list(os.scandir(task_dir))
+    except FileNotFoundError:
+        return profiles
+    for entry in entries:
+        if not entry.is_dir() or not entry.name.endswith('.profile'):
+            continue
+        profiles.append(profile_info(task_dir, entry.name[:-len('.profile')]))
+    return sorted((p for p in profiles if p), key=lambda p: p['modified'], reverse=True)
+
+
+def profile_info(task_dir: str, task_id: str) -> Optional[dict]:
+    """单个任务的分析结果：概要和可下载的文件列表；不存在时返回 None"""
+    out_dir = os.path.join(task_dir, f"{task_id}.profile")
+    if not os.path.isdir(out_dir):
+        return None
+    files = {name: os.path.getsize(os.path.join(out_dir, name))
+             for name in ARTIFACTS if os.path.exists(os.path.join(out_dir, name))}
+    summary = {}
+    if 'summary.json' in files:
+        try:
+            with open(os.path.join(out_dir, 'summary.json'), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {'task_id': task_id, 'modified': os.path.getmtime(out_dir), 'files': files, 'summary': summary}
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from typing import Optional
+import logging
+
+logger = logging.getLogger('ProgressBus')
+
+# 单个分 P 的进度中下载与转码所占的比例
+DOWNLOAD_WEIGHT = 0.8
+
+
+class ProgressBus:
+    """汇总一个任务内各分 P 的字节级进度，节流合并后作为进度事件产出
+
+    yt-dlp、分段下载和 FFmpeg 的回调在各自线程里调用 update()，只修改内存中的最新状态；
+    下载循环调用 poll()，距上次产出不少于 1/max_rate 秒且有新状态时返回一个合并后的事件。
+    """
+
+    def __init__(self, count: int, max_rate: Optional[float] = None):
+        self.count = max(1, count)
+        max_rate = max_rate if max_rate is not None else float(os.getenv('PROGRESS_RATE', '2'))
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.parts = {}  # 分 P -> 进行中的进度
+        self.done = set()
+        self.dirty = False
+        self.last_emit = 0.0
+
+    def update(self, p: int, stage: str = 'download', downloaded: Optional[int] = None,
+               total: Optional[int] = None, speed: Optional[float] = None, eta: Optional[float] = None,
+               fraction: Optional[float] = None):
+        """记录某个分 P 的最新进度；fraction 为当前阶段完成比例（0-1）"""
+        now = time.monotonic()
+        with self.lock:
+            state = self.parts.setdefault(p, {'p': p, 'stage': stage, 'started': now})
+            if state['stage'] != stage:
+                state.clear()
+                state.update({'p': p, 'stage': stage, 'started': now})
+            if downloaded is not None:
+                state['downloaded_bytes'] = downloaded
+                if speed is None and now > state['started']:
+                    speed = downloaded / (now - state['started'])
+            if total:
+                state['total_bytes'] = total
+                if fraction is None and downloaded is not None:
+                    fraction = downloaded / total
+                if eta is None and speed:
+                    eta = max(0.0, (total - (downloaded or 0)) / speed)
+            if speed is not None:
+                state['speed'] = speed
+            if eta is not None:
+                state['eta'] = eta
+            if fraction is not None:
+                state['fraction'] = min(1.0, max(0.0, fraction))
+            self.dirty = True
+
+    def part_done(self, p: int):
+        """分 P 已结束（成功、跳过或最终失败）"""
+        with self.lock:
+            self.parts.pop(p, None)
+            self.done.add(p)
+            self.dirty = True
+
+    def part_reset(self, p: int):
+        """分 P 将重试，清除其进度"""
+        with self.lock:
+            self.parts.pop(p, None)
+            self.dirty = True
+
+    def _part_fraction(self, state: dict) -> float:
+        fraction = state.get('fraction', 0.0)
+        if state['stage'] == 'download':
+            return fraction * DOWNLOAD_WEIGHT
+        return DOWNLOAD_WEIGHT + fraction * (1 - DOWNLOAD_WEIGHT)
+
+    def overall(self) -> float:
+        """任务整体进度（0-100）"""
+        with self.lock:
+            return self._overall()
+
+    def _overall(self) -> float:
+        partial = sum(self._part_fraction(state) for state in self.parts.values())
+        return min(100.0, (len(self.done) + partial) / self.count * 100)
+
+    def next_due(self) -> Optional[float]:
+        """距离下一次可以产出事件的秒数；没有新状态时返回 None"""
+        with self.lock:
+            if not self.dirty or not self.parts:
+                return None
+            return max(0.0, self.last_emit + self.interval - time.monotonic())
+
+    def poll(self) -> Optional[dict]:
+        """返回合并后的进度事件；节流间隔未到或没有进行中的分 P 时返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            if not self.dirty or not self.parts or now - self.last_emit < self.interval:
+                return None
+            self.dirty = False
+            self.last_emit = now
+            parts = [{key: value for key, value in state.items() if key != 'started'}
+                     for state in sorted(self.parts.values(), key=lambda state: state['p'])]
+            for part in parts:
+                if 'speed' in part:
+                    part['speed'] = round(part['speed'], 1)
+                if 'eta' in part:
+                    part['eta'] = round(part['eta'], 1)
+                if 'fraction' in part:
+                    part['fraction'] = round(part['fraction'], 4)
+            progress = self._overall()
+        downloading = [part for part in parts if part['stage'] == 'download']
+        speed = sum(part.get('speed', 0) for part in downloading)
+        message = '，'.join(
+            f"第 {part['p']} 个视频{'下载' if part['stage'] == 'download' else '转码'} "
+            f"{part.get('fraction', 0) * 100:.0f}%" for part in parts)
+        if speed:
+            message += f"（{speed / 1024 / 1024:.2f} MB/s）"
+        return {
+            'status': 'progress',
+            'message': message,
+            'progress': round(progress, 2),
+            'speed': round(speed, 1),
+            'parts': parts,
+        }
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import logging
+from .http_client import HttpClient
+
+logger = logging.getLogger('RangeDownloader')
+
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeDownloader:
+    """把已知长度的音频 URL 按字节区间分段，通过多个连接并行下载
+
+    数据写入预分配的 .part 文件，已完成的分段记录在旁边的 .segments 文件中，
+    中断后再次下载只补齐缺失的分段。服务器不支持 Range 时退化为单连接下载。
+    """
+
+    def __init__(self, http: HttpClient, segment_size: Optional[int] = None,
+                 connections: Optional[int] = None, retries: int = 3):
+        self.http = http
+        self.segment_size = segment_size if segment_size is not None else int(os.getenv('SEGMENT_SIZE', str(4 * 1024 * 1024)))
+        self.connections = connections if connections is not None else int(os.getenv('SEGMENT_CONNECTIONS', '4'))
+        self.retries = retries
+
+    def probe(self, url: str, headers: Optional[dict] = None) -> Optional[int]:
+        """返回资源总长度；服务器不支持 Range 时返回 None"""
+        response = self.http.get(url, headers={**(headers or {}), 'Range': 'bytes=0-0'}, stream=True)
+        try:
+            if response.status_code != 206:
+                return None
+            match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+            return int(match.group(1)) if match else None
+        finally:
+            response.close()
+
+    @staticmethod
+    def _load_state(state_path: str, size: int, segment_size: int) -> Optional[list]:
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('size') != size or state.get('segment_size') != segment_size:
+            return None
+        return [c == '1' for c in state.get('done', '')]
+
+    @staticmethod
+    def _save_state(state_path: str, size: int, segment_size: int, done: list):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'segment_size': segment_size,
+                       'done': ''.join('1' if d else '0' for d in done)}, f)
+        os.replace(tmp_path, state_path)
+
+    def download(self, url: str, path: str, headers: Optional[dict] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 cancelled: Optional[Callable[[], bool]] = None) -> str:
+        """下载到 path，返回 path；progress(已下载字节, 总字节) 在每个数据块后调用"""
+        size = self.probe(url, headers)
+        if size is None:
+            logger.info("服务器不支持分段下载，使用单连接")
+            return self._download_single(url, path, headers, progress, cancelled)
+
+        part_path = f"{path}.part"
+        state_path = f"{part_path}.segments"
+        segments = [(start, min(start + self.segment_size, size) - 1)
+                    for start in range(0, size, self.segment_size)]
+        done = None
+        if os.path.exists(part_path) and os.path.getsize(part_path) == size:
+            done = self._load_state(state_path, size, self.segment_size)
+        if done is None or len(done) != len(segments):
+            done = [False] * len(segments)
+            with open(part_path, 'wb') as f:
+                f.truncate(size)  # 预分配，各分段按偏移写入
+            self._save_state(state_path, size, self.segment_size, done)
+
+        lock = threading.Lock()
+        downloaded = [sum(end - start + 1 for (start, end), d in zip(segments, done) if d)]
+        pending = [i for i, d in enumerate(done) if not d]
+        if downloaded[0]:
+            logger.info(f"从分段记录恢复：已完成 {len(segments) - len(pending)}/{len(segments)} 段")
+        logger.info(f"分段下载：{size} 字节，{len(segments)} 段，{self.connections} 个连接")
+
+        def on_data(n: int):
+            with lock:
+                downloaded[0] += n
+                current = downloaded[0]
+            if progress:
+                progress(current, size)
+
+        def fetch(index: int):
+            if cancelled and cancelled():
+                raise RuntimeError("任务已取消")
+            start, end = segments[index]
+            for attempt in range(self.retries + 1):
+                try:
+                    self._fetch_range(url, part_path, start, end, headers, on_data, cancelled)
+                    break
+                except Exception as e:
+                    if attempt >= self.retries or (cancelled and cancelled()):
+                        raise
+                    logger.warning(f"分段 {index} 下载失败，重试（{attempt + 1}/{self.retries}）：{str(e)}")
+            with lock:
+                done[index] = True
+                self._save_state(state_path, size, self.segment_size, done)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, self.connections), thread_name_prefix='segment')
+        try:
+            for future in [executor.submit(fetch, index) for index in pending]:
+                future.result()
+        finally:
+            # 任一分段最终失败时不再启动剩余分段，已完成的分段保留在记录中
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        os.replace(part_path, path)
+        os.remove(state_path)
+        return path
+
+    def _fetch_range(self, url: str, part_path: str, start: int, end: int, headers: Optional[dict],
+                     on_data: Callable[[int], None], cancelled: Optional[Callable[[], bool]]):
+        response = self.http.get(url, headers={**(headers or {}), 'Range': f'bytes={start}-{end}'}, stream=True)
+        offset = start
+        try:
+            if response.status_code != 206:
+                raise RuntimeError(f"分段请求失败：HTTP {response.status_code}")
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if cancelled and cancelled():
+                        raise RuntimeError("任务已取消")
+                    f.write(chunk)
+                    offset += len(chunk)
+                    on_data(len(chunk))
+                    self.http.governor.consume_bytes(len(chunk))
+            if offset != end + 1:
+                raise RuntimeError(f"分段数据不完整：{offset - start}/{end - start + 1} 字节")
+        except Exception:
+            # 已写入的字节在重试时会被覆盖，这里只回退进度计数
+            if offset != start:
+                on_data(start - offset)
+            raise
+        finally:
+            response.close()
+
+    def _download_single(self, url: str, path: str, headers: Optional[dict],
+                         progress: Optional[Callable[[int, int], None]],
+                         cancelled: Optional[Callable[[], bool]] = None) -> str:
+        response = self.http.get(url, headers=headers, stream=True)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"下载失败：HTTP {response.status_code}")
+            total = int(response.headers.get('Content-Length') or 0)
+            part_path = f"{path}.part"
+            downloaded = 0
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if cancelled and cancelled():
+                        raise RuntimeError("任务已取消")
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    self.http.governor.consume_bytes(len(chunk))
+                    if progress:
+                        progress(downloaded, total)
+        finally:
+            response.close()
+        os.replace(part_path, path)
+        return path
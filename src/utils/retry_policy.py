@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import random
+import socket
+import subprocess
+from typing import Dict, Optional
+import requests
+import logging
+
+logger = logging.getLogger('RetryPolicy')
+
+# 错误类别
+RATE_LIMIT = 'rate_limit'  # 412/429：触发风控，需要长时间退避并暂停派发新分 P
+NETWORK = 'network'  # 连接中断、超时、5xx
+FFMPEG = 'ffmpeg'  # 转码失败，通常重试一两次即可判断
+LEASED = 'leased'  # 分 P 正由其他节点下载，等对方完成或租约过期
+OTHER = 'other'
+
+_RATE_LIMIT_PATTERN = re.compile(r'HTTP Error (412|429)|\b(412|429)\b.*(Precondition|Too Many)', re.IGNORECASE)
+_NETWORK_PATTERN = re.compile(
+    r'timed out|timeout|connection (reset|refused|aborted)|remote end closed|IncompleteRead|'
+    r'Temporary failure in name resolution|HTTP Error 5\d\d', re.IGNORECASE)
+
+
+class RetryPolicy:
+    """指数退避加随机抖动：第 n 次重试前等待 min(max_delay, base_delay * 2^(n-1)) 的 50%~100%"""
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, pause_all: bool = False):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pause_all = pause_all  # 是否同时暂停派发其他分 P
+
+    @classmethod
+    def from_env(cls, name: str, default: 'RetryPolicy') -> 'RetryPolicy':
+        """从 RETRY_<NAME>=重试次数,初始间隔,最大间隔 读取配置"""
+        value = os.getenv(f"RETRY_{name.upper()}")
+        if not value:
+            return default
+        try:
+            max_retries, base_delay, max_delay = value.split(',')
+            return cls(int(max_retries), float(base_delay), float(max_delay), default.pause_all)
+        except ValueError:
+            logger.warning(f"重试配置格式错误：RETRY_{name.upper()}={value}")
+            return default
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+
+DEFAULT_POLICIES = {
+    RATE_LIMIT: RetryPolicy(6, 30, 600, pause_all=True),
+    NETWORK: RetryPolicy(5, 2, 60),
+    FFMPEG: RetryPolicy(1, 1, 5),
+    LEASED: RetryPolicy(1000, 10, 60),
+    OTHER: RetryPolicy(2, 5, 60),
+}
+
+
+def classify_error(error: BaseException) -> str:
+    """按异常类型和消息判断错误类别；异常自带 error_class 属性时直接使用"""
+    if getattr(error, 'error_class', None) in DEFAULT_POLICIES:
+        return error.error_class
+    for e in (error, error.__cause__):
+        if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code in (412, 429):
+            return RATE_LIMIT
+        if isinstance(e, subprocess.CalledProcessError):
+            return FFMPEG
+    message = str(error)
+    if _RATE_LIMIT_PATTERN.search(message):
+        return RATE_LIMIT
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, socket.timeout, ConnectionError)):
+        return NETWORK
+    if _NETWORK_PATTERN.search(message):
+        return NETWORK
+    if '音频转换失败' in message:
+        return FFMPEG
+    return OTHER
+
+
+class RetryScheduler:
+    """记录每个分 P 的重试次数，给出下一次重试的时间
+
+    各分 P 的预算互相独立；限流错误还会给出一个全局暂停时间，在此之前不派发新的分 P。
+    """
+
+    def __init__(self, policies: Optional[Dict[str, RetryPolicy]] = None):
+        self.policies = policies or {name: RetryPolicy.from_env(name, policy)
+                                     for name, policy in DEFAULT_POLICIES.items()}
+        self.parts = {}  # 分 P -> 重试状态
+        self.hold_until = 0.0
+
+    def record_failure(self, p: int, error: BaseException) -> Optional[float]:
+        """记录一次失败，返回等待的秒数；预算用完时返回 None"""
+        error_class = classify_error(error)
+        policy = self.policies.get(error_class) or self.policies[OTHER]
+        state = self.parts.setdefault(p, {'attempts': 0, 'by_class': {}})
+        attempts = state['by_class'].get(error_class, 0) + 1
+        state['by_class'][error_class] = attempts
+        state['attempts'] += 1
+        state['error_class'] = error_class
+        state['last_error'] = str(error)
+        state['retries_left'] = max(0, policy.max_retries - attempts)
+        if attempts > policy.max_retries:
+            state['next_retry_at'] = None
+            state['exhausted'] = True
+            return None
+        delay = policy.delay(attempts)
+        state['next_retry_at'] = time.time() + delay
+        if policy.pause_all:
+            self.hold_until = max(self.hold_until, time.monotonic() + delay)
+        return delay
+
+    def record_success(self, p: int):
+        state = self.parts.get(p)
+        if state:
+            state['next_retry_at'] = None
+
+    def hold_remaining(self) -> float:
+        """距离全局暂停结束的秒数"""
+        return max(0.0, self.hold_until - time.monotonic())
+
+    def snapshot(self) -> dict:
+        """各分 P 的重试状态，写入任务状态供 /task_status 查询"""
+        return {str(p): dict(state, by_class=dict(state['by_class'])) for p, state in self.parts.items()}
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+import logging
+
+logger = logging.getLogger('SQLiteStore')
+
+
+class SQLiteStore:
+    """SQLite（WAL 模式）存储基类，每个线程使用独立连接"""
+
+    SCHEMA = ''
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self.connect().executescript(self.SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：由 transaction() 显式控制事务
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务，开始时即获取写锁，避免并发写入时升级锁失败"""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
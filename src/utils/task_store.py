@@ -0,0 +1,107 @@
+import os
+import json
+from datetime import datetime
+from typing import Optional, List
+import logging
+from .sqlite_store import SQLiteStore
+
+logger = logging.getLogger('TaskStore')
+
+
+class TaskStore(SQLiteStore):
+    """Web 端下载任务记录，按 task_id 单行读写"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id     TEXT PRIMARY KEY,
+            bvid        TEXT NOT NULL,
+            output_dir  TEXT NOT NULL,
+            rename      INTEGER NOT NULL DEFAULT 0,
+            status      TEXT NOT NULL,
+            progress    REAL NOT NULL DEFAULT 0,
+            created_at  TEXT NOT NULL,
+            last_update TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_last_update ON tasks (last_update);
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+    '''
+
+    def _row_to_task(self, row) -> dict:
+        task = dict(row)
+        task['rename'] = bool(task['rename'])
+        return task
+
+    def upsert(self, task: dict):
+        """新建任务，task_id 已存在时重置为新任务"""
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO tasks (task_id, bvid, output_dir, rename, status, progress, created_at, last_update)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    bvid = excluded.bvid,
+                    output_dir = excluded.output_dir,
+                    rename = excluded.rename,
+                    status = excluded.status,
+                    progress = excluded.progress,
+                    last_update = excluded.last_update
+            ''', (
+                task['task_id'], task['bvid'], task['output_dir'], int(bool(task.get('rename'))),
+                task.get('status', 'pending'), task.get('progress', 0),
+                task.get('created_at', now), task.get('last_update', now),
+            ))
+
+    def update(self, task_id: str, status: Optional[str] = None, progress: Optional[float] = None) -> bool:
+        """更新单个任务的状态和进度，任务不存在时返回 False"""
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE tasks SET
+                    status = COALESCE(?, status),
+                    progress = COALESCE(?, progress),
+                    last_update = ?
+                WHERE task_id = ?
+            ''', (status, progress, datetime.now().isoformat(), task_id))
+        return cursor.rowcount > 0
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """按 task_id 获取任务"""
+        row = self.connect().execute('SELECT * FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def list_tasks(self, exclude_status: Optional[str] = None) -> List[dict]:
+        """按创建时间列出任务，可排除指定状态"""
+        if exclude_status:
+            rows = self.connect().execute(
+                'SELECT * FROM tasks WHERE status != ? ORDER BY created_at', (exclude_status,))
+        else:
+            rows = self.connect().execute('SELECT * FROM tasks ORDER BY created_at')
+        return [self._row_to_task(row) for row in rows]
+
+    def latest(self) -> Optional[dict]:
+        """最近更新的任务"""
+        row = self.connect().execute('SELECT * FROM tasks ORDER BY last_update DESC LIMIT 1').fetchone()
+        return self._row_to_task(row) if row else None
+
+    def import_json(self, json_path: str):
+        """从旧版 download_history.json 导入任务，导入后重命名原文件"""
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                tasks = json.load(f).get('tasks', [])
+            with self.transaction() as conn:
+                for task in tasks:
+                    last_update = task.get('last_update') or datetime.now().isoformat()
+                    conn.execute('''
+                        INSERT OR REPLACE INTO tasks
+                            (task_id, bvid, output_dir, rename, status, progress, created_at, last_update)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        task['task_id'], task.get('bvid', ''), task.get('output_dir', ''),
+                        int(bool(task.get('rename'))), task.get('status', 'pending'),
+                        task.get('progress', 0), last_update, last_update,
+                    ))
+            os.replace(json_path, f"{json_path}.migrated")
+            logger.info(f"已导入 {len(tasks)} 条任务记录：{json_path}")
+        except Exception as e:
+            logger.error(f"导入任务记录失败：{str(e)}")
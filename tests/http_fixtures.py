@@ -0,0 +1,85 @@
+"""测试用本地 HTTP 服务：各测试只实现响应逻辑，启动、关闭和请求记录在这里统一处理"""
+import socket
+import sys
+import threading
+import unittest
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(ThreadingHTTPServer):
+    """本地测试服务，requests 按到达顺序记录 (路径, 请求头, 客户端端口)
+
+    测试的可变状态作为服务器属性保存（见 start_server），不放在处理器类上，避免测试之间互相影响。
+    """
+
+    def __init__(self, handler):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = set()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self.lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self):
+        # 断开客户端保持的连接，处理线程不会在测试结束后继续等待请求
+        super().server_close()
+        with self.lock:
+            connections, self.connections = self.connections, set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭保持的连接属于正常情况，不输出堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """测试处理器基类：子类实现 respond()，用 send() 返回响应"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers), self.client_address[1]))
+        self.respond()
+
+    def respond(self):
+        raise NotImplementedError
+
+    def send(self, status: int, body: bytes = b'', headers: Optional[dict] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(test: unittest.TestCase, handler, **state) -> StubServer:
+    """在后台线程启动测试服务，测试结束时关闭；state 设置为服务器属性，供处理器读写"""
+    server = StubServer(handler)
+    for name, value in state.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from benchmarks.cover_reference import sample_cover
+from src.utils.cover_cache import CoverCache
+from src.utils.cover_processor import CoverProcessor
+
+class TestCoverCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.raw = sample_cover(320, 180)
+        self.fetch = mock.Mock(return_value=self.raw)
+        self.processor = CoverProcessor(size=64)
+
+    def make_cache(self, **kwargs):
+        return CoverCache(self.tmp.name, self.processor, self.fetch, **kwargs)
+
+    def test_parts_share_one_buffer(self):
+        cache = self.make_cache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('http://a/cover.jpg')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['memory_hits'], 7)
+
+    def test_disk_tier_and_content_dedupe(self):
+        first = self.make_cache().get('http://a/cover.jpg')
+
+        cache = self.make_cache()
+        with mock.patch.object(self.processor, 'process') as process:
+            self.assertEqual(cache.get('http://a/cover.jpg'), first)
+            self.assertEqual(cache.get('http://b/same.jpg'), first)
+            process.assert_not_called()
+
+        stats = cache.stats()
+        self.assertEqual((stats['disk_hits'], stats['content_hits'], stats['misses']), (1, 1, 0))
+        self.assertEqual(len([name for name in os.listdir(self.tmp.name) if name.endswith('.jpg')]), 1)
+
+    def test_get_file(self):
+        cache = self.make_cache()
+        path = cache.get_file('http://a/cover.jpg')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), cache.get('http://a/cover.jpg'))
+
+        self.fetch.return_value = None
+        self.assertIsNone(cache.get_file('http://a/missing.jpg'))
+
+    def test_memory_is_bounded(self):
+        cache = self.make_cache(max_items=1)
+        self.fetch.side_effect = [sample_cover(100, 50), sample_cover(50, 100)]
+        cache.get('http://a/1.jpg')
+        cache.get('http://a/2.jpg')
+        self.assertEqual(cache.stats()['memory_items'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from io import BytesIO
+from PIL import Image
+from benchmarks.cover_reference import legacy_square_cover, mean_difference, sample_cover
+from src.utils.cover_processor import CoverProcessor
+
+class TestCoverProcessor(unittest.TestCase):
+    def test_matches_legacy_output_within_tolerance(self):
+        processor = CoverProcessor()
+        for size in ((1920, 1080), (1080, 1920), (640, 640)):
+            with self.subTest(size=size):
+                data = sample_cover(*size)
+                result = processor.process(data)
+
+                self.assertEqual(Image.open(BytesIO(result)).size, (400, 400))
+                self.assertLess(mean_difference(legacy_square_cover(data), result), 3)
+
+    def test_non_rgb_input(self):
+        img = Image.new('RGBA', (300, 120), (10, 20, 30, 128))
+        data = BytesIO()
+        img.save(data, format='PNG')
+
+        result = Image.open(BytesIO(CoverProcessor(size=100).process(data.getvalue())))
+        self.assertEqual((result.format, result.size), ('JPEG', (100, 100)))
+
+if __name__ == '__main__':
+    unittest.main()
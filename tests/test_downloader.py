@@ -1,9 +1,25 @@
+import os
+import tempfile
+import time
 import unittest
-from src.utils.downloader import BiliDownloader
+from unittest import mock
+from yt_dlp.extractor.generic import GenericIE
+from src.utils.downloader import BiliDownloader, _TaskContext
+from src.utils.governor import Governor
+from src.utils.history_store import HistoryStore
+from src.utils.info_cache import InfoCache
+from tests.http_fixtures import StubHandler, start_server
+
+class RateLimitedHandler(StubHandler):
+    def respond(self):
+        self.send(412, b'Precondition Failed')
 
 class TestBiliDownloader(unittest.TestCase):
     def setUp(self):
         self.downloader = BiliDownloader()
+        task_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(task_dir.cleanup)
+        self.downloader.task_dir = task_dir.name
 
     def test_extract_bvid(self):
         test_cases = [
@@ -21,5 +37,226 @@ class TestBiliDownloader(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.downloader.extract_bvid("https://www.example.com")
 
+    def test_parallel_download_yields_in_part_order(self):
+        def fake_part(task, part):
+            # 让靠前的分 P 更晚完成
+            time.sleep((task.count - part['p']) * 0.01)
+            return {'status': 'success', 'message': part['title'], 'p': part['p']}
+
+        playlist = {'bvid': 'BV1xx411c7mD', 'title': '',
+                    'parts': [{'p': p, 'cid': p, 'title': f'p{p}', 'duration': 1} for p in range(1, 7)]}
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {'DOWNLOAD_DIR': tmp}), \
+                mock.patch.object(self.downloader, 'get_playlist', return_value=playlist), \
+                mock.patch.object(self.downloader, '_download_part', side_effect=fake_part):
+            events = list(self.downloader.download('BV1xx411c7mD', 'test', workers=3))
+
+        self.assertEqual([e['p'] for e in events], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(events[-1]['progress'], 100)
+
+    def test_failed_part_is_retried_without_blocking_others(self):
+        attempts = {}
+
+        def flaky_part(task, part):
+            attempts[part['p']] = attempts.get(part['p'], 0) + 1
+            if part['p'] == 1 and attempts[1] == 1:
+                raise ConnectionError('Connection reset by peer')
+            return {'status': 'success', 'message': part['title'], 'p': part['p']}
+
+        playlist = {'bvid': 'BV1xx411c7mD', 'title': '',
+                    'parts': [{'p': p, 'cid': p, 'title': f'p{p}', 'duration': 1} for p in range(1, 4)]}
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {'DOWNLOAD_DIR': tmp, 'RETRY_NETWORK': '3,0.2,0.2'}), \
+                mock.patch.object(self.downloader, 'get_playlist', return_value=playlist), \
+                mock.patch.object(self.downloader, '_download_part', side_effect=flaky_part):
+            events = list(self.downloader.download('BV1xx411c7mD', 'test', workers=1))
+
+        self.assertEqual([(e['status'], e['p']) for e in events],
+                         [('retry', 1), ('success', 1), ('success', 2), ('success', 3)])
+        self.assertEqual(events[0]['error_class'], 'network')
+        self.assertEqual(events[0]['retries_left'], 2)
+        # 等待重试期间其他分 P 继续下载
+        self.assertEqual(attempts, {1: 2, 2: 1, 3: 1})
+
+    def test_permanently_failing_part_fails_the_task(self):
+        def broken_part(task, part):
+            if part['p'] == 2:
+                raise ValueError('无法解析')
+            return {'status': 'success', 'message': part['title'], 'p': part['p']}
+
+        playlist = {'bvid': 'BV1xx411c7mD', 'title': '',
+                    'parts': [{'p': p, 'cid': p, 'title': f'p{p}', 'duration': 1} for p in range(1, 4)]}
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {'DOWNLOAD_DIR': tmp, 'RETRY_OTHER': '0,0,0'}), \
+                mock.patch.object(self.downloader, 'get_playlist', return_value=playlist), \
+                mock.patch.object(self.downloader, '_download_part', side_effect=broken_part):
+            events = list(self.downloader.download('BV1xx411c7mD', 'test', workers=1))
+
+        self.assertEqual([(e['status'], e.get('p')) for e in events],
+                         [('success', 1), ('error', 2), ('success', 3), ('failed', None)])
+        self.assertEqual(events[-1]['message'], '下载失败：1/3 个视频未能下载')
+
+        # 失败任务的最终状态保留，可查询失败分 P 的错误类别和重试记录
+        state = self.downloader.load_task_state(self.downloader.make_task_id('BV1xx411c7mD', 'test'))
+        self.assertEqual(state['status'], 'failed')
+        self.assertEqual(state['error'], '无法解析')
+        self.assertEqual(state['retries']['2']['error_class'], 'other')
+        self.assertIn('stages', state)
+
+    def test_single_part_reports_progress_while_running(self):
+        def slow_part(task, part):
+            for done in range(1, 6):
+                time.sleep(0.05)
+                task.report(part['p'], 'download', downloaded=done, total=5)
+            return {'status': 'success', 'message': part['title'], 'p': part['p']}
+
+        playlist = {'bvid': 'BV1xx411c7mD', 'title': '',
+                    'parts': [{'p': 1, 'cid': 1, 'title': 'p1', 'duration': 1}]}
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {'DOWNLOAD_DIR': tmp, 'PROGRESS_RATE': '20'}), \
+                mock.patch.object(self.downloader, 'get_playlist', return_value=playlist), \
+                mock.patch.object(self.downloader, '_download_part', side_effect=slow_part):
+            events = list(self.downloader.download('BV1xx411c7mD', 'test'))
+
+        # 分 P 进行中没有其他事件时，循环也要按节流间隔醒来产出进度
+        self.assertIn('progress', [e['status'] for e in events[:-1]])
+        self.assertEqual(events[-1]['status'], 'success')
+
+    def test_skip_check_happens_before_network(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            mp3_path = os.path.join(tmp, 'p1.mp3')
+            with open(mp3_path, 'wb') as f:
+                f.write(b'\0' * 10)
+            self.downloader.history = HistoryStore(os.path.join(tmp, 'history.db'))
+            self.downloader.history.add({'bvid': 'BV1xx411c7mD', 'p': 1, 'file_path': mp3_path,
+                                         'download_time': '2025-01-01T00:00:00', 'file_size': 10})
+            task = _TaskContext('BV1xx411c7mD', 'test', tmp, False, [{'p': 1}], {})
+
+            with mock.patch.object(self.downloader.info_cache, 'get') as cache_get, \
+                    mock.patch.object(task, 'extractor') as extractor:
+                result = self.downloader._download_part(task, {'p': 1, 'title': ''})
+
+            self.assertEqual(result['status'], 'skip')
+            cache_get.assert_not_called()
+            extractor.assert_not_called()
+
+    def test_cached_info_downloads_without_resolving(self):
+        task = _TaskContext('BV1xx411c7mD', 'test', '.', False, [{'p': 1}], {})
+        ydl = mock.Mock()
+        ydl.process_ie_result.return_value = {'id': 'a', 'filepath': 'a.m4a'}
+        cached = {'id': 'a', 'formats': [{'url': 'https://cdn/a.m4s'}]}
+
+        with mock.patch.object(task, 'extractor', return_value=ydl):
+            audio, info = self.downloader._fetch_audio(task, 1, cached, duration=60)
+
+        ydl.process_ie_result.assert_called_once_with(cached, download=True)
+        ydl.extract_info.assert_not_called()
+        self.assertEqual(info['filepath'], 'a.m4a')
+
+    def test_expired_cached_url_is_resolved_once_more(self):
+        fresh = {'id': 'a', 'title': 'a'}
+        with tempfile.TemporaryDirectory() as tmp:
+            self.downloader.history = HistoryStore(os.path.join(tmp, 'history.db'))
+            task = _TaskContext('BV1xx411c7mD', 'test', tmp, False, [{'p': 1}], {})
+            with mock.patch.object(self.downloader.info_cache, 'get', return_value={'id': 'a'}), \
+                    mock.patch.object(self.downloader.info_cache, 'invalidate') as invalidate, \
+                    mock.patch.object(self.downloader, '_resolve', return_value=fresh) as resolve, \
+                    mock.patch.object(self.downloader, '_fetch_audio',
+                                      side_effect=[RuntimeError('HTTP 403'), RuntimeError('HTTP 500')]) as fetch:
+                with self.assertRaises(RuntimeError):
+                    self.downloader._download_part(task, {'p': 1, 'title': ''})
+
+        # 缓存的地址失效后清除缓存、重新解析并只重试一次
+        invalidate.assert_called_once_with('BV1xx411c7mD', 1)
+        resolve.assert_called_once()
+        self.assertEqual(fetch.call_count, 2)
+        self.assertIs(fetch.call_args[0][2], fresh)
+
+    def test_failed_fetch_removes_partial_download(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.downloader.history = HistoryStore(os.path.join(tmp, 'history.db'))
+            task = _TaskContext('BV1xx411c7mD', 'test', tmp, False, [{'p': 1}], {})
+            audio = os.path.join(tmp, 'p1.m4a')
+            ydl = mock.Mock()
+            ydl.prepare_filename.return_value = audio
+
+            def failing_fetch(*args):
+                for suffix in ('.part', '.ytdl'):
+                    with open(audio + suffix, 'wb') as f:
+                        f.write(b'\0' * 10)
+                raise RuntimeError('HTTP Error 416: Requested Range Not Satisfiable')
+
+            with mock.patch.object(self.downloader.info_cache, 'get', return_value=None), \
+                    mock.patch.object(self.downloader, '_resolve', return_value={'id': 'a', 'title': 'p1'}), \
+                    mock.patch.object(self.downloader, '_fetch_audio', side_effect=failing_fetch), \
+                    mock.patch.object(task, 'extractor', return_value=ydl):
+                with self.assertRaises(RuntimeError):
+                    self.downloader._download_part(task, {'p': 1, 'title': ''})
+
+                # yt-dlp 的不完整文件被删除，重试时从头下载，不会续传到 416
+                self.assertEqual([name for name in os.listdir(tmp) if name.startswith('p1')], [])
+
+                # 分段下载的 .part 有分段记录，保留用于断点续传
+                with open(f'{audio}.part.segments', 'w') as f:
+                    f.write('{}')
+                with self.assertRaises(RuntimeError):
+                    self.downloader._download_part(task, {'p': 1, 'title': ''})
+                self.assertTrue(os.path.exists(f'{audio}.part'))
+
+    def download_from_rate_limited_origin(self, tmp: str) -> list:
+        """让 yt-dlp 从始终返回 412 的本地源解析一个分 P，返回任务产出的事件"""
+        server = start_server(self, RateLimitedHandler)
+        self.downloader.base_url = f'{server.url}/video/'
+        self.downloader.extractors = [GenericIE]
+        # 使用独立的 Governor，避免降速影响进程内共享的实例
+        self.downloader.governor = Governor(request_rate=10)
+        self.downloader.history = HistoryStore(os.path.join(tmp, 'history.db'))
+        self.downloader.info_cache = InfoCache(os.path.join(tmp, 'info_cache'))
+        playlist = {'bvid': 'BV1xx411c7mD', 'title': '', 'parts': [{'p': 1, 'cid': 1, 'title': 'p1', 'duration': 1}]}
+        with mock.patch.dict(os.environ, {'DOWNLOAD_DIR': tmp, 'RETRY_RATE_LIMIT': '1,0.01,0.01'}), \
+                mock.patch.object(self.downloader, 'get_playlist', return_value=playlist):
+            return list(self.downloader.download('BV1xx411c7mD', 'test'))
+
+    def test_ytdlp_rate_limit_is_classified(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            events = self.download_from_rate_limited_origin(tmp)
+
+        # yt-dlp 的 HTTP Error 412 按限流处理，而不是归入 other
+        self.assertEqual([(e['status'], e.get('error_class')) for e in events],
+                         [('retry', 'rate_limit'), ('error', 'rate_limit'), ('failed', None)])
+
+    def test_ytdlp_rate_limit_slows_governor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.download_from_rate_limited_origin(tmp)
+
+        # 每次 412（首次尝试和一次重试）都使请求速率减半
+        state = self.downloader.governor.state()
+        self.assertEqual(state['rate_limited'], 2)
+        self.assertEqual(state['request_rate'], 2.5)
+
+    def test_history_opened_on_first_use(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.downloader.history_dir = tmp
+            self.downloader.history_file = os.path.join(tmp, 'history.json')
+            # 创建下载器时不打开历史记录，首次访问时才打开
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'history.db')))
+            history = self.downloader.history
+            self.assertIs(self.downloader.history, history)
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'history.db')))
+
+    def test_postprocessor_hook_reports_final_path(self):
+        task = _TaskContext('BV1xx411c7mD', 'test', '.', False, [{'p': 1}], {})
+        task.postprocessor_hook({'status': 'finished', 'postprocessor': 'ExtractAudio',
+                                 'info_dict': {'filepath': 'a.m4a'}})
+        task.postprocessor_hook({'status': 'finished', 'postprocessor': 'MoveFiles',
+                                 'info_dict': {'filepath': 'a.mp3'}})
+
+        self.assertEqual(task.take_audio_path(), 'a.mp3')
+        self.assertIsNone(task.take_audio_path())
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
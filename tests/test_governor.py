@@ -0,0 +1,45 @@
+import time
+import unittest
+from src.utils.governor import Governor, TokenBucket
+
+class TestGovernor(unittest.TestCase):
+    def test_token_bucket_rate(self):
+        bucket = TokenBucket(20, burst=2)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # 容量 2 个立即放行，其余 4 个按 20/s 放行
+        self.assertAlmostEqual(time.monotonic() - start, 0.2, delta=0.08)
+        self.assertEqual(TokenBucket(0).reserve(10 ** 9), 0)
+
+    def test_large_chunks_are_paced(self):
+        bucket = TokenBucket(1000, burst=1000)
+        self.assertEqual(bucket.reserve(1000), 0)
+        self.assertAlmostEqual(bucket.reserve(500), 0.5, delta=0.05)
+
+    def test_aimd_on_rate_limit(self):
+        governor = Governor(request_rate=8, bandwidth=0, min_request_rate=1, cooldown=0.1)
+        governor.on_response(412)
+        self.assertEqual(governor.state()['request_rate'], 4)
+        governor.on_response(200)  # 冷却期内不恢复
+        self.assertEqual(governor.state()['request_rate'], 4)
+        for _ in range(3):
+            governor.on_response(429)
+        self.assertEqual(governor.state()['request_rate'], 1)
+
+        time.sleep(0.15)
+        governor.on_response(200)
+        state = governor.state()
+        self.assertAlmostEqual(state['request_rate'], 1.4)
+        self.assertEqual(state['rate_limited'], 4)
+        self.assertEqual(governor.requests.rate, state['request_rate'])
+
+    def test_counts_requests_and_bytes(self):
+        governor = Governor(request_rate=0, bandwidth=0)
+        governor.acquire_request()
+        governor.consume_bytes(1024)
+        state = governor.state()
+        self.assertEqual((state['requests'], state['bytes']), (1, 1024))
+
+if __name__ == '__main__':
+    unittest.main()
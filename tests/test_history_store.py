@@ -0,0 +1,53 @@
+import os
+import json
+import tempfile
+import unittest
+from src.utils.history_store import HistoryStore
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = HistoryStore(os.path.join(self.tmp.name, 'history.db'))
+
+    def test_lookup_by_part(self):
+        self.store.add({'bvid': 'BV1', 'p': 2, 'title': 't', 'file_path': '/a/t.mp3',
+                        'download_time': '2025-01-01T00:00:00', 'file_size': 5})
+
+        self.assertEqual(self.store.get('BV1', 2)['file_path'], '/a/t.mp3')
+        self.assertIsNone(self.store.get('BV1', 1))
+
+        self.store.delete('BV1', 2)
+        self.assertEqual(self.store.count(), 0)
+
+    def test_import_json_runs_once(self):
+        json_path = os.path.join(self.tmp.name, 'history.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'old': {'bvid': 'BV1', 'p': 1, 'title': '旧', 'file_path': 'old.mp3',
+                        'download_time': '2025-01-01T00:00:00', 'file_size': 1},
+                'new': {'bvid': 'BV1', 'p': 1, 'title': '新', 'file_path': 'new.mp3',
+                        'download_time': '2025-02-01T00:00:00', 'file_size': 2},
+            }, f)
+
+        self.store.import_json(json_path)
+        self.store.delete('BV1', 1)
+        self.store.import_json(json_path)
+
+        self.assertTrue(os.path.exists(json_path))
+        self.assertEqual(self.store.count(), 0)
+
+    def test_import_json_uses_latest_record(self):
+        json_path = os.path.join(self.tmp.name, 'history.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'new': {'bvid': 'BV1', 'p': 1, 'file_path': 'new.mp3', 'download_time': '2025-02-01T00:00:00'},
+                'old': {'bvid': 'BV1', 'p': 1, 'file_path': 'old.mp3', 'download_time': '2025-01-01T00:00:00'},
+            }, f)
+
+        self.store.import_json(json_path)
+
+        self.assertEqual(self.store.get('BV1', 1)['file_path'], 'new.mp3')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+from src.utils.governor import Governor
+from src.utils.http_client import HttpClient
+from tests.http_fixtures import StubHandler, start_server
+
+class FlakyHandler(StubHandler):
+    def respond(self):
+        with self.server.lock:
+            failing = self.server.failures_left > 0
+            self.server.failures_left -= failing
+        if failing:
+            self.send(self.server.failure_status, b'busy')
+        else:
+            self.send(200, b'ok')
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.server = start_server(self, FlakyHandler, failures_left=0, failure_status=503)
+        self.url = f'{self.server.url}/cover.jpg'
+        self.governor = Governor(request_rate=0)
+        self.client = HttpClient({'User-Agent': 'test'}, retries=2, backoff=0, governor=self.governor)
+        self.addCleanup(self.client.close)
+
+    def test_retries_server_errors(self):
+        self.server.failures_left = 2
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.content), (200, b'ok'))
+
+    def test_rate_limit_is_left_to_governor(self):
+        self.server.failures_left = 1
+        self.server.failure_status = 429
+        with mock.patch.object(self.governor, 'on_response', wraps=self.governor.on_response) as on_response:
+            response = self.client.get(self.url)
+        # 不在连接层自动重试，Governor 看到每一次 429
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.server.requests), 1)
+        on_response.assert_called_once_with(429)
+
+    def test_reuses_connections(self):
+        for _ in range(5):
+            self.client.get(self.url)
+        self.assertEqual(len({port for _, _, port in self.server.requests}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
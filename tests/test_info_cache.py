@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from src.utils.info_cache import InfoCache
+
+class TestInfoCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_roundtrip_keeps_download_urls(self):
+        InfoCache(self.tmp.name, ttl=60).put('BV1xx411c7mD', 2, {
+            'title': '第二集', 'duration': 12.5, 'url': 'https://signed', 'formats': [{'url': 'https://signed'}]
+        })
+
+        info = InfoCache(self.tmp.name, ttl=60).get('BV1xx411c7mD', 2)
+        self.assertEqual(info['url'], 'https://signed')
+        self.assertEqual(info['formats'], [{'url': 'https://signed'}])
+        self.assertIsNone(InfoCache(self.tmp.name, ttl=60).get('BV1xx411c7mD', 3))
+
+    def test_signed_url_deadline_shortens_expiry(self):
+        cache = InfoCache(self.tmp.name, ttl=3600)
+        with mock.patch('src.utils.info_cache.time.time', return_value=1000000000):
+            cache.put('BV1xx411c7mD', 1, {'title': 'a', 'formats': [
+                {'url': 'https://cdn/a.m4s?deadline=1000000600&sign=x'},
+                {'url': 'https://cdn/b.m4s?deadline=1000000900&sign=y'}]})
+            # 过期前 EXPIRY_MARGIN 秒内不写入
+            cache.put('BV1xx411c7mD', 2, {'title': 'b', 'url': 'https://cdn/c.m4s?deadline=1000000100'})
+        with mock.patch('src.utils.info_cache.time.time', return_value=1000000299):
+            self.assertEqual(cache.get('BV1xx411c7mD', 1)['title'], 'a')
+            self.assertIsNone(cache.get('BV1xx411c7mD', 2))
+        with mock.patch('src.utils.info_cache.time.time', return_value=1000000300):
+            self.assertIsNone(cache.get('BV1xx411c7mD', 1))
+
+    def test_expired_entries_are_dropped(self):
+        cache = InfoCache(self.tmp.name, ttl=60)
+        with mock.patch('src.utils.info_cache.time.time', return_value=1000):
+            cache.put('BV1xx411c7mD', 1, {'title': 'a'})
+        with mock.patch('src.utils.info_cache.time.time', return_value=1061):
+            self.assertIsNone(cache.get('BV1xx411c7mD', 1))
+        self.assertIsNone(InfoCache(self.tmp.name, ttl=60).get('BV1xx411c7mD', 1))
+
+    def test_memory_is_bounded(self):
+        cache = InfoCache(self.tmp.name, ttl=60, max_items=2)
+        for p in (1, 2, 3):
+            cache.put('BV1xx411c7mD', p, {'title': str(p)})
+        cache.get('BV1xx411c7mD', 2)
+        cache.put('BV1xx411c7mD', 4, {'title': '4'})
+
+        # 最近使用的保留在内存中，淘汰的仍可从磁盘读取
+        self.assertEqual(list(cache.memory), ['BV1xx411c7mD_p2', 'BV1xx411c7mD_p4'])
+        self.assertEqual(cache.get('BV1xx411c7mD', 1)['title'], '1')
+
+    def test_sweep_removes_expired_files(self):
+        cache = InfoCache(self.tmp.name, ttl=60)
+        cache.put('BV1xx411c7mD', 1, {'title': 'old'})
+        cache.put('BV1xx411c7mD', 2, {'title': 'new'})
+        old = cache._path(cache._key('BV1xx411c7mD', 1))
+        os.utime(old, (time.time() - 61, time.time() - 61))
+
+        self.assertEqual(InfoCache(self.tmp.name, ttl=60).sweep(), 0)  # 创建时已清理
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+import unittest
+from unittest import mock
+from src.utils.job_queue import JobQueue
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.order = []
+
+    def runner(self, job):
+        self.order.append(job.bvid)
+        if job.bvid == 'BVblock':
+            self.release.wait(5)
+        if job.bvid == 'BVfail':
+            raise RuntimeError('boom')
+        for p in (1, 2):
+            yield {'status': 'success', 'p': p, 'progress': p * 50}
+        if job.bvid == 'BVpartial':
+            yield {'status': 'failed', 'message': '下载失败：1/3 个视频未能下载', 'progress': 100}
+
+    def make_queue(self, **kwargs):
+        jobs = JobQueue(self.runner, **kwargs)
+        self.addCleanup(jobs.shutdown)
+        self.addCleanup(self.release.set)
+        return jobs
+
+    def events(self, job, since=0):
+        return [item[1] for item in job.subscribe(since, timeout=5) if item is not None]
+
+    def test_dedupe_and_fan_out(self):
+        jobs = self.make_queue(workers=1)
+        job, created = jobs.submit('BVblock', 'out')
+        again, created_again = jobs.submit('BVblock', 'out')
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertIs(job, again)
+
+        results = [[], []]
+        threads = [threading.Thread(target=lambda r=r: r.extend(self.events(job))) for r in results]
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([event['status'] for event in results[0]], ['queued', 'success', 'success'])
+        self.assertEqual(job.status, 'completed')
+        # 断开后从指定位置重新订阅
+        self.assertEqual(self.events(job, since=2), results[0][2:])
+        # 已结束的任务可以重新提交
+        self.assertTrue(jobs.submit('BVblock', 'out')[1])
+
+    def test_listeners_are_notified_without_blocking(self):
+        jobs = self.make_queue(workers=1)
+        job, _ = jobs.submit('BVblock', 'out')
+        notified = threading.Semaphore(0)
+        job.add_listener(notified.release)
+        self.assertEqual(job.events_since(0), ([(1, job.events[0])], 0, False))
+
+        self.release.set()
+        self.events(job)
+        # 两个进度事件和任务结束各通知一次
+        for _ in range(3):
+            self.assertTrue(notified.acquire(timeout=5))
+        job.remove_listener(notified.release)
+        events, _, finished = job.events_since(1)
+        self.assertTrue(finished)
+        self.assertEqual([(position, event['p']) for position, event in events], [(2, 1), (3, 2)])
+
+    def test_priority_and_failure(self):
+        jobs = self.make_queue(workers=1)
+        blocker, _ = jobs.submit('BVblock', 'out')
+        while not self.order:
+            time.sleep(0.01)
+        low, _ = jobs.submit('BVlow', 'out')
+        failing, _ = jobs.submit('BVfail', 'out', priority=5)
+        high, _ = jobs.submit('BVhigh', 'out', priority=10)
+        self.release.set()
+        for job in (blocker, low, failing, high):
+            self.events(job)
+
+        self.assertEqual(self.order, ['BVblock', 'BVhigh', 'BVfail', 'BVlow'])
+        self.assertEqual(failing.status, 'failed')
+        self.assertEqual(self.events(failing)[-1], {'error': 'boom'})
+        self.assertEqual(jobs.stats()['completed'], 3)
+
+    def test_failed_event_marks_job_failed(self):
+        jobs = self.make_queue(workers=1)
+        job, _ = jobs.submit('BVpartial', 'out')
+        self.assertEqual(self.events(job)[-1]['status'], 'failed')
+        # 下载器正常结束但报告失败时，任务不能记为完成
+        self.assertEqual((job.status, job.error), ('failed', '下载失败：1/3 个视频未能下载'))
+        self.assertEqual(jobs.stats()['failed'], 1)
+
+    def test_long_run_keeps_event_log_bounded(self):
+        def chatty(job):
+            for i in range(5000):
+                yield {'status': 'progress', 'progress': i / 50}
+                if i % 100 == 0:
+                    yield {'status': 'success', 'p': i // 100 + 1, 'progress': i / 50}
+
+        jobs = JobQueue(chatty, workers=1)
+        self.addCleanup(jobs.shutdown)
+        with mock.patch.dict(os.environ, {'JOB_EVENT_LOG': '20'}):
+            job, _ = jobs.submit('BVlong', 'out')
+        received = [item for item in job.subscribe(0, timeout=5) if item is not None]
+
+        # 进度事件只保留最新快照，日志只记录状态变化且有上限
+        self.assertEqual(job.event_count, 51)
+        self.assertEqual(len(job.events), 20)
+        self.assertEqual(job.progress['progress'], 4999 / 50)
+        # 重新订阅从仍保留的第一个事件开始重放，序号不变，最后附带当前进度
+        replay = list(job.subscribe(0, timeout=5))
+        self.assertEqual([position for position, _ in replay], list(range(32, 52)) + [51])
+        self.assertEqual(replay[0][1]['p'], 31)
+        self.assertEqual(replay[-1][1]['status'], 'progress')
+        self.assertEqual([event['status'] for _, event in received if event['status'] != 'progress'][-1], 'success')
+        self.assertEqual(job.summary()['progress'], 4999 / 50)
+
+if __name__ == '__main__':
+    unittest.main()
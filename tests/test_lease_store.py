@@ -0,0 +1,52 @@
+import os
+import time
+import tempfile
+import unittest
+from src.utils.lease_store import LeaseStore, PartLeased
+from src.utils.retry_policy import classify_error
+
+class TestLeaseStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'leases.db')
+
+    def node(self, owner, ttl=60):
+        store = LeaseStore(self.db_path, owner=owner, ttl=ttl)
+        self.addCleanup(store.close)
+        return store
+
+    def test_parts_spread_across_nodes(self):
+        a, b = self.node('a'), self.node('b')
+        self.assertTrue(a.claim('BV1', 1))
+        self.assertFalse(b.claim('BV1', 1))
+        self.assertTrue(b.claim('BV1', 2))
+
+        a.complete('BV1', 1, '/shared/p1.mp3')
+        self.assertEqual(b.done_path('BV1', 1), '/shared/p1.mp3')
+        self.assertFalse(b.claim('BV1', 1))  # 已完成的分 P 不再领取
+
+        b.release('BV1', 2)
+        self.assertTrue(a.claim('BV1', 2))
+        self.assertEqual(b.stats()['contended'], 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        a, b = self.node('a', ttl=0.2), self.node('b', ttl=0.2)
+        self.assertTrue(a.claim('BV1', 1))
+        a.stopped.set()  # 模拟节点崩溃，不再续期
+        time.sleep(0.3)
+        self.assertTrue(b.claim('BV1', 1))
+        self.assertEqual(b.stats()['reclaimed'], 1)
+        self.assertFalse(a.renew('BV1', 1))
+
+    def test_held_leases_are_renewed(self):
+        a, b = self.node('a', ttl=0.3), self.node('b', ttl=0.3)
+        self.assertTrue(a.claim('BV1', 1))
+        time.sleep(0.5)
+        self.assertFalse(b.claim('BV1', 1))
+
+    def test_leased_parts_use_their_own_retry_class(self):
+        self.assertEqual(classify_error(PartLeased('第 1 个视频正由其他节点下载')), 'leased')
+
+if __name__ == '__main__':
+    unittest.main()
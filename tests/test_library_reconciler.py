@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+from src.utils.history_store import HistoryStore
+from src.utils.library_reconciler import LibraryReconciler, local_path, normalize_path
+
+def write_file(path, size=10):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+def age_dirs(root):
+    # 扫描时刚修改过的目录不缓存 mtime，测试中把目录时间调到过去
+    past = time.time() - 60
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (past, past))
+
+class TestLibraryReconciler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, 'Audiobooks')
+        self.history = HistoryStore(os.path.join(self.tmp.name, 'history.db'))
+        self.reconciler = LibraryReconciler(self.history, self.root, os.path.join(self.tmp.name, 'library.db'))
+
+    def add_record(self, bvid, file_path):
+        self.history.add({'bvid': bvid, 'p': 1, 'file_path': file_path,
+                          'download_time': '2025-01-01T00:00:00', 'file_size': 10})
+
+    def test_normalize_windows_paths(self):
+        self.assertEqual(normalize_path('audiobooks\\书名\\1.mp3', self.root), '书名/1.mp3')
+        self.assertEqual(normalize_path('D:\\data\\Audiobooks\\书名\\1.mp3', self.root), '书名/1.mp3')
+        self.assertEqual(normalize_path(os.path.join(self.root, 'a', '1.mp3'), self.root), 'a/1.mp3')
+        self.assertIsNone(normalize_path('/elsewhere/1.mp3', self.root))
+        self.assertEqual(local_path('audiobooks\\a\\1.mp3', self.root), os.path.join(self.root, 'a', '1.mp3'))
+
+    def test_relinks_and_removes_in_one_pass(self):
+        kept = os.path.join(self.root, '书名', '1.mp3')
+        write_file(kept)
+        write_file(os.path.join(self.root, 'Other', '2.mp3'))
+        self.add_record('BV1kept', kept)
+        self.add_record('BV1legacy', 'audiobooks\\other\\2.mp3')
+        self.add_record('BV1gone', os.path.join(self.root, '书名', 'gone.mp3'))
+
+        result = self.reconciler.reconcile()
+
+        self.assertEqual((result['files'], result['relinked'], result['removed']), (2, 1, 1))
+        self.assertEqual(self.history.get('BV1legacy', 1)['file_path'], os.path.join(self.root, 'Other', '2.mp3'))
+        self.assertEqual(self.history.get('BV1kept', 1)['file_path'], kept)
+        self.assertIsNone(self.history.get('BV1gone', 1))
+
+    def test_unchanged_directories_are_skipped(self):
+        for name in ('a', 'b', 'c'):
+            write_file(os.path.join(self.root, name, '1.mp3'))
+        age_dirs(self.root)
+        self.assertEqual(self.reconciler.reconcile()['dirs_scanned'], 4)
+        self.assertEqual(self.reconciler.reconcile()['dirs_scanned'], 0)
+
+        # 只有发生变化的目录被重新列出；删除的目录从索引中移除
+        write_file(os.path.join(self.root, 'b', '2.mp3'))
+        os.remove(os.path.join(self.root, 'c', '1.mp3'))
+        os.rmdir(os.path.join(self.root, 'c'))
+        result = self.reconciler.reconcile()
+        self.assertEqual((result['dirs_scanned'], result['dirs_removed'], result['files']), (2, 1, 3))
+        self.assertEqual(self.reconciler.reconcile(full=True)['dirs_scanned'], 3)
+
+    def test_missing_root_keeps_history(self):
+        self.add_record('BV1kept', os.path.join(self.root, '1.mp3'))
+        self.assertEqual(self.reconciler.reconcile()['status'], 'skipped')
+        self.assertEqual(self.history.count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import time
+import unittest
+from unittest import mock
+from src.utils.media_processor import (MediaProcessor, TranscodeScheduler, TranscodeCancelled,
+                                       available_cpus, can_stream_copy)
+
+SLEEP = [sys.executable, '-c', 'import time; time.sleep(5)']
+
+class TestTranscodeScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TranscodeScheduler(max_workers=1)
+        self.addCleanup(self.scheduler.shutdown)
+
+    def test_available_cpus(self):
+        self.assertGreaterEqual(available_cpus(), 1)
+
+    def test_runs_jobs_and_reports_failures(self):
+        ok = self.scheduler.submit([sys.executable, '-c', 'pass'], nice=5)
+        failed = self.scheduler.submit([sys.executable, '-c', 'import sys; sys.exit(3)'])
+
+        self.assertEqual(ok.result(timeout=10), 0)
+        with self.assertRaises(Exception) as ctx:
+            failed.result(timeout=10)
+        self.assertEqual(ctx.exception.returncode, 3)
+
+    def test_streams_output_lines(self):
+        lines = []
+        script = 'print("out_time_us=1500000"); print("progress=end")'
+        future = self.scheduler.submit([sys.executable, '-c', script], on_output=lines.append)
+        self.assertEqual(future.result(timeout=10), 0)
+        self.assertEqual(lines, ['out_time_us=1500000', 'progress=end'])
+
+    def test_cancel_running_and_queued_jobs(self):
+        running = self.scheduler.submit(SLEEP)
+        queued = self.scheduler.submit(SLEEP)
+        while self.scheduler.stats()['running'] == 0:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        self.assertTrue(self.scheduler.cancel(queued))
+        self.assertTrue(self.scheduler.cancel(running))
+        with self.assertRaises(TranscodeCancelled):
+            running.result(timeout=5)
+        self.assertTrue(queued.cancelled())
+        self.assertLess(time.monotonic() - start, 4)
+
+class TestStreamCopy(unittest.TestCase):
+    def test_can_stream_copy(self):
+        self.assertTrue(can_stream_copy('m4a', 'mp4a.40.2'))
+        self.assertTrue(can_stream_copy('opus', 'opus'))
+        self.assertTrue(can_stream_copy('m4a', 'fLaC'))
+        self.assertFalse(can_stream_copy('mp3', 'mp4a.40.2'))
+        self.assertFalse(can_stream_copy('m4a', None))
+        self.assertFalse(can_stream_copy('wav', 'pcm_s16le'))
+
+    def test_transcode_command(self):
+        scheduler = mock.Mock()
+        media = MediaProcessor('ffmpeg', scheduler)
+        with mock.patch.object(media, 'probe', return_value={'version': '6.0', 'encoders': {'libmp3lame'}}):
+            media.transcode('in.m4a', 'out.m4a', 'm4a', copy=True)
+            media.transcode('in.m4a', 'out.mp3', 'mp3')
+            with self.assertRaises(RuntimeError):
+                media.transcode('in.webm', 'out.opus', 'opus')
+
+        remux, encode = (call.args[0] for call in scheduler.submit.call_args_list)
+        self.assertIn('copy', remux)
+        self.assertIn('+faststart', remux)
+        self.assertIn('libmp3lame', encode)
+        self.assertEqual(encode[encode.index('-q:a') + 1], '0')
+
+    def test_tags_and_cover_written_in_one_pass(self):
+        scheduler = mock.Mock()
+        media = MediaProcessor('ffmpeg', scheduler)
+        metadata = {'title': '标题', 'artist': 'UP', 'album': '', 'date': '2024-01-02'}
+        with mock.patch.object(media, 'probe', return_value={'version': '6.0', 'encoders': set()}):
+            media.transcode('in.m4a', 'out.mp3', 'mp3', copy=True, metadata=metadata, cover_path='cover.jpg')
+            media.transcode('in.webm', 'out.opus', 'opus', copy=True, metadata=metadata, cover_path='cover.jpg')
+
+        mp3, opus = (call.args[0] for call in scheduler.submit.call_args_list)
+        self.assertEqual(mp3[mp3.index('cover.jpg') - 1], '-i')
+        self.assertIn('attached_pic', mp3)
+        self.assertNotIn('-vn', mp3)
+        self.assertIn('title=标题', mp3)
+        self.assertNotIn('album=', mp3)
+        self.assertEqual(mp3[mp3.index('-id3v2_version') + 1], '3')
+        self.assertNotIn('cover.jpg', opus)
+        self.assertIn('artist=UP', opus)
+
+if __name__ == '__main__':
+    unittest.main()
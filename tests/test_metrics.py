@@ -0,0 +1,64 @@
+import threading
+import unittest
+from src.utils.metrics import MetricsRegistry, StageTimer, span
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('stage_seconds', '耗时', ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, stage='download')
+        histogram.observe(0.5, stage='download')
+        histogram.observe(5, stage='download')
+        text = registry.render()
+
+        self.assertIn('# TYPE stage_seconds histogram', text)
+        self.assertIn('stage_seconds_bucket{stage="download",le="0.1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="download",le="1.0"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="download",le="+Inf"} 3', text)
+        self.assertIn('stage_seconds_count{stage="download"} 3', text)
+
+    def test_counter_and_collector(self):
+        registry = MetricsRegistry()
+        registry.counter('parts_total', '结果数', ('status',)).inc(status='success')
+        registry.counter('parts_total', '结果数', ('status',)).inc(2, status='success')
+        registry.register_collector(lambda: {'queue_depth': ('队列深度', 4)})
+        text = registry.render()
+
+        self.assertIn('parts_total{status="success"} 3', text)
+        self.assertIn('# TYPE queue_depth gauge\nqueue_depth 4', text)
+        with self.assertRaises(ValueError):
+            registry.histogram('parts_total', '类型冲突')
+
+    def test_stage_timer_breakdown(self):
+        registry = MetricsRegistry()
+        timer = StageTimer(registry)
+        with timer.span('download'):
+            pass
+        with self.assertRaises(RuntimeError):
+            with timer.span('transcode'):
+                raise RuntimeError('ffmpeg')
+        timer.record('resolve', 0.5)
+
+        breakdown = timer.breakdown()
+        # 按处理顺序排列
+        self.assertEqual(list(breakdown), ['resolve', 'download', 'transcode'])
+        self.assertEqual(breakdown['transcode']['errors'], 1)
+        self.assertEqual(breakdown['resolve']['avg'], 0.5)
+        self.assertEqual(registry.metrics['bili_stage_errors_total'].value(stage='transcode'), 1)
+
+    def test_module_span_uses_bound_timer(self):
+        registry = MetricsRegistry()
+        timer = StageTimer(registry)
+
+        def worker():
+            timer.bind()
+            with span('cover_process'):
+                pass
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(timer.breakdown()['cover_process']['count'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import threading
+import unittest
+from src.utils.pipeline import PipelineStage
+
+class TestPipelineStage(unittest.TestCase):
+    def test_processes_items_and_reports_stats(self):
+        seen = []
+        stage = PipelineStage('test', lambda item: seen.append(item) if item >= 0 else 1 / 0,
+                              workers=2, max_queue=2)
+        for item in (1, 2, -1, 3):
+            stage.submit(item)
+        stage.join()
+
+        self.assertEqual(sorted(seen), [1, 2, 3])
+        stats = stage.stats()
+        self.assertEqual((stats['queue_depth'], stats['completed'], stats['failed']), (0, 3, 1))
+        with self.assertRaises(RuntimeError):
+            stage.submit(4)
+
+    def test_bounded_queue_applies_backpressure(self):
+        release = threading.Event()
+        stage = PipelineStage('test', lambda item: release.wait(), workers=1, max_queue=1)
+        stage.submit(1)
+        stage.submit(2)
+        blocked = threading.Thread(target=stage.submit, args=(3,))
+        blocked.start()
+        blocked.join(0.1)
+
+        self.assertTrue(blocked.is_alive())
+        release.set()
+        blocked.join()
+        stage.join()
+        self.assertEqual(stage.stats()['completed'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
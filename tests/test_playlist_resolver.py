@@ -0,0 +1,54 @@
+import json
+import unittest
+from urllib.parse import urlparse, parse_qs
+from src.utils.http_client import HttpClient
+from src.utils.playlist_resolver import PlaylistResolver
+from tests.http_fixtures import StubHandler, start_server
+
+VIEW_DATA = {
+    'bvid': 'BV1xx411c7mD',
+    'title': '有声书',
+    'pic': 'http://i0.hdslb.com/cover.jpg',
+    'owner': {'name': 'UP'},
+    'pubdate': 1700000000,
+    'pages': [
+        {'cid': 12, 'page': 2, 'part': '第二章', 'duration': 600},
+        {'cid': 11, 'page': 1, 'part': '第一章', 'duration': 500},
+    ],
+}
+
+class ViewHandler(StubHandler):
+    def respond(self):
+        url = urlparse(self.path)
+        if url.path == '/x/web-interface/view' and parse_qs(url.query).get('bvid') == ['BV1xx411c7mD']:
+            body = {'code': 0, 'message': '0', 'data': VIEW_DATA}
+        else:
+            body = {'code': -404, 'message': '啥都木有'}
+        self.send(200, json.dumps(body).encode('utf-8'), {'Content-Type': 'application/json'})
+
+class TestPlaylistResolver(unittest.TestCase):
+    def setUp(self):
+        self.server = start_server(self, ViewHandler)
+        http = HttpClient({}, retries=0)
+        self.addCleanup(http.close)
+        self.resolver = PlaylistResolver(http, api_base=self.server.url, ttl=60)
+
+    def test_resolve_returns_all_parts_in_order(self):
+        playlist = self.resolver.resolve('BV1xx411c7mD')
+
+        self.assertEqual(playlist['title'], '有声书')
+        self.assertEqual(playlist['uploader'], 'UP')
+        self.assertEqual([(part['p'], part['cid'], part['title'], part['duration']) for part in playlist['parts']],
+                         [(1, 11, '第一章', 500), (2, 12, '第二章', 600)])
+
+    def test_resolve_is_cached(self):
+        self.resolver.resolve('BV1xx411c7mD')
+        self.resolver.resolve('BV1xx411c7mD')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_api_error_raises(self):
+        with self.assertRaises(RuntimeError):
+            self.resolver.resolve('BV1NotFound')
+
+if __name__ == '__main__':
+    unittest.main()
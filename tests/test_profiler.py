@@ -0,0 +1,50 @@
+import os
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from src.utils.profiler import TaskProfiler, list_profiles, profile_info
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+class TestTaskProfiler(unittest.TestCase):
+    def test_writes_cpu_and_memory_artifacts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = os.path.join(tmp, 'a' * 32 + '.profile')
+            profiler = TaskProfiler(out_dir, interval=0.005, memory=True, top=10)
+            stop = threading.Event()
+            worker = threading.Thread(target=busy_loop, args=(stop,), name='part-BV1-0')
+            profiler.start()
+            worker.start()
+            blob = [bytearray(1024) for _ in range(200)]
+            time.sleep(0.2)
+            stop.set()
+            worker.join()
+            summary = profiler.stop()
+
+            self.assertGreater(summary['samples'], 5)
+            self.assertFalse(tracemalloc.is_tracing())
+            with open(os.path.join(out_dir, 'cpu.folded'), encoding='utf-8') as f:
+                folded = f.read()
+            # 同一线程池的线程按去掉序号后的名称合并
+            self.assertIn('part-BV1;', folded)
+            self.assertIn('busy_loop', folded)
+            with open(os.path.join(out_dir, 'cpu_top.txt'), encoding='utf-8') as f:
+                self.assertIn('busy_loop', f.read())
+            with open(os.path.join(out_dir, 'memory_top.txt'), encoding='utf-8') as f:
+                self.assertIn('test_profiler.py', f.read())
+            with open(os.path.join(out_dir, 'summary.json'), encoding='utf-8') as f:
+                self.assertIn('traced_peak_mb', json.load(f))
+            del blob
+
+            info = profile_info(tmp, 'a' * 32)
+            self.assertIn('memory.snapshot', info['files'])
+            self.assertEqual([p['task_id'] for p in list_profiles(tmp)], ['a' * 32])
+            self.assertIsNone(profile_info(tmp, 'b' * 32))
+
+if __name__ == '__main__':
+    unittest.main()
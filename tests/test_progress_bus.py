@@ -0,0 +1,52 @@
+import time
+import unittest
+from src.utils.downloader import _TaskContext
+from src.utils.progress_bus import ProgressBus
+
+class TestProgressBus(unittest.TestCase):
+    def test_throttles_and_coalesces(self):
+        bus = ProgressBus(2, max_rate=10)
+        bus.update(1, downloaded=100, total=1000)
+        bus.update(1, downloaded=500, total=1000, speed=250.0)
+        first = bus.poll()
+        self.assertEqual(first['parts'][0]['downloaded_bytes'], 500)
+        self.assertEqual(first['parts'][0]['eta'], 2.0)
+        self.assertAlmostEqual(first['progress'], 0.5 * 0.8 / 2 * 100)
+
+        bus.update(1, downloaded=600, total=1000)
+        bus.update(2, downloaded=10, total=1000)
+        self.assertIsNone(bus.poll())  # 节流间隔内
+        self.assertGreater(bus.next_due(), 0)
+        time.sleep(0.11)
+        second = bus.poll()
+        self.assertEqual([part['p'] for part in second['parts']], [1, 2])
+        self.assertIsNone(bus.poll())  # 没有新状态
+
+    def test_stages_and_completion(self):
+        bus = ProgressBus(2, max_rate=0)
+        bus.update(1, 'transcode', fraction=0.5)
+        self.assertAlmostEqual(bus.overall(), (0.8 + 0.1) / 2 * 100)
+        bus.part_done(1)
+        bus.update(2, downloaded=1, total=2)
+        bus.part_reset(2)
+        self.assertEqual(bus.overall(), 50)
+        bus.part_done(2)
+        self.assertEqual(bus.overall(), 100)
+        self.assertIsNone(bus.poll())
+
+    def test_yt_dlp_hook_reports_current_part(self):
+        task = _TaskContext('BV1xx411c7mD', 'test', '.', False, [{'p': 1}, {'p': 2}], {})
+        task.progress = ProgressBus(2, max_rate=0)
+        task.progress_hook({'status': 'downloading', 'downloaded_bytes': 10})  # 未开始任何分 P
+        self.assertIsNone(task.progress.poll())
+
+        task.begin_part(2)
+        task.progress_hook({'status': 'downloading', 'downloaded_bytes': 10,
+                            'total_bytes_estimate': 40, 'speed': 5.0, 'eta': 6})
+        event = task.progress.poll()
+        self.assertEqual(event['parts'][0]['p'], 2)
+        self.assertEqual(event['parts'][0]['fraction'], 0.25)
+        self.assertEqual(event['speed'], 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import re
+import tempfile
+import unittest
+from src.utils.http_client import HttpClient
+from src.utils.range_downloader import RangeDownloader
+from tests.http_fixtures import StubHandler, start_server
+
+PAYLOAD = os.urandom(100 * 1024 + 17)
+RANGE = re.compile(r'bytes=(\d+)-(\d+)')
+
+class RangeHandler(StubHandler):
+    def respond(self):
+        match = RANGE.match(self.headers.get('Range', ''))
+        if not (match and self.server.supports_range):
+            self.send(200, PAYLOAD)
+            return
+        start, end = int(match.group(1)), int(match.group(2))
+        if start in self.server.fail_offsets:
+            self.send(500)
+            return
+        body = PAYLOAD[start:end + 1]
+        self.send(206, body, {'Content-Range': f'bytes {start}-{start + len(body) - 1}/{len(PAYLOAD)}'})
+
+class TestRangeDownloader(unittest.TestCase):
+    def setUp(self):
+        # fail_offsets：从这些偏移开始的分段请求返回 500
+        self.server = start_server(self, RangeHandler, supports_range=True, fail_offsets=set())
+        self.url = f'{self.server.url}/audio.m4a'
+        http = HttpClient({}, retries=0)
+        self.addCleanup(http.close)
+        self.downloader = RangeDownloader(http, segment_size=16 * 1024, connections=4, retries=0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'audio.m4a')
+
+    def ranges_seen(self):
+        matches = (RANGE.match(headers.get('Range', '')) for _, headers, _ in self.server.requests)
+        return [int(match.group(1)) for match in matches if match]
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_parallel_segments(self):
+        progress = []
+        self.downloader.download(self.url, self.path, progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertEqual(sorted(set(self.ranges_seen()) - {0}), list(range(16 * 1024, len(PAYLOAD), 16 * 1024)))
+        self.assertEqual(progress[-1], (len(PAYLOAD), len(PAYLOAD)))
+        self.assertEqual(os.listdir(self.tmp.name), ['audio.m4a'])
+
+    def test_resume_from_segment_state(self):
+        self.server.fail_offsets = {32 * 1024}
+        with self.assertRaises(RuntimeError):
+            self.downloader.download(self.url, self.path)
+        self.assertTrue(os.path.exists(f'{self.path}.part.segments'))
+
+        self.server.fail_offsets = set()
+        self.server.requests.clear()
+        self.downloader.download(self.url, self.path)
+
+        self.assertEqual(self.read(), PAYLOAD)
+        # 第二次只请求探测和未完成的分段
+        self.assertIn(32 * 1024, self.ranges_seen())
+        self.assertLess(len(self.ranges_seen()), 8)
+
+    def test_falls_back_without_range_support(self):
+        self.server.supports_range = False
+        self.downloader.download(self.url, self.path)
+        self.assertEqual(self.read(), PAYLOAD)
+
+    def test_single_stream_stops_when_cancelled(self):
+        self.server.supports_range = False
+        progress = []
+        with self.assertRaisesRegex(RuntimeError, '任务已取消'):
+            self.downloader.download(self.url, self.path, progress=lambda done, total: progress.append(done),
+                                     cancelled=lambda: True)
+        self.assertEqual(progress, [])
+        self.assertFalse(os.path.exists(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import subprocess
+import unittest
+import requests
+from src.utils.retry_policy import RetryPolicy, RetryScheduler, classify_error
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_classify_error(self):
+        response = requests.Response()
+        response.status_code = 412
+        cases = [
+            (requests.HTTPError(response=response), 'rate_limit'),
+            (RuntimeError('ERROR: [BiliBili] BV1xx: Unable to download JSON metadata: HTTP Error 412: Precondition Failed'),
+             'rate_limit'),
+            (requests.ConnectionError('reset'), 'network'),
+            (RuntimeError('ERROR: The read operation timed out'), 'network'),
+            (RuntimeError('音频转换失败：Invalid data found'), 'ffmpeg'),
+            (subprocess.CalledProcessError(1, ['ffmpeg']), 'ffmpeg'),
+            (ValueError('无效的哔哩哔哩链接'), 'other'),
+        ]
+        for error, expected in cases:
+            with self.subTest(error=error):
+                self.assertEqual(classify_error(error), expected)
+
+    def test_backoff_with_jitter(self):
+        policy = RetryPolicy(5, 2, 10)
+        for attempt, ceiling in ((1, 2), (2, 4), (3, 8), (4, 10)):
+            delay = policy.delay(attempt)
+            self.assertTrue(ceiling / 2 <= delay <= ceiling, (attempt, delay))
+
+    def test_budgets_per_part_and_class(self):
+        scheduler = RetryScheduler({
+            'rate_limit': RetryPolicy(1, 5, 5, pause_all=True),
+            'network': RetryPolicy(1, 0, 0),
+            'ffmpeg': RetryPolicy(0, 0, 0),
+            'other': RetryPolicy(0, 0, 0),
+        })
+        self.assertIsNotNone(scheduler.record_failure(1, ConnectionError('reset')))
+        self.assertIsNone(scheduler.record_failure(1, ConnectionError('reset')))
+        # 其他分 P 的预算不受影响
+        self.assertIsNotNone(scheduler.record_failure(2, ConnectionError('reset')))
+        self.assertEqual(scheduler.hold_remaining(), 0)
+
+        self.assertIsNotNone(scheduler.record_failure(3, RuntimeError('HTTP Error 429: Too Many Requests')))
+        self.assertGreater(scheduler.hold_remaining(), 2)
+
+        snapshot = scheduler.snapshot()
+        self.assertTrue(snapshot['1']['exhausted'])
+        self.assertEqual(snapshot['3']['error_class'], 'rate_limit')
+
+if __name__ == '__main__':
+    unittest.main()
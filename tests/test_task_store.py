@@ -0,0 +1,54 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+from src.utils.task_store import TaskStore
+
+class TestTaskStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = TaskStore(os.path.join(self.tmp.name, 'tasks.db'))
+
+    def test_update_single_task(self):
+        self.store.upsert({'task_id': 'a', 'bvid': 'BV1', 'output_dir': 'x', 'rename': True})
+        self.assertTrue(self.store.update('a', 'success', 50))
+        self.assertFalse(self.store.update('missing', 'success'))
+
+        task = self.store.get('a')
+        self.assertEqual((task['status'], task['progress'], task['rename']), ('success', 50, True))
+        self.assertEqual(self.store.latest()['task_id'], 'a')
+
+        self.store.update('a', 'completed')
+        self.assertEqual(self.store.list_tasks(exclude_status='completed'), [])
+
+    def test_concurrent_writers(self):
+        for i in range(4):
+            self.store.upsert({'task_id': str(i), 'bvid': 'BV1', 'output_dir': str(i)})
+
+        def worker(task_id):
+            for progress in range(50):
+                self.store.update(task_id, 'running', progress)
+
+        threads = [threading.Thread(target=worker, args=(str(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([task['progress'] for task in self.store.list_tasks()], [49] * 4)
+
+    def test_import_legacy_json(self):
+        json_path = os.path.join(self.tmp.name, 'download_history.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({'tasks': [{'task_id': 'BV1_x', 'bvid': 'BV1', 'output_dir': 'x', 'rename': False,
+                                  'status': 'error', 'progress': 10, 'last_update': '2025-01-01T00:00:00'}]}, f)
+
+        self.store.import_json(json_path)
+
+        self.assertEqual(self.store.get('BV1_x')['status'], 'error')
+        self.assertFalse(os.path.exists(json_path))
+
+if __name__ == '__main__':
+    unittest.main()